@@ -10,16 +10,1222 @@ Also extracts structured knowledge graph tags from each entry.
 
 import os
 import json
-import google.generativeai as genai
+import hashlib
+import heapq
+import itertools
+import random
+import sqlite3
+import threading
+import time
+import asyncio
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple, Protocol
+
+from google.generativeai.types import generation_types
+from google.ai import generativelanguage as glm
+from google.api_core import exceptions as google_exceptions
 from dotenv import load_dotenv
 
+import context_builder
+import memories_db as db
+import tag_parser
+
 load_dotenv()
 
 # ── Model setup ───────────────────────────────────────────────────────────────
 
-def _get_model(api_key: str):
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel("gemini-2.0-flash")
+MODEL_NAME = "gemini-2.0-flash"
+MAX_CACHED_CLIENTS = 16
+
+
+def _generative_client(api_key: str) -> glm.GenerativeServiceClient:
+    return glm.GenerativeServiceClient(client_options={"api_key": api_key})
+
+
+def _cache_client(api_key: str) -> glm.CacheServiceClient:
+    return glm.CacheServiceClient(client_options={"api_key": api_key})
+
+
+class ClientRegistry:
+    """
+    Process-wide cache of Gemini service clients, one per API key.
+    `genai.configure()` is global and drops its clients on every call, which
+    both rebuilt the transport per request and let concurrent sessions with
+    different keys overwrite each other's configuration. Here each key gets its
+    own long-lived client, so its connection stays open across calls.
+    The client factories can be swapped for local stubs of the API.
+    """
+
+    def __init__(
+        self,
+        max_clients: int = MAX_CACHED_CLIENTS,
+        client_factory=_generative_client,
+        cache_client_factory=_cache_client,
+    ):
+        self.max_clients = max_clients
+        self.client_factory = client_factory
+        self.cache_client_factory = cache_client_factory
+        self._lock = threading.Lock()
+        self._clients: OrderedDict[str, glm.GenerativeServiceClient] = OrderedDict()
+        self._cache_clients: dict[str, glm.CacheServiceClient] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key_id(api_key: str) -> str:
+        # Keys are only ever held in memory; ids keep them out of stats and logs.
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+    def client(self, api_key: str) -> glm.GenerativeServiceClient:
+        """The key's client for the generateContent API."""
+        key_id = self._key_id(api_key)
+        with self._lock:
+            client = self._clients.get(key_id)
+            if client is not None:
+                self.hits += 1
+                self._clients.move_to_end(key_id)
+                return client
+            self.misses += 1
+            client = self._clients[key_id] = self.client_factory(api_key)
+            if len(self._clients) > self.max_clients:
+                evicted, _ = self._clients.popitem(last=False)
+                self._cache_clients.pop(evicted, None)
+            return client
+
+    def cache_client(self, api_key: str) -> glm.CacheServiceClient:
+        """The key's client for the cachedContents API (context caching)."""
+        key_id = self._key_id(api_key)
+        with self._lock:
+            client = self._cache_clients.get(key_id)
+            if client is None:
+                client = self._cache_clients[key_id] = self.cache_client_factory(api_key)
+            return client
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "clients": len(self._clients),
+            }
+
+
+client_registry = ClientRegistry()
+
+
+def _generate(
+    api_key: str,
+    contents: list[dict],
+    generation_config: dict | None = None,
+    cached_content: str | None = None,
+    stream: bool = False,
+) -> generation_types.GenerateContentResponse:
+    """
+    One generateContent call on the key's client. The request is built here
+    rather than through genai.GenerativeModel, which has no public way to use
+    a given client and only looks cached contents up through the global one.
+    """
+    request = glm.GenerateContentRequest(
+        model=f"models/{MODEL_NAME}",
+        contents=contents,
+        generation_config=generation_types.to_generation_config_dict(generation_config or {}),
+        cached_content=cached_content,
+    )
+    client = client_registry.client(api_key)
+    if stream:
+        return generation_types.GenerateContentResponse.from_iterator(client.stream_generate_content(request))
+    return generation_types.GenerateContentResponse.from_response(client.generate_content(request))
+
+
+# ── Model backends ────────────────────────────────────────────────────────────
+# Every model call goes through the active backend. GeminiBackend is the real
+# API; fake_backend.py provides a local stand-in (in-process or over HTTP) for
+# offline development and load testing. Select one with AI_BACKEND:
+#   gemini (default) | fake | http://host:port  (a `python fake_backend.py serve`)
+
+class ModelBackend(Protocol):
+    """
+    What ai_engine needs from a model. Responses only need a `.text`; a
+    streamed response is an iterable of such chunks (a chunk's `.text` may
+    raise ValueError for chunks that carry no text, as Gemini's do).
+    """
+
+    name: str
+    # Whether `cached_content` names from ContextCache can be passed to chat().
+    supports_context_cache: bool
+
+    def chat(
+        self,
+        mode: str,
+        api_key: str,
+        history: list[dict],
+        text: str,
+        stream: bool = False,
+        cached_content: str | None = None,
+    ): ...
+
+    def generate(self, mode: str, api_key: str, prompt: str, generation_config: dict | None = None): ...
+
+
+class GeminiBackend:
+    """The Gemini API, through client_registry's per-key clients."""
+
+    name = "gemini"
+    supports_context_cache = True
+
+    def chat(self, mode, api_key, history, text, stream=False, cached_content=None):
+        contents = [*history, {"role": "user", "parts": [{"text": text}]}]
+        return _generate(api_key, contents, cached_content=cached_content, stream=stream)
+
+    def generate(self, mode, api_key, prompt, generation_config=None):
+        return _generate(api_key, [{"role": "user", "parts": [{"text": prompt}]}], generation_config)
+
+
+def _backend_from_env() -> ModelBackend:
+    choice = os.getenv("AI_BACKEND", "gemini").strip()
+    if choice in ("", "gemini"):
+        return GeminiBackend()
+    import fake_backend  # only needed off the real API
+
+    if choice == "fake":
+        return fake_backend.FakeBackend(fake_backend.FakeConfig.from_env())
+    if choice.startswith(("http://", "https://")):
+        return fake_backend.HttpBackend(choice)
+    raise ValueError(f"unknown AI_BACKEND {choice!r} (expected gemini, fake or an http:// URL)")
+
+
+backend: ModelBackend = _backend_from_env()
+
+
+def set_backend(new_backend: ModelBackend) -> ModelBackend:
+    """Route all model calls to `new_backend`. Returns the previous backend."""
+    global backend
+    previous, backend = backend, new_backend
+    return previous
+
+
+# ── Context caching ───────────────────────────────────────────────────────────
+# The stable head of a prompt (system prompt, profile, knowledge snapshot) is
+# uploaded once as Gemini cached content and referenced by name until it
+# changes, so repeated turns don't resend (or pay full price for) it. The API
+# only caches prompts above a minimum size; smaller prefixes are sent inline.
+
+CONTEXT_CACHE_ENABLED = os.getenv("AI_CONTEXT_CACHE", "1") != "0"
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("AI_CONTEXT_CACHE_MIN_TOKENS", "4096"))
+# Larger knowledge snapshots are never put in a prompt whole (see knowledge_text()).
+CONTEXT_CACHE_MAX_TOKENS = int(os.getenv("AI_CONTEXT_CACHE_MAX_TOKENS", "32000"))
+CONTEXT_CACHE_TTL_SECONDS = 3600
+# Handles this close to expiry are replaced rather than reused.
+CONTEXT_CACHE_EXPIRY_MARGIN_SECONDS = 60
+# After a failed upload, the same prefix is sent inline for a while.
+CONTEXT_CACHE_RETRY_SECONDS = 600
+
+
+class ContextCache:
+    """
+    Cached-content handles per API key and mode, keyed by a hash of the prefix.
+    A new prefix (profile or knowledge changed) replaces the mode's handle and
+    the old one is deleted server-side. Requests only reference handles that
+    are already live (lookup()); uploads happen off the request path (warm()).
+    """
+
+    def __init__(self, registry: ClientRegistry, enabled: bool, min_tokens: int, ttl_seconds: int):
+        self.registry = registry
+        self.enabled = enabled
+        self.min_tokens = min_tokens
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # (key id, mode) -> (prefix digest, cached content name, expires at)
+        self._handles: dict[tuple[str, str], tuple[str, str, float]] = {}
+        self._failed: dict[tuple[str, str], float] = {}
+        self._uploading: set[tuple[str, str]] = set()
+        self._stats = {"hits": 0, "created": 0, "failed": 0, "inline": 0}
+
+    def _cacheable(self, prefix: str) -> bool:
+        return self.enabled and context_builder.estimate_tokens(prefix) >= self.min_tokens
+
+    def _slot(self, api_key: str, mode: str, prefix: str) -> tuple[tuple[str, str], str]:
+        return (client_registry._key_id(api_key), mode), hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+
+    def _live(self, slot: tuple[str, str], digest: str, now: float) -> str | None:
+        # Caller holds self._lock.
+        current = self._handles.get(slot)
+        if current and current[0] == digest and current[2] - now > CONTEXT_CACHE_EXPIRY_MARGIN_SECONDS:
+            return current[1]
+        return None
+
+    def lookup(self, api_key: str, mode: str, prefix: str) -> str | None:
+        """Name of a live cached content holding `prefix`, or None to send it inline. Never uploads."""
+        name = None
+        if self._cacheable(prefix):
+            slot, digest = self._slot(api_key, mode, prefix)
+            with self._lock:
+                name = self._live(slot, digest, time.time())
+        with self._lock:
+            self._stats["hits" if name else "inline"] += 1
+        return name
+
+    def warm(self, api_key: str, mode: str, prefix: str) -> bool:
+        """
+        Whether `prefix` is cached and live now. If it isn't, it is uploaded on
+        the AI pool (unless an upload is under way or failed recently), so the
+        caller never waits on the cachedContents API.
+        """
+        if not self._cacheable(prefix):
+            return False
+        slot, digest = self._slot(api_key, mode, prefix)
+        now = time.time()
+        with self._lock:
+            if self._live(slot, digest, now):
+                return True
+            if self._failed.get((slot[0], digest), 0) > now or (slot[0], digest) in self._uploading:
+                return False
+            self._uploading.add((slot[0], digest))
+        submit(self._upload, api_key, mode, prefix)
+        return False
+
+    def _upload(self, api_key: str, mode: str, prefix: str):
+        slot, digest = self._slot(api_key, mode, prefix)
+        try:
+            self.handle(api_key, mode, prefix)
+        finally:
+            with self._lock:
+                self._uploading.discard((slot[0], digest))
+
+    def handle(self, api_key: str, mode: str, prefix: str) -> str | None:
+        """
+        Name of a cached content holding `prefix`, uploading it if needed
+        (blocking), or None to send it inline.
+        """
+        if not self._cacheable(prefix):
+            with self._lock:
+                self._stats["inline"] += 1
+            return None
+        slot, digest = self._slot(api_key, mode, prefix)
+        now = time.time()
+        with self._lock:
+            name = self._live(slot, digest, now)
+            if name:
+                self._stats["hits"] += 1
+                return name
+            if self._failed.get((slot[0], digest), 0) > now:
+                self._stats["inline"] += 1
+                return None
+
+        client = self.registry.cache_client(api_key)
+        request = glm.CreateCachedContentRequest(
+            cached_content=glm.CachedContent(
+                model=f"models/{MODEL_NAME}",
+                display_name=f"ai-of-memories-{mode}",
+                system_instruction={"parts": [{"text": prefix}]},
+                ttl=timedelta(seconds=self.ttl_seconds),
+            )
+        )
+        try:
+            name = client.create_cached_content(request).name
+        except google_exceptions.GoogleAPIError:
+            with self._lock:
+                self._failed[(slot[0], digest)] = now + CONTEXT_CACHE_RETRY_SECONDS
+                self._stats["failed"] += 1
+            return None
+
+        with self._lock:
+            old = self._handles.get(slot)
+            self._handles[slot] = (digest, name, now + self.ttl_seconds)
+            self._stats["created"] += 1
+        if old and old[0] != digest:
+            submit(self._delete, client, old[1])
+        return name
+
+    def invalidate(self, api_key: str, mode: str):
+        """Forget the mode's handle (e.g. the server says it no longer exists)."""
+        with self._lock:
+            self._handles.pop((client_registry._key_id(api_key), mode), None)
+
+    def _delete(self, client, name: str):
+        try:
+            client.delete_cached_content(glm.DeleteCachedContentRequest(name=name))
+        except google_exceptions.GoogleAPIError:
+            pass  # it expires on its own
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "handles": len(self._handles)}
+
+
+context_cache = ContextCache(
+    client_registry, CONTEXT_CACHE_ENABLED, CONTEXT_CACHE_MIN_TOKENS, CONTEXT_CACHE_TTL_SECONDS
+)
+
+
+# ── Response cache ────────────────────────────────────────────────────────────
+# Streamlit reruns, retries and repeated questions often send byte-identical
+# prompts. Responses are cached on disk, keyed by a fingerprint of everything
+# that shapes the answer, with a per-mode TTL and least-recently-used eviction.
+
+CACHE_PATH = Path(os.getenv("AI_CACHE_PATH", Path(__file__).parent / "ai_cache.db"))
+CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "5000"))
+CACHE_MODES = {
+    m.strip() for m in os.getenv("AI_CACHE_MODES", "journaling,past_self,extraction").split(",") if m.strip()
+}
+CACHE_TTL_SECONDS = {
+    "journaling": 24 * 3600,
+    "past_self": 24 * 3600,
+    "extraction": 30 * 24 * 3600,
+}
+
+
+def prompt_fingerprint(model_name: str, system: str, history: list[dict], user_input: str) -> str:
+    """Stable hash of a request: model, system prompt, chat history and input."""
+    payload = json.dumps(
+        [model_name, system, history, user_input], ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed response cache with TTL, LRU size limit and hit/miss counters."""
+
+    def __init__(self, path: Path, max_entries: int, modes: set[str], ttls: dict[str, int]):
+        self.path = path
+        self.max_entries = max_entries
+        self.modes = modes
+        self.ttls = ttls
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._stats: dict[str, dict[str, int]] = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # One shared connection; every use holds self._lock.
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript("""
+                PRAGMA journal_mode = WAL;
+                PRAGMA synchronous = NORMAL;
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    mode TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access);
+            """)
+        return self._conn
+
+    def enabled(self, mode: str) -> bool:
+        return mode in self.modes and self.max_entries > 0
+
+    def _count(self, mode: str, outcome: str):
+        counts = self._stats.setdefault(mode, {"hits": 0, "misses": 0})
+        counts[outcome] += 1
+
+    def get(self, mode: str, key: str) -> str | None:
+        if not self.enabled(mode):
+            return None
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT response FROM responses WHERE key = ? AND created_at > ?",
+                    (key, now - self.ttls.get(mode, 0))
+                ).fetchone()
+                if row is not None:
+                    with conn:
+                        conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            except sqlite3.Error:
+                row = None  # a broken cache must never break a request
+            self._count(mode, "misses" if row is None else "hits")
+            return None if row is None else row[0]
+
+    def put(self, mode: str, key: str, response: str):
+        if not self.enabled(mode):
+            return
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connection()
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO responses (key, mode, response, created_at, last_access) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (key, mode, response, now, now)
+                    )
+                    count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                    if count > self.max_entries:
+                        # Evict down to 90% so this doesn't run on every insert.
+                        conn.execute(
+                            "DELETE FROM responses WHERE key IN ("
+                            "SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                            (count - int(self.max_entries * 0.9),)
+                        )
+            except sqlite3.Error:
+                pass
+
+    def delete(self, mode: str, key: str):
+        """Drop one cached response (e.g. one that can no longer be read)."""
+        if not self.enabled(mode):
+            return
+        with self._lock:
+            try:
+                conn = self._connection()
+                with conn:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """Hits and misses per mode since the process started."""
+        with self._lock:
+            return {mode: dict(counts) for mode, counts in self._stats.items()}
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM responses")
+
+
+response_cache = ResponseCache(CACHE_PATH, CACHE_MAX_ENTRIES, CACHE_MODES, CACHE_TTL_SECONDS)
+
+
+def _to_gemini_history(conversation_history: list[dict]) -> list[dict]:
+    return [
+        {"role": msg["role"], "parts": [{"text": msg["content"]}]}
+        for msg in conversation_history
+    ]
+
+
+class Prompt(NamedTuple):
+    """A chat turn: stable prefix (cacheable), per-turn system context, history and input."""
+    prefix: str
+    system: str
+    history: list[dict]
+    user_input: str
+
+
+# A cached content that expired or was deleted behind our back. Other errors
+# (a revoked key, quota) would fail the inline re-send just the same.
+_STALE_CACHE_ERRORS = (
+    google_exceptions.NotFound,
+    google_exceptions.FailedPrecondition,
+)
+
+
+def _send(mode: str, api_key: str, prompt: Prompt, stream: bool = False):
+    """
+    Send a prompt through the scheduler, referencing its prefix as cached
+    content when a live one holds it (see knowledge_text()). Other prefixes
+    change with the message, so they are sent inline rather than uploaded.
+    """
+    model = backend
+    tokens = sum(_cached_tokens(part) for part in _prompt_parts(prompt))
+    cached_content = None
+    if prompt.prefix and model.supports_context_cache:
+        cached_content = context_cache.lookup(api_key, mode, prompt.prefix)
+    if cached_content:
+        text = f"{prompt.system.strip()}\n\n---\n{prompt.user_input}" if prompt.system.strip() else prompt.user_input
+        try:
+            return scheduler.call(
+                mode, tokens, lambda: model.chat(mode, api_key, prompt.history, text, stream, cached_content), stream
+            )
+        except _STALE_CACHE_ERRORS:
+            context_cache.invalidate(api_key, mode)
+    text = f"{prompt.prefix}{prompt.system}\n\n---\n{prompt.user_input}"
+    return scheduler.call(mode, tokens, lambda: model.chat(mode, api_key, prompt.history, text, stream), stream)
+
+
+def _prompt_parts(prompt: Prompt) -> tuple[str, ...]:
+    """Every text a prompt sends, for token estimates."""
+    history = tuple(part["text"] for message in prompt.history for part in message["parts"])
+    return (prompt.prefix, prompt.system, *history, prompt.user_input)
+
+
+def _fingerprint(prompt: Prompt) -> str:
+    # Prefix and system are hashed joined, exactly as they are sent inline.
+    return prompt_fingerprint(MODEL_NAME, prompt.prefix + prompt.system, prompt.history, prompt.user_input)
+
+
+def _chat(mode: str, api_key: str, prompt: Prompt) -> str:
+    """Send one chat turn (prompt context + input on top of its history), through the cache."""
+    key = _fingerprint(prompt)
+    cached = response_cache.get(mode, key)
+    if cached is not None:
+        return cached
+
+    def send() -> str:
+        started, response, text, ok = time.perf_counter(), None, "", False
+        try:
+            response = _send(mode, api_key, prompt)
+            text, ok = response.text, True
+        finally:
+            usage_ledger.record_call(mode, _prompt_parts(prompt), started, response, text, ok)
+        response_cache.put(mode, key, text)
+        return text
+
+    return in_flight.do((mode, key), send)
+
+
+def _chat_stream(mode: str, api_key: str, prompt: Prompt) -> Iterator[str]:
+    """Like _chat(), but yields the reply in chunks as they are generated."""
+    key = _fingerprint(prompt)
+    cached = response_cache.get(mode, key)
+    if cached is not None:
+        yield cached
+        return
+    flight = (mode, key)
+    pending = in_flight.join(flight)
+    if pending is not None:
+        # The same prompt is already streaming (e.g. a double submit): wait for
+        # its whole reply rather than paying for it twice.
+        text = pending.result()
+        if text is not None:
+            yield text
+            return
+        flight = None  # it was abandoned; send our own
+    started, response, parts, ok = time.perf_counter(), None, [], True
+    try:
+        response = _send(mode, api_key, prompt, stream=True)
+        for chunk in response:
+            # Chunks without text parts (e.g. the final usage-only chunk) raise here.
+            try:
+                text = chunk.text
+            except ValueError:
+                continue
+            if text:
+                parts.append(text)
+                yield text
+        if not parts:
+            # A blocked or empty reply: nothing to cache or hand to waiters.
+            raise ValueError("the model returned an empty reply")
+    except BaseException as e:
+        # GeneratorExit: the reader stopped early, which isn't a failed call.
+        ok = not isinstance(e, Exception)
+        if flight:
+            in_flight.finish(flight, error=None if ok else e)
+        raise
+    finally:
+        if isinstance(response, _HeldStream):
+            response.close()  # frees its scheduler slot now if the reader stopped early
+        # Also runs when the reader stops early: the tokens were still spent.
+        usage_ledger.record_call(mode, _prompt_parts(prompt), started, response, "".join(parts), ok)
+    # Only a stream that ran to completion is cached.
+    response_cache.put(mode, key, "".join(parts))
+    if flight:
+        in_flight.finish(flight, "".join(parts))
+
+
+async def _aiter_in_thread(chunks: Iterator[str]) -> AsyncIterator[str]:
+    """Drive a blocking chunk iterator on the AI pool and yield its chunks asynchronously."""
+    loop = asyncio.get_running_loop()
+    done = object()
+    while True:
+        chunk = await loop.run_in_executor(_executor, next, chunks, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+# ── Concurrent execution ──────────────────────────────────────────────────────
+# Independent model calls (e.g. the margin note and tag extraction for the same
+# entry) run side by side on a shared pool, so the user waits for one round trip
+# instead of two. The pool is process-wide and shared by all Streamlit sessions.
+
+MAX_CONCURRENT_CALLS = int(os.getenv("AI_MAX_CONCURRENT_CALLS", "8"))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CALLS, thread_name_prefix="ai-engine")
+
+
+def submit(fn, /, *args, **kwargs) -> Future:
+    """Run `fn(*args, **kwargs)` on the shared AI worker pool."""
+    return _executor.submit(fn, *args, **kwargs)
+
+
+# ── Request scheduling ────────────────────────────────────────────────────────
+# Every model request waits its turn in one process-wide scheduler: a token
+# bucket for requests and one for prompt tokens per minute (set them to the
+# API key's quota; 0 = no limit), and a bounded number of requests in flight.
+# Interactive requests (the reply the user is waiting for) are served before
+# background ones (history compaction, batched extraction), which also leave
+# slots and some of each bucket free for them. Requests answered 429/503 are
+# retried with jittered exponential backoff. Identical prompts already in
+# flight are sent once and the reply shared (see SingleFlight).
+
+MAX_CONCURRENT_REQUESTS = int(os.getenv("AI_MAX_CONCURRENT_REQUESTS", str(MAX_CONCURRENT_CALLS)))
+RATE_LIMIT_RPM = int(os.getenv("AI_RATE_LIMIT_RPM", "0"))
+RATE_LIMIT_TPM = int(os.getenv("AI_RATE_LIMIT_TPM", "0"))
+# Slots and share of each bucket background requests can't use.
+INTERACTIVE_RESERVED_SLOTS = 2
+INTERACTIVE_RESERVED_RATE = 0.2
+RETRY_ATTEMPTS = int(os.getenv("AI_RETRY_ATTEMPTS", "4"))
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 8.0
+
+INTERACTIVE, BACKGROUND = 0, 1
+MODE_PRIORITIES = {"journaling": INTERACTIVE, "past_self": INTERACTIVE, "extraction": INTERACTIVE}
+
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+)
+
+# Set by background() for work no one is waiting on.
+_background: ContextVar[bool] = ContextVar("ai_engine_background", default=False)
+
+
+@contextmanager
+def background():
+    """Run the model requests made inside this block at background priority."""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+def retry_delay(attempt: int) -> float:
+    """Backoff before retry `attempt` (0-based): ~0.5s, 1s, 2s, … capped, half of it jitter."""
+    delay = min(RETRY_BASE_SECONDS * 2 ** attempt, RETRY_MAX_SECONDS)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class TokenBucket:
+    """`per_minute` units refilled continuously; 0 means unlimited. Guarded by the scheduler's lock."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, reserve: float = 0.0) -> float:
+        """
+        Seconds until `amount` can be taken leaving `reserve` (a share of
+        capacity) behind. A request too big to leave the reserve waits for a
+        full bucket instead, so it is never starved for good.
+        """
+        if not self.rate:
+            return 0.0
+        self._refill(time.monotonic())
+        needed = min(min(amount, self.capacity) + reserve * self.capacity, self.capacity)
+        return max(0.0, (needed - self.level) / self.rate)
+
+    def take(self, amount: float):
+        if self.rate:
+            self.level -= min(amount, self.capacity)
+
+
+class _HeldStream:
+    """A streamed response that keeps its scheduler slot until it ends or is closed."""
+
+    def __init__(self, scheduler: "Scheduler", response, chunks: Iterator, first):
+        self._scheduler = scheduler
+        self._response = response
+        self._chunks = chunks
+        self._first = first
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._first is not None:
+            chunk, self._first = self._first, None
+            return chunk
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def __getattr__(self, name):
+        # e.g. usage_metadata, once the stream is done
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._response, name)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            close = getattr(self._chunks, "close", None)
+            if close is not None:
+                close()
+            self._scheduler._release()
+
+    def __del__(self):
+        self.close()
+
+
+class Scheduler:
+    """Admits model requests by priority within the concurrency and rate limits."""
+
+    def __init__(self, max_concurrent: int, rpm: int = 0, tpm: int = 0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.background_slots = max(1, self.max_concurrent - INTERACTIVE_RESERVED_SLOTS)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._cond = threading.Condition()
+        self._waiting: list[tuple[int, int]] = []  # heap of (priority, arrival)
+        self._arrivals = itertools.count()
+        self._running = 0
+        self._stats = {"requests": 0, "retries": 0, "waited_seconds": 0.0}
+
+    def _acquire(self, priority: int, tokens: int):
+        ticket = (priority, next(self._arrivals))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    timeout = None
+                    limit = self.max_concurrent if priority == INTERACTIVE else self.background_slots
+                    if self._waiting[0] == ticket and self._running < limit:
+                        reserve = 0.0 if priority == INTERACTIVE else INTERACTIVE_RESERVED_RATE
+                        timeout = max(self.requests.delay(1, reserve), self.tokens.delay(tokens, reserve))
+                        if timeout <= 0:
+                            break
+                    self._cond.wait(timeout)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self._running += 1
+            self._stats["requests"] += 1
+            self._stats["waited_seconds"] += time.monotonic() - started
+            self._cond.notify_all()  # the next in line may go too
+
+    def _release(self):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    def call(self, mode: str, tokens: int, send, stream: bool = False):
+        """
+        Run `send()` (one model request of about `tokens` prompt tokens) when
+        admitted, retrying 429/503 answers. A streamed response holds its slot
+        until it's consumed; its first chunk is fetched here, so errors that
+        streams only raise on iteration are retried too.
+        """
+        priority = BACKGROUND if _background.get() else MODE_PRIORITIES.get(mode, BACKGROUND)
+        for attempt in itertools.count():
+            self._acquire(priority, tokens)
+            try:
+                response = send()
+                if stream:
+                    chunks = iter(response)
+                    first = next(chunks, None)
+            except RETRYABLE_ERRORS:
+                self._release()
+                if attempt >= RETRY_ATTEMPTS:
+                    raise
+                with self._cond:
+                    self._stats["retries"] += 1
+                time.sleep(retry_delay(attempt))
+                continue
+            except BaseException:
+                self._release()
+                raise
+            if not stream:
+                self._release()
+                return response
+            held = _HeldStream(self, response, chunks, first)
+            if first is None:
+                held.close()
+            return held
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {**self._stats, "running": self._running, "waiting": len(self._waiting)}
+
+
+scheduler = Scheduler(MAX_CONCURRENT_REQUESTS, RATE_LIMIT_RPM, RATE_LIMIT_TPM)
+
+
+class SingleFlight:
+    """
+    Coalesces identical requests: while one is in flight, callers with the
+    same key wait for it and share its result (or its error) instead of
+    sending the prompt again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[tuple, Future] = {}
+
+    def join(self, key: tuple) -> Future | None:
+        """The in-flight call for `key`, or None after making the caller its leader."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is None:
+                self._calls[key] = Future()
+            return future
+
+    def finish(self, key: tuple, result=None, error: BaseException | None = None):
+        """Leader only: publish the outcome. A None result sends waiters off to call themselves."""
+        with self._lock:
+            future = self._calls.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: tuple, fn):
+        """fn(), or the result of an identical call already in flight."""
+        pending = self.join(key)
+        if pending is not None:
+            result = pending.result()
+            return result if result is not None else fn()
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, error=e if isinstance(e, Exception) else None)
+            raise
+        self.finish(key, result)
+        return result
+
+
+in_flight = SingleFlight()
+
+
+# ── Usage ledger and budgets ──────────────────────────────────────────────────
+# Every model call is logged in memories_db's usage ledger (tokens in and out,
+# latency), with daily totals per mode. Prompts are held to a per-mode token
+# budget, and once a mode has used most of its daily budget its prompts shrink
+# further (fewer knowledge tags, fewer past entries, less history) instead of
+# growing with the diary, so heavy days stay fast and bounded.
+
+PROMPT_TOKEN_BUDGETS = {
+    "journaling": int(os.getenv("JOURNALING_PROMPT_BUDGET", "40000")),
+    "past_self": int(os.getenv("PAST_SELF_PROMPT_BUDGET", "48000")),
+}
+# Tokens (in + out) per mode per day; 0 means no daily budget.
+DAILY_TOKEN_BUDGETS = {
+    "journaling": int(os.getenv("JOURNALING_DAILY_BUDGET", "0")),
+    "past_self": int(os.getenv("PAST_SELF_DAILY_BUDGET", "0")),
+}
+# Prompts start shrinking at this share of the daily budget, down to
+# MIN_BUDGET_SCALE of their usual size once it is spent.
+DAILY_BUDGET_SOFT_LIMIT = 0.8
+MIN_BUDGET_SCALE = 0.25
+USAGE_REFRESH_SECONDS = 30
+
+
+class UsageLedger:
+    """Records model calls in memories_db and keeps today's token count per mode."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day = ""
+        self._today: dict[str, int] = {}
+        self._loaded_at = 0.0
+
+    def record_call(
+        self,
+        mode: str,
+        prompt_parts: tuple[str, ...],
+        started: float,
+        response=None,
+        reply: str = "",
+        ok: bool = True,
+    ):
+        """
+        Log a call that began at `started` (time.perf_counter()). Token counts
+        come from the response's usage metadata when the API reports it, and
+        are estimated locally from the texts sent (`prompt_parts`) otherwise.
+        """
+        latency_ms = (time.perf_counter() - started) * 1000
+        usage = getattr(response, "usage_metadata", None)
+        input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        if input_tokens:
+            output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        else:
+            input_tokens = sum(_cached_tokens(part) for part in prompt_parts)
+            output_tokens = context_builder.estimate_tokens(reply)
+        try:
+            db.record_usage(mode, input_tokens, output_tokens, latency_ms, backend.name, ok)
+        except sqlite3.Error:
+            pass  # the ledger must never break a request
+        with self._lock:
+            self._today[mode] = self._today.get(mode, 0) + input_tokens + output_tokens
+
+    def today(self, mode: str) -> int:
+        """
+        Tokens `mode` used today. Reread from the ledger every
+        USAGE_REFRESH_SECONDS, so other sessions and processes count too.
+        """
+        now, day = time.time(), date.today().isoformat()
+        with self._lock:
+            if day == self._day and now - self._loaded_at < USAGE_REFRESH_SECONDS:
+                return self._today.get(mode, 0)
+        try:
+            used = db.get_usage_for_day(day)
+        except sqlite3.Error:
+            used = {}
+        with self._lock:
+            self._day, self._today, self._loaded_at = day, used, now
+            return used.get(mode, 0)
+
+    def budget_scale(self, mode: str) -> float:
+        """1.0 normally, falling linearly to MIN_BUDGET_SCALE as the daily budget runs out."""
+        daily = DAILY_TOKEN_BUDGETS.get(mode, 0)
+        if daily <= 0:
+            return 1.0
+        share = self.today(mode) / daily
+        if share <= DAILY_BUDGET_SOFT_LIMIT:
+            return 1.0
+        spent = min(1.0, (share - DAILY_BUDGET_SOFT_LIMIT) / (1 - DAILY_BUDGET_SOFT_LIMIT))
+        return 1.0 - spent * (1 - MIN_BUDGET_SCALE)
+
+
+usage_ledger = UsageLedger()
+
+
+@lru_cache(maxsize=2048)
+def _cached_tokens(text: str) -> int:
+    """estimate_tokens() for texts that recur from turn to turn (prompt heads, entries, history)."""
+    return context_builder.estimate_tokens(text)
+
+
+def prompt_budget(mode: str) -> int:
+    """Token budget for one `mode` prompt, scaled down near the daily budget."""
+    return int(PROMPT_TOKEN_BUDGETS[mode] * usage_ledger.budget_scale(mode))
+
+
+def _trim_knowledge(knowledge_summary: str, max_tokens: int) -> str:
+    """
+    Cut tags from a "[Type]: a | b" knowledge block until it fits in
+    `max_tokens`, keeping the same share of each type's tags (the first ones).
+    """
+    tokens = _cached_tokens(knowledge_summary)
+    if tokens <= max_tokens:
+        return knowledge_summary
+    keep = max(max_tokens, 0) / tokens
+    lines = []
+    for line in knowledge_summary.splitlines():
+        header, sep, values = line.partition(": ")
+        values = values.split(" | ") if sep else []
+        kept = values[:int(len(values) * keep)]
+        if kept:
+            lines.append(f"{header}: {' | '.join(kept)}")
+    return clip_text("\n".join(lines), max_tokens) if lines else ""
+
+
+def _budget_left(mode: str, *texts: str) -> int:
+    """Tokens of the `mode` prompt budget left once `texts` are in."""
+    return prompt_budget(mode) - sum(_cached_tokens(text) for text in texts)
+
+
+# ── Knowledge context ─────────────────────────────────────────────────────────
+# Prompts get only the knowledge graph tags most relevant to the current
+# message, capped at a per-mode token budget (see context_builder) that
+# shrinks with the mode's prompt budget near its daily limit.
+
+KNOWLEDGE_BUDGETS = {
+    "journaling": int(os.getenv("JOURNALING_KNOWLEDGE_BUDGET", context_builder.DEFAULT_TOKEN_BUDGET)),
+    "past_self": int(os.getenv("PAST_SELF_KNOWLEDGE_BUDGET", context_builder.DEFAULT_TOKEN_BUDGET * 2)),
+}
+
+# Past Self speaks in the user's voice, so their phrasing matters more there.
+KNOWLEDGE_TYPE_WEIGHTS = {
+    "journaling": context_builder.DEFAULT_TYPE_WEIGHTS,
+    "past_self": {**context_builder.DEFAULT_TYPE_WEIGHTS, "Syntax": 0.9},
+}
+
+
+def build_knowledge_context(
+    mode: str,
+    tags: list[dict],
+    message: str,
+) -> context_builder.KnowledgeContext:
+    """
+    Rank `tags` (memories_db.get_tag_stats() rows) against `message` and pack
+    them into the budget for `mode` ("journaling" or "past_self"). Pass the
+    result's `.text` as `knowledge_summary`; `.dropped` lists what didn't fit.
+    """
+    return context_builder.build_knowledge_context(
+        tags,
+        message,
+        budget_tokens=int(KNOWLEDGE_BUDGETS[mode] * usage_ledger.budget_scale(mode)),
+        type_weights=KNOWLEDGE_TYPE_WEIGHTS[mode],
+    )
+
+
+@lru_cache(maxsize=8)
+def _snapshot_tokens(snapshot: str) -> int:
+    return context_builder.estimate_tokens(snapshot)
+
+
+def knowledge_text(
+    mode: str,
+    tags: list[dict],
+    message: str,
+    snapshot: str = "",
+    api_key: str = "",
+    profile: dict | None = None,
+    history_summary: str = "",
+) -> str:
+    """
+    The knowledge block for a `mode` prompt. The full knowledge `snapshot`
+    (memories_db.get_knowledge_summary()) is used whole only when it will be
+    served from context cache: the backend supports it, the snapshot is big
+    enough to be cached and fits, untrimmed, in the knowledge share of the
+    prompt built from `profile`, `message` and `history_summary`, and
+    context_cache holds a live handle for that prompt prefix. It then stays
+    the same from message to message until the data changes, so the cached
+    prefix keeps being reused. A missing handle is uploaded in the background
+    for the next turns; meanwhile, and whenever the snapshot isn't eligible,
+    the tags most relevant to `message` are packed into the mode's knowledge
+    budget (build_knowledge_context()), as a large snapshot would otherwise
+    be resent inline every turn.
+    """
+    profile = profile or {}
+    if (
+        snapshot
+        and api_key
+        and CONTEXT_CACHE_ENABLED
+        and backend.supports_context_cache
+        and CONTEXT_CACHE_MIN_TOKENS <= _snapshot_tokens(snapshot)
+        <= min(CONTEXT_CACHE_MAX_TOKENS, _knowledge_room(mode, profile, message, history_summary))
+    ):
+        prefix = _PROMPT_PREFIXES[mode](tuple(sorted(profile.items())), snapshot)
+        if context_cache.warm(api_key, mode, prefix):
+            return snapshot
+    return build_knowledge_context(mode, tags, message).text
+
+
+# ── Conversation history ──────────────────────────────────────────────────────
+# Prompts carry the newest turns verbatim, up to a token budget, plus a rolling
+# summary of everything older. The summary is only rewritten once enough
+# unsummarized turns pile up, so most turns cost no extra model call, and each
+# prompt stays bounded however long the session runs.
+
+HISTORY_RECENT_TOKENS = int(os.getenv("HISTORY_RECENT_TOKENS", "1200"))
+HISTORY_SUMMARY_TRIGGER_TOKENS = int(os.getenv("HISTORY_SUMMARY_TRIGGER_TOKENS", "1500"))
+HISTORY_TURN_MAX_TOKENS = 600
+# Hard cap on verbatim history per prompt: the recent window plus turns still
+# waiting to be summarized.
+HISTORY_MAX_TOKENS = HISTORY_RECENT_TOKENS + HISTORY_SUMMARY_TRIGGER_TOKENS
+HISTORY_SUMMARY_MAX_WORDS = 200
+
+HISTORY_SUMMARY_PROMPT = """
+You keep a running summary of a conversation between a user and {assistant}.
+Update the current summary with the new messages below.
+Keep names, events, feelings, open questions and anything the user asked to remember; drop small talk.
+Write in the language of the conversation, in at most {max_words} words.
+Return ONLY the updated summary.
+"""
+
+
+def clip_text(text: str, max_tokens: int) -> str:
+    """Shorten `text` to roughly `max_tokens` (context_builder estimate)."""
+    tokens = context_builder.estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    return text[: int(len(text) * max_tokens / tokens)].rstrip() + " […]"
+
+
+def recent_history(conversation_history: list[dict], max_tokens: int = HISTORY_RECENT_TOKENS) -> list[dict]:
+    """
+    The newest messages that fit in `max_tokens` (at least the last one),
+    starting on a user message. Replaces a fixed "last N turns" slice, so a few
+    long turns can't blow up the prompt and many short ones aren't cut early.
+    """
+    used, start = 0, len(conversation_history)
+    for i in range(len(conversation_history) - 1, -1, -1):
+        used += context_builder.estimate_tokens(conversation_history[i]["content"])
+        if used > max_tokens and start < len(conversation_history):
+            break
+        start = i
+    while start < len(conversation_history) and conversation_history[start]["role"] != "user":
+        start += 1
+    return conversation_history[start:]
+
+
+class HistoryManager:
+    """
+    Prompt-side history of one conversation: a rolling summary plus the
+    messages not folded into it yet ({"role": "user"|"assistant", "content"}).
+    Keep one per conversation (e.g. in st.session_state), add() each message,
+    pass recent() and summary to the prompt, and call compact() after a turn.
+    """
+
+    def __init__(
+        self,
+        assistant: str = "their journaling companion",
+        recent_tokens: int = HISTORY_RECENT_TOKENS,
+        trigger_tokens: int = HISTORY_SUMMARY_TRIGGER_TOKENS,
+    ):
+        self.assistant = assistant
+        self.recent_tokens = recent_tokens
+        self.trigger_tokens = trigger_tokens
+        self.summary = ""
+        self._messages: list[dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, role: str, content: str):
+        with self._lock:
+            self._messages.append({"role": role, "content": clip_text(content, HISTORY_TURN_MAX_TOKENS)})
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self._messages = []
+
+    def recent(self) -> list[dict]:
+        """Verbatim messages for the next prompt; unsummarized older ones fill the slack."""
+        with self._lock:
+            return recent_history(self._messages, self.recent_tokens + self.trigger_tokens)
+
+    def _overflow(self) -> int:
+        # Messages before the recent window; with self._lock held.
+        return len(self._messages) - len(recent_history(self._messages, self.recent_tokens))
+
+    def needs_compaction(self) -> bool:
+        with self._lock:
+            older = self._messages[:self._overflow()]
+        return sum(context_builder.estimate_tokens(m["content"]) for m in older) >= self.trigger_tokens
+
+    def compact(self, api_key: str) -> bool:
+        """Fold older messages into the summary once they pass the threshold. Returns True if it did."""
+        if not self.needs_compaction():
+            return False
+        with self._lock:
+            summary, older = self.summary, self._messages[:self._overflow()]
+        transcript = "\n".join(
+            f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in older
+        )
+        system = HISTORY_SUMMARY_PROMPT.format(assistant=self.assistant, max_words=HISTORY_SUMMARY_MAX_WORDS)
+        user_input = f"Current summary:\n{summary or '(none yet)'}\n\nNew messages:\n{transcript}"
+        new_summary = _chat("history", api_key, Prompt(system, "", [], user_input)).strip()
+        with self._lock:
+            # Messages added meanwhile sit after `older`, so dropping the prefix is safe.
+            if self._messages[:len(older)] == older:
+                self._messages = self._messages[len(older):]
+                self.summary = new_summary
+        return True
+
+
+def _history_context(history_summary: str) -> str:
+    return f"\n\nEarlier in this conversation (summary):\n{history_summary}" if history_summary else ""
 
 
 # ── Onboarding Q&A ────────────────────────────────────────────────────────────
@@ -76,15 +1282,10 @@ Do not give unsolicited advice. Mirror and reflect; don't prescribe.
 Respond in the same language the user writes in.
 """
 
-def get_journaling_response(
-    api_key: str,
-    user_entry: str,
-    profile: dict,
-    conversation_history: list[dict],
-    knowledge_summary: str,
-) -> str:
-    model = _get_model(api_key)
-
+@lru_cache(maxsize=64)
+def _journaling_prefix(profile_items: tuple, knowledge_summary: str) -> str:
+    """Stable head of journaling prompts; memoized, as it only changes with the data."""
+    profile = dict(profile_items)
     profile_context = ""
     if profile:
         profile_context = f"""
@@ -96,21 +1297,66 @@ The user's profile baseline:
 
     knowledge_context = f"\nKnowledge graph (accumulated memories):\n{knowledge_summary}" if knowledge_summary else ""
 
-    system = JOURNALING_SYSTEM_PROMPT + profile_context + knowledge_context
+    return JOURNALING_SYSTEM_PROMPT + profile_context + knowledge_context
 
-    # Build history for multi-turn conversation
-    history = []
-    for msg in conversation_history[-10:]:  # Keep last 10 turns for context
-        history.append({
-            "role": msg["role"],
-            "parts": [{"text": msg["content"]}]
-        })
 
-    chat = model.start_chat(history=history)
-    response = chat.send_message(
-        [{"text": f"{system}\n\n---\nUser's journal entry:\n{user_entry}"}]
-    )
-    return response.text
+def _journaling_prompt(
+    user_entry: str,
+    profile: dict,
+    conversation_history: list[dict],
+    knowledge_summary: str,
+    history_summary: str = "",
+) -> Prompt:
+    """Returns the Prompt for a journaling turn, within the journaling prompt budget."""
+    left = _budget_left("journaling", JOURNALING_SYSTEM_PROMPT, str(profile), user_entry, history_summary)
+    knowledge_room = _knowledge_room("journaling", profile, user_entry, history_summary)
+    knowledge_summary = _trim_knowledge(knowledge_summary, knowledge_room)
+    prefix = _journaling_prefix(tuple(sorted(profile.items())), knowledge_summary)
+    left -= _cached_tokens(knowledge_summary)
+
+    # Build history for multi-turn conversation (recent turns, token-bounded)
+    history = _to_gemini_history(recent_history(conversation_history, max(0, min(HISTORY_MAX_TOKENS, left))))
+
+    return Prompt(prefix, _history_context(history_summary), history, f"User's journal entry:\n{user_entry}")
+
+
+def get_journaling_response(
+    api_key: str,
+    user_entry: str,
+    profile: dict,
+    conversation_history: list[dict],
+    knowledge_summary: str,
+    history_summary: str = "",
+) -> str:
+    prompt = _journaling_prompt(user_entry, profile, conversation_history, knowledge_summary, history_summary)
+    return _chat("journaling", api_key, prompt)
+
+
+def stream_journaling_response(
+    api_key: str,
+    user_entry: str,
+    profile: dict,
+    conversation_history: list[dict],
+    knowledge_summary: str,
+    history_summary: str = "",
+) -> Iterator[str]:
+    """Same as get_journaling_response(), yielding the margin note as it is written."""
+    prompt = _journaling_prompt(user_entry, profile, conversation_history, knowledge_summary, history_summary)
+    return _chat_stream("journaling", api_key, prompt)
+
+
+def astream_journaling_response(
+    api_key: str,
+    user_entry: str,
+    profile: dict,
+    conversation_history: list[dict],
+    knowledge_summary: str,
+    history_summary: str = "",
+) -> AsyncIterator[str]:
+    """Async-iterator form of stream_journaling_response()."""
+    return _aiter_in_thread(stream_journaling_response(
+        api_key, user_entry, profile, conversation_history, knowledge_summary, history_summary
+    ))
 
 
 # ── Past Self Mode ────────────────────────────────────────────────────────────
@@ -125,46 +1371,136 @@ If asked something you don't have data for, say so honestly: "I don't think I wr
 Respond in the same language the user writes in.
 """
 
-def get_past_self_response(
-    api_key: str,
-    user_message: str,
-    profile: dict,
-    knowledge_summary: str,
-    all_entries: list[dict],
-    conversation_history: list[dict],
-) -> str:
-    model = _get_model(api_key)
+PAST_SELF_MAX_ENTRIES = 20
 
-    # Compile recent journal entries for context
-    recent_entries = "\n\n".join(
-        [f"[{e['created_at'][:10]}]: {e['content']}" for e in all_entries[-20:]]
-    )
 
+@lru_cache(maxsize=64)
+def _past_self_prefix(profile_items: tuple, knowledge_summary: str) -> str:
+    """Stable head of Past Self prompts; memoized, as it only changes with the data."""
+    profile = dict(profile_items)
     profile_str = (
         f"Name/Life stage: {profile.get('name_and_life_stage', '?')}\n"
         f"Foundational memory: {profile.get('foundational_memory', '?')}\n"
         f"Linguistic style: {profile.get('linguistic_style', '?')}"
     )
 
-    system = (
+    return (
         PAST_SELF_SYSTEM_PROMPT
         + f"\n\nProfile baseline:\n{profile_str}"
         + f"\n\nKnowledge graph:\n{knowledge_summary}"
-        + f"\n\nJournal entries (most recent 20):\n{recent_entries}"
     )
 
-    history = []
-    for msg in conversation_history[-10:]:
-        history.append({
-            "role": msg["role"],
-            "parts": [{"text": msg["content"]}]
-        })
 
-    chat = model.start_chat(history=history)
-    response = chat.send_message(
-        [{"text": f"{system}\n\n---\nUser says: {user_message}"}]
+# Stable prompt heads per mode, as knowledge_text() checks them against the context cache.
+_PROMPT_PREFIXES = {"journaling": _journaling_prefix, "past_self": _past_self_prefix}
+_SYSTEM_PROMPTS = {"journaling": JOURNALING_SYSTEM_PROMPT, "past_self": PAST_SELF_SYSTEM_PROMPT}
+
+
+def _knowledge_room(mode: str, profile: dict, message: str, history_summary: str) -> int:
+    """
+    Most tokens a `mode` prompt gives its knowledge block: half the budget
+    left after the system prompt, profile, message and history summary.
+    knowledge_text() checks snapshots against the same figure the prompt
+    builders trim to, so a snapshot it picks is never trimmed.
+    """
+    return _budget_left(mode, _SYSTEM_PROMPTS[mode], str(profile), message, history_summary) // 2
+
+
+def _past_self_prompt(
+    user_message: str,
+    profile: dict,
+    knowledge_summary: str,
+    all_entries: list[dict],
+    conversation_history: list[dict],
+    history_summary: str = "",
+) -> Prompt:
+    """
+    Returns the Prompt for a Past Self turn, within the Past Self prompt
+    budget: the knowledge block gets at most half of it, entries come next
+    (leaving a quarter of what's left for chat history). `all_entries` are
+    taken in the order given, most important first, as
+    retrieval.entries_for_past_self() returns them; the ones that fit are
+    shown oldest first.
+    """
+    left = _budget_left("past_self", PAST_SELF_SYSTEM_PROMPT, str(profile), user_message, history_summary)
+    knowledge_room = _knowledge_room("past_self", profile, user_message, history_summary)
+    knowledge_summary = _trim_knowledge(knowledge_summary, knowledge_room)
+    prefix = _past_self_prefix(tuple(sorted(profile.items())), knowledge_summary)
+    left -= _cached_tokens(knowledge_summary)
+
+    # Compile journal entries for context (retrieval.entries_for_past_self()
+    # picks the ones relevant to this message; at most PAST_SELF_MAX_ENTRIES
+    # are sent, fewer when they don't fit)
+    kept = []
+    room = left - min(HISTORY_MAX_TOKENS, left // 4)
+    for e in all_entries[:PAST_SELF_MAX_ENTRIES]:
+        line = f"[{e['created_at'][:10]}]: {e['content']}"
+        cost = _cached_tokens(line)
+        if cost > room:
+            if not kept and room > 0:
+                kept.append((e, clip_text(line, room)))  # always some past to speak from
+            break
+        kept.append((e, line))
+        room -= cost
+    kept.sort(key=lambda item: (item[0]["created_at"], item[0].get("id", 0)))
+    lines = [line for _, line in kept]
+    recent_entries = "\n\n".join(lines)
+    left -= sum(_cached_tokens(line) for line in lines)
+
+    system = (
+        f"\n\nJournal entries (relevant and most recent):\n{recent_entries}"
+        + _history_context(history_summary)
     )
-    return response.text
+
+    history = _to_gemini_history(recent_history(conversation_history, max(0, min(HISTORY_MAX_TOKENS, left))))
+
+    return Prompt(prefix, system, history, f"User says: {user_message}")
+
+
+def get_past_self_response(
+    api_key: str,
+    user_message: str,
+    profile: dict,
+    knowledge_summary: str,
+    all_entries: list[dict],
+    conversation_history: list[dict],
+    history_summary: str = "",
+) -> str:
+    prompt = _past_self_prompt(
+        user_message, profile, knowledge_summary, all_entries, conversation_history, history_summary
+    )
+    return _chat("past_self", api_key, prompt)
+
+
+def stream_past_self_response(
+    api_key: str,
+    user_message: str,
+    profile: dict,
+    knowledge_summary: str,
+    all_entries: list[dict],
+    conversation_history: list[dict],
+    history_summary: str = "",
+) -> Iterator[str]:
+    """Same as get_past_self_response(), yielding the reply as it is written."""
+    prompt = _past_self_prompt(
+        user_message, profile, knowledge_summary, all_entries, conversation_history, history_summary
+    )
+    return _chat_stream("past_self", api_key, prompt)
+
+
+def astream_past_self_response(
+    api_key: str,
+    user_message: str,
+    profile: dict,
+    knowledge_summary: str,
+    all_entries: list[dict],
+    conversation_history: list[dict],
+    history_summary: str = "",
+) -> AsyncIterator[str]:
+    """Async-iterator form of stream_past_self_response()."""
+    return _aiter_in_thread(stream_past_self_response(
+        api_key, user_message, profile, knowledge_summary, all_entries, conversation_history, history_summary
+    ))
 
 
 # ── Knowledge Graph Extraction ────────────────────────────────────────────────
@@ -189,18 +1525,187 @@ Format:
 Journal entry:
 """
 
-def extract_knowledge_tags(api_key: str, entry: str) -> list[dict]:
-    """Extract structured knowledge graph tags from a journal entry."""
+# Structured output: the API constrains the reply to this JSON shape.
+EXTRACTION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": tag_parser.TAGS_SCHEMA,
+}
+
+def extract_knowledge_tags(api_key: str, entry: str, strict: bool = False) -> list[dict]:
+    """
+    Extract structured knowledge graph tags from a journal entry.
+    Failures return [] unless `strict` is set, in which case they are raised
+    so the caller can retry instead of silently losing the tags.
+    """
+    key = _extraction_key(entry)
+    cached = _cached_tags(key)
+    if cached is not None:
+        return cached
     try:
-        model = _get_model(api_key)
-        response = model.generate_content(EXTRACTION_PROMPT + entry)
-        raw = response.text.strip()
-        # Strip markdown code fences if present
-        if raw.startswith("```"):
-            raw = raw.split("```")[1]
-            if raw.startswith("json"):
-                raw = raw[4:]
-        tags = json.loads(raw)
-        return tags if isinstance(tags, list) else []
+        return in_flight.do(("extraction", key), lambda: _extract(api_key, entry, key))
     except Exception:
+        if strict:
+            raise
         return []
+
+
+def _extract(api_key: str, entry: str, key: str) -> list[dict]:
+    started, response, text, ok = time.perf_counter(), None, "", False
+    tokens = _cached_tokens(EXTRACTION_PROMPT) + context_builder.estimate_tokens(entry)
+    try:
+        response = scheduler.call(
+            "extraction", tokens,
+            lambda: backend.generate("extraction", api_key, EXTRACTION_PROMPT + entry, EXTRACTION_CONFIG),
+        )
+        # A blocked reply raises here, after its tokens were spent.
+        text, ok = response.text, True
+    finally:
+        usage_ledger.record_call("extraction", (EXTRACTION_PROMPT, entry), started, response, text, ok)
+    tags = tag_parser.parse_tags(text)
+    response_cache.put("extraction", key, json.dumps(tags, ensure_ascii=False))
+    return tags
+
+
+def _extraction_key(entry: str) -> str:
+    # Batched and single extraction share this key: same entry, same tags.
+    return prompt_fingerprint(MODEL_NAME, EXTRACTION_PROMPT, [], entry)
+
+
+def _cached_tags(key: str) -> list[dict] | None:
+    """Cached tags for an extraction key, or None. A row that can't be parsed is dropped."""
+    cached = response_cache.get("extraction", key)
+    if cached is None:
+        return None
+    try:
+        items = json.loads(cached)
+        if not isinstance(items, list):
+            raise ValueError(f"expected a JSON array, got {type(items).__name__}")
+    except ValueError:
+        # Extract again rather than fail on (or keep serving) a corrupt row.
+        response_cache.delete("extraction", key)
+        return None
+    return tag_parser.clean_tags(items)
+
+
+# ── Batched Extraction ────────────────────────────────────────────────────────
+# Backfills and re-extraction pack many entries into one request, each marked
+# with its id, and get back a JSON array of {"id", "tags"} objects. A 1,000-entry
+# backfill then takes ~50 calls instead of 1,000.
+
+BATCH_EXTRACTION_PROMPT = """
+You are a silent data structuring engine. Analyze EACH journal entry below independently and extract structured tags.
+Each entry is wrapped in <entry id="..."> … </entry>.
+Return ONLY a valid JSON array with one object per entry: its id (as a string) and its array of tags.
+Include every id, using [] for an entry with nothing to extract. No markdown, no explanation.
+
+Tag types to use:
+- "Event": A specific occurrence (with or without explicit date)
+- "Entity": A person, pet, place, or organization mentioned
+- "Sentiment/Trigger": An emotion expressed and what triggered it
+- "Core Belief": A value, opinion, or life philosophy stated or implied
+- "Syntax": A distinctive phrase, word, or tone pattern used by the writer
+
+Format:
+[
+  {"id": "12", "tags": [{"type": "Event", "value": "..."}, {"type": "Entity", "value": "..."}]},
+  {"id": "13", "tags": []}
+]
+
+Journal entries:
+"""
+
+MAX_BATCH_ENTRIES = int(os.getenv("EXTRACTION_BATCH_SIZE", "20"))
+MAX_BATCH_CHARS = 30_000
+BATCH_EXTRACTION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": tag_parser.BATCH_SCHEMA,
+}
+
+
+def split_into_batches(entries: list[tuple[int, str]]) -> list[list[tuple[int, str]]]:
+    """Group (entry_id, text) pairs into batches within the entry and size limits."""
+    batches, current, size = [], [], 0
+    for entry_id, text in entries:
+        if current and (len(current) >= MAX_BATCH_ENTRIES or size + len(text) > MAX_BATCH_CHARS):
+            batches.append(current)
+            current, size = [], 0
+        current.append((entry_id, text))
+        size += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _request_batch(api_key: str, batch: list[tuple[int, str]]) -> dict[int, list[dict]]:
+    body = "\n".join(f'<entry id="{entry_id}">\n{text}\n</entry>' for entry_id, text in batch)
+    started, response, text, ok = time.perf_counter(), None, "", False
+    tokens = _cached_tokens(BATCH_EXTRACTION_PROMPT) + context_builder.estimate_tokens(body)
+    try:
+        response = scheduler.call(
+            "extraction_batch", tokens,
+            lambda: backend.generate("extraction_batch", api_key, BATCH_EXTRACTION_PROMPT + body, BATCH_EXTRACTION_CONFIG),
+        )
+        text, ok = response.text, True
+    finally:
+        usage_ledger.record_call("extraction_batch", (BATCH_EXTRACTION_PROMPT, body), started, response, text, ok)
+    # Raises ValueError when nothing is recoverable; entries cut off are just missing.
+    parsed = tag_parser.parse_batch(text)
+    wanted = {str(entry_id): entry_id for entry_id, _ in batch}
+    return {wanted[key]: tags for key, tags in parsed.items() if key in wanted}
+
+
+def _extract_batch(api_key: str, batch: list[tuple[int, str]], results: dict, errors: dict):
+    if len(batch) == 1:
+        entry_id, text = batch[0]
+        try:
+            results[entry_id] = extract_knowledge_tags(api_key, text, strict=True)
+        except Exception as e:
+            errors[entry_id] = e
+        return
+    try:
+        found = _request_batch(api_key, batch)
+    except (ValueError, google_exceptions.InvalidArgument):
+        # Too large, truncated or unparseable: halve it and try again.
+        middle = len(batch) // 2
+        _extract_batch(api_key, batch[:middle], results, errors)
+        _extract_batch(api_key, batch[middle:], results, errors)
+        return
+    except Exception as e:
+        # Quota, network or server trouble: splitting would only multiply
+        # failing calls, so the whole batch is handed back for a later retry.
+        errors.update((entry_id, e) for entry_id, _ in batch)
+        return
+    results.update(found)
+    # Entries the model skipped are retried one by one.
+    for entry_id, text in batch:
+        if entry_id not in found:
+            _extract_batch(api_key, [(entry_id, text)], results, errors)
+
+
+def extract_knowledge_tags_batch(
+    api_key: str,
+    entries: list[tuple[int, str]],
+) -> tuple[dict[int, list[dict]], dict[int, Exception]]:
+    """
+    Extract tags for many entries with as few requests as possible.
+    `entries` is a list of (entry_id, text). Returns (tags by entry id, errors
+    by entry id); every input id appears in exactly one of the two.
+    """
+    results: dict[int, list[dict]] = {}
+    errors: dict[int, Exception] = {}
+    pending = []
+    for entry_id, text in entries:
+        cached = _cached_tags(_extraction_key(text))
+        if cached is not None:
+            results[entry_id] = cached
+        else:
+            pending.append((entry_id, text))
+
+    for batch in split_into_batches(pending):
+        found: dict[int, list[dict]] = {}
+        _extract_batch(api_key, batch, found, errors)
+        texts = dict(batch)
+        for entry_id, tags in found.items():
+            response_cache.put("extraction", _extraction_key(texts[entry_id]), json.dumps(tags, ensure_ascii=False))
+        results.update(found)
+    return results, errors
@@ -8,12 +8,17 @@ Run with:  streamlit run app.py
 """
 
 import streamlit as st
+import html
 import os
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
 
 import memories_db as db
 import ai_engine as ai
+import extraction_worker
+import read_model
+import retrieval
+import tracing
 
 load_dotenv()
 
@@ -139,6 +144,16 @@ st.markdown("""
   /* Divider */
   hr { border-color: #3d3420; }
 
+  /* Search results */
+  .search-result {
+    border-left: 3px solid #6b5010;
+    padding: 0.5rem 1rem;
+    margin: 0.6rem 0;
+    color: #d8cca8;
+  }
+  .search-result small { color: #8a7a58; }
+  .search-result mark { background: #5a4510; color: #f0d878; padding: 0 2px; border-radius: 2px; }
+
   /* Tag pills in sidebar */
   .tag-pill {
     display: inline-block;
@@ -159,20 +174,30 @@ db.init_db()
 
 # Session state defaults
 if "phase" not in st.session_state:
-    st.session_state.phase = "onboarding" if not db.profile_is_complete() else "journaling"
+    st.session_state.phase = "onboarding" if not read_model.profile_is_complete() else "journaling"
 if "onboarding_step" not in st.session_state:
     st.session_state.onboarding_step = 0
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []      # journaling chat
 if "past_self_history" not in st.session_state:
     st.session_state.past_self_history = [] # past self chat
+# What the model sees of each chat: recent turns plus a rolling summary
+if "journal_memory" not in st.session_state:
+    st.session_state.journal_memory = ai.HistoryManager("their journaling companion")
+if "past_self_memory" not in st.session_state:
+    st.session_state.past_self_memory = ai.HistoryManager("a simulation of their past self")
+
+# Only the latest messages of each chat are kept on screen (entries are saved anyway)
+CHAT_DISPLAY_LIMIT = 40
+# Requests shown in the sidebar's timing panel when tracing is on
+TRACE_PANEL_REQUESTS = 6
 if "consent_given" not in st.session_state:
-    st.session_state.consent_given = db.profile_is_complete()
+    st.session_state.consent_given = read_model.profile_is_complete()
 
 
 # ── Sidebar ───────────────────────────────────────────────────────────────────
 
-with st.sidebar:
+with st.sidebar, tracing.request("sidebar"):
     st.markdown("## 📖 AI of Memories")
     st.markdown("---")
 
@@ -187,11 +212,11 @@ with st.sidebar:
 
     st.markdown("---")
 
-    entry_count = db.get_entry_count()
+    entry_count = read_model.entry_count()
     st.markdown(f"**📝 Entries recorded:** {entry_count}")
 
     if st.session_state.phase != "onboarding":
-        profile = db.get_profile()
+        profile = read_model.profile()
         name = profile.get("name_and_life_stage", "")
         if name:
             st.markdown(f"**👤 {name[:40]}**")
@@ -206,27 +231,39 @@ with st.sidebar:
                 else:
                     st.session_state.phase = "past_self"
                     st.session_state.past_self_history = []
+                    st.session_state.past_self_memory.clear()
                     st.rerun()
 
-        elif st.session_state.phase == "past_self":
+        else:
             if st.button("📖 Return to Journal", use_container_width=True):
                 st.session_state.phase = "journaling"
                 st.rerun()
 
+        if st.session_state.phase != "search" and entry_count > 0:
+            if st.button("🔎 Search Memories", use_container_width=True):
+                st.session_state.phase = "search"
+                st.rerun()
+
         # Knowledge graph summary
         if entry_count > 0:
             st.markdown("---")
             st.markdown("**🧠 Memory Snapshot**")
-            tags = db.get_all_tags()
-            tag_types = list(set(t["tag_type"] for t in tags))
-            for tt in tag_types:
-                vals = [t["tag_value"] for t in tags if t["tag_type"] == tt][:3]
-                preview = ", ".join(vals)
+            for group in read_model.tag_snapshot():
+                preview = ", ".join(group["preview"])
                 st.markdown(
-                    f'<span class="tag-pill">{tt}</span> <small style="color:#8a7a58">{preview[:50]}</small>',
+                    f'<span class="tag-pill">{group["tag_type"]} · {group["count"]}</span> '
+                    f'<small style="color:#8a7a58">{preview[:50]}</small>',
                     unsafe_allow_html=True
                 )
 
+    # Per-request timing breakdown (AI_TRACE=1, see tracing.py)
+    if tracing.enabled:
+        st.markdown("---")
+        with st.expander("⏱️ Request timings"):
+            for request in tracing.recent_requests(TRACE_PANEL_REQUESTS):
+                st.markdown(f"**{request.name}** · {request.duration_ms:.1f} ms")
+                st.code(tracing.format_breakdown(request), language=None)
+
     st.markdown("---")
     st.markdown(
         '<small style="color:#5a4a2a">All data is stored locally on your device.<br>'
@@ -277,6 +314,7 @@ def render_onboarding():
         db.set_profile("onboarding_complete", "true")
         st.session_state.phase = "journaling"
         st.session_state.chat_history = []
+        st.session_state.journal_memory.clear()
         st.rerun()
         return
 
@@ -286,7 +324,7 @@ def render_onboarding():
     for i in range(step):
         prev_q = questions[i]
         st.markdown(f'<div class="ai-bubble">{prev_q["prompt"]}</div>', unsafe_allow_html=True)
-        stored = db.get_profile().get(prev_q["store_key"], "")
+        stored = read_model.profile().get(prev_q["store_key"], "")
         if stored:
             st.markdown(f'<div class="user-bubble">{stored}</div>', unsafe_allow_html=True)
 
@@ -303,6 +341,20 @@ def render_onboarding():
         st.rerun()
 
 
+# ── Streaming replies ─────────────────────────────────────────────────────────
+
+def stream_bubble(chunks, css_class: str, waiting: str) -> str:
+    """Render a reply into a chat bubble as it streams in. Returns the full text."""
+    placeholder = st.empty()
+    placeholder.markdown(f'<div class="{css_class}"><em>{waiting}</em></div>', unsafe_allow_html=True)
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        placeholder.markdown(f'<div class="{css_class}">{text}▌</div>', unsafe_allow_html=True)
+    placeholder.markdown(f'<div class="{css_class}">{text}</div>', unsafe_allow_html=True)
+    return text
+
+
 # ── PHASE 2: Daily Journaling ─────────────────────────────────────────────────
 
 def render_journaling():
@@ -313,6 +365,9 @@ def render_journaling():
         st.warning("⚠️ Please enter your Gemini API key in the sidebar to continue.", icon="🔑")
         return
 
+    # Retry any tag extractions still queued from earlier entries
+    extraction_worker.ensure_worker(api_key)
+
     st.markdown("---")
 
     # Render existing chat history
@@ -333,41 +388,73 @@ def render_journaling():
         submitted = st.form_submit_button("✍️ Add to Diary")
 
     if submitted and entry.strip():
-        profile = db.get_profile()
-        knowledge_summary = db.get_knowledge_summary()
+        profile = read_model.profile()
+        memory = st.session_state.journal_memory
+        knowledge = ai.knowledge_text(
+            "journaling",
+            read_model.tag_stats(),
+            entry,
+            snapshot=read_model.knowledge_summary(),
+            api_key=api_key,
+            profile=profile,
+            history_summary=memory.summary,
+        )
 
         # Build history for AI context
         history_for_ai = [
             {"role": "user" if m["role"] == "user" else "model", "content": m["content"]}
-            for m in st.session_state.chat_history
+            for m in memory.recent()
         ]
 
-        with st.spinner("📝 Writing margin note…"):
-            try:
-                response = ai.get_journaling_response(
+        # Extract tags silently, in parallel with the margin note
+        extraction = ai.submit(ai.extract_knowledge_tags, api_key=api_key, entry=entry, strict=True)
+
+        st.markdown(f'<div class="user-bubble">{entry}</div>', unsafe_allow_html=True)
+        try:
+            response = stream_bubble(
+                ai.stream_journaling_response(
                     api_key=api_key,
                     user_entry=entry,
                     profile=profile,
                     conversation_history=history_for_ai,
-                    knowledge_summary=knowledge_summary,
-                )
-            except Exception as e:
-                response = f"*(Something went wrong: {e})*"
-
-        # Save entry & response
-        entry_id = db.save_entry(content=entry, ai_response=response)
-
-        # Extract tags silently
+                    knowledge_summary=knowledge,
+                    history_summary=memory.summary,
+                ),
+                css_class="ai-bubble",
+                waiting="📝 Writing margin note…",
+            )
+        except Exception as e:
+            response = f"*(Something went wrong: {e})*"
         try:
-            tags = ai.extract_knowledge_tags(api_key=api_key, entry=entry)
+            tags = extraction.result()
+        except Exception:
+            tags = None
+
+        # Save entry & response together with its extraction job. With tags in
+        # hand the job only comes due after a lease, in case this run dies
+        # before saving them; completing it below takes it off the queue.
+        entry_id = db.save_entry(
+            content=entry,
+            ai_response=response,
+            job_kind=extraction_worker.EXTRACT_TAGS,
+            job_run_after=None if tags is None else datetime.now() + timedelta(seconds=extraction_worker.LEASE_SECONDS),
+        )
+
+        if tags is None:
+            # Extraction failed: the background worker retries it
+            extraction_worker.ensure_worker(api_key).wake()
+        else:
             if tags:
                 db.save_tags(entry_id=entry_id, tags=tags)
-        except Exception:
-            pass
+            db.complete_job(extraction_worker.EXTRACT_TAGS, entry_id)
 
         # Update chat history
         st.session_state.chat_history.append({"role": "user", "content": entry})
         st.session_state.chat_history.append({"role": "assistant", "content": response})
+        del st.session_state.chat_history[:-CHAT_DISPLAY_LIMIT]
+        memory.add("user", entry)
+        memory.add("assistant", response)
+        ai.submit(memory.compact, api_key)
 
         st.rerun()
 
@@ -375,14 +462,12 @@ def render_journaling():
 # ── PHASE 3: Past Self Mode ───────────────────────────────────────────────────
 
 def render_past_self():
-    profile = db.get_profile()
-    all_entries = db.get_all_entries()
-    knowledge_summary = db.get_knowledge_summary()
+    profile = read_model.profile()
+    first_last = read_model.first_last_dates()
 
     # Date range of entries
-    if all_entries:
-        first_date = all_entries[0]["created_at"][:10]
-        last_date = all_entries[-1]["created_at"][:10]
+    if first_last:
+        first_date, last_date = (d[:10] for d in first_last)
         date_range = f"{first_date} – {last_date}"
     else:
         date_range = "no entries yet"
@@ -420,36 +505,113 @@ def render_past_self():
         submitted = st.form_submit_button("💬 Send")
 
     if submitted and message.strip():
+        memory = st.session_state.past_self_memory
+        knowledge = ai.knowledge_text(
+            "past_self",
+            read_model.tag_stats(),
+            message,
+            snapshot=read_model.knowledge_summary(),
+            api_key=api_key,
+            profile=profile,
+            history_summary=memory.summary,
+        )
+        relevant_entries = retrieval.entries_for_past_self(message)
         history_for_ai = [
             {"role": "user" if m["role"] == "user" else "model", "content": m["content"]}
-            for m in st.session_state.past_self_history
+            for m in memory.recent()
         ]
 
-        with st.spinner("🕰️ Reaching into the past…"):
-            try:
-                response = ai.get_past_self_response(
+        st.markdown(f'<div class="user-bubble">{message}</div>', unsafe_allow_html=True)
+        try:
+            response = stream_bubble(
+                ai.stream_past_self_response(
                     api_key=api_key,
                     user_message=message,
                     profile=profile,
-                    knowledge_summary=knowledge_summary,
-                    all_entries=all_entries,
+                    knowledge_summary=knowledge,
+                    all_entries=relevant_entries,
                     conversation_history=history_for_ai,
-                )
-            except Exception as e:
-                response = f"*(Something went wrong: {e})*"
+                    history_summary=memory.summary,
+                ),
+                css_class="past-self-bubble",
+                waiting="🕰️ Reaching into the past…",
+            )
+        except Exception as e:
+            response = f"*(Something went wrong: {e})*"
 
         st.session_state.past_self_history.append({"role": "user", "content": message})
         st.session_state.past_self_history.append({"role": "assistant", "content": response})
+        del st.session_state.past_self_history[:-CHAT_DISPLAY_LIMIT]
+        memory.add("user", message)
+        memory.add("assistant", response)
+        ai.submit(memory.compact, api_key)
         st.rerun()
 
 
+# ── PHASE 4: Search ───────────────────────────────────────────────────────────
+
+SEARCH_RESULT_LIMIT = 30
+
+
+def highlighted(snippet: str) -> str:
+    """Escaped snippet HTML with the search matches wrapped in <mark>."""
+    return (
+        html.escape(snippet)
+        .replace(db.HIGHLIGHT_START, "<mark>")
+        .replace(db.HIGHLIGHT_END, "</mark>")
+    )
+
+
+def render_search():
+    st.markdown("# 🔎 Search Memories")
+
+    first_last = read_model.first_last_dates()
+    if not first_last:
+        st.info("Nothing to search yet — write your first entry.")
+        return
+    first, last = (date.fromisoformat(d[:10]) for d in first_last)
+
+    query = st.text_input(
+        "Search your diary",
+        placeholder="A name, a place, a feeling…",
+        key="search_query",
+    )
+    dates = st.date_input(
+        "Written between", value=(first, last), min_value=first, max_value=last, key="search_dates"
+    )
+    # Only a full, narrowed range filters; the whole diary needs no bounds.
+    date_range = tuple(dates) if len(dates) == 2 and tuple(dates) != (first, last) else None
+
+    if not query.strip():
+        return
+
+    results = read_model.search_entries(query.strip(), SEARCH_RESULT_LIMIT, date_range)
+    if not results:
+        st.markdown("*No entries match every word of that search.*")
+        return
+
+    noun = "entry" if len(results) == 1 else "entries"
+    st.markdown(f"<small>{len(results)} {noun}, best match first</small>", unsafe_allow_html=True)
+    for result in results:
+        written = datetime.fromisoformat(result["created_at"]).strftime("%d %b %Y, %H:%M")
+        st.markdown(
+            f'<div class="search-result"><small>{written}</small><br>{highlighted(result["snippet"])}</div>',
+            unsafe_allow_html=True
+        )
+        with st.expander("Read the full entry"):
+            st.text(result["content"])
+
+
 # ── Router ────────────────────────────────────────────────────────────────────
 
 phase = st.session_state.phase
 
-if phase == "onboarding":
-    render_onboarding()
-elif phase == "journaling":
-    render_journaling()
-elif phase == "past_self":
-    render_past_self()
+with tracing.request(phase):
+    if phase == "onboarding":
+        render_onboarding()
+    elif phase == "journaling":
+        render_journaling()
+    elif phase == "past_self":
+        render_past_self()
+    elif phase == "search":
+        render_search()
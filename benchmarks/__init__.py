@@ -0,0 +1,12 @@
+"""
+benchmarks
+----------
+Offline performance benchmarks for AI of Memories: memories_db and the prompt
+assembly in ai_engine, run against seeded synthetic diaries of 1k to 1M
+entries (see synthetic.py). No API calls are made.
+
+    python -m benchmarks run --scale 100k
+    python -m benchmarks compare benchmarks/results/before.json benchmarks/results/after.json
+
+Results are JSON files in pytest-benchmark's layout, one per run.
+"""
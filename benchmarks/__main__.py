@@ -0,0 +1,54 @@
+"""
+Run the benchmarks or compare two result files:
+
+    python -m benchmarks run --scale 10k
+    python -m benchmarks run --scale 100k --select search --output before.json
+    python -m benchmarks compare before.json after.json
+"""
+
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks import harness, synthetic
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="AI of Memories benchmarks.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the suites against a synthetic diary")
+    run.add_argument("--scale", choices=synthetic.SCALES, default="10k")
+    run.add_argument("--seed", type=int, default=synthetic.DEFAULT_SEED)
+    run.add_argument("--select", default="", help="only benchmarks whose name contains this")
+    run.add_argument("--min-time", type=float, default=harness.MIN_TIME_SECONDS,
+                     help="seconds to spend timing each benchmark")
+    run.add_argument("--output", type=Path, help="results file (default: benchmarks/results/…)")
+
+    compare = commands.add_parser("compare", help="compare two results files")
+    compare.add_argument("baseline", type=Path)
+    compare.add_argument("current", type=Path)
+    compare.add_argument("--threshold", type=float, default=0.10,
+                         help="slowdown counted as a regression (default 0.10 = 10%%)")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        return 1 if harness.compare(args.baseline, args.current, args.threshold) else 0
+
+    print(f"Preparing the {args.scale} diary (seed {args.seed})…")
+    diary = synthetic.Diary(args.scale, args.seed)
+    try:
+        results = harness.run(harness.collect(select=args.select), diary, args.min_time)
+    finally:
+        diary.close()
+    params = {"scale": args.scale, "seed": args.seed}
+    output = args.output or RESULTS_DIR / f"{args.scale}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    print(f"Saved {harness.save(results, output, params)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
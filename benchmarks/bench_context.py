@@ -0,0 +1,70 @@
+"""
+benchmarks/bench_context.py
+---------------------------
+Prompt assembly in ai_engine, without calling the model: knowledge context
+selection, Past Self retrieval and the full journaling and Past Self prompts.
+"""
+
+import ai_engine as ai
+import memories_db as db
+import retrieval
+
+
+def _knowledge(mode: str, message: str) -> str:
+    return ai.knowledge_text(mode, db.get_tag_stats(), message, snapshot=db.get_knowledge_summary())
+
+
+def bench_knowledge_text_journaling(benchmark, diary):
+    diary.use()
+    content, _ = diary.new_entry()
+    benchmark(_knowledge, "journaling", content)
+
+
+def bench_knowledge_text_past_self(benchmark, diary):
+    diary.use()
+    benchmark(_knowledge, "past_self", diary.questions()[0])
+
+
+def bench_find_relevant_entries(benchmark, diary):
+    diary.use()
+    questions = diary.questions()
+    benchmark(lambda: [retrieval.find_relevant_entries(q) for q in questions])
+
+
+def bench_entries_for_past_self(benchmark, diary):
+    diary.use()
+    questions = diary.questions()
+    benchmark(lambda: [retrieval.entries_for_past_self(q) for q in questions])
+
+
+def _history(turns: int) -> list[dict]:
+    return [
+        {"role": "user" if i % 2 == 0 else "model", "content": f"turn {i}: " + "palabras " * 40}
+        for i in range(turns)
+    ]
+
+
+def bench_journaling_prompt(benchmark, diary):
+    diary.use()
+    content, _ = diary.new_entry()
+    profile, history = db.get_profile(), _history(12)
+
+    def assemble():
+        knowledge = _knowledge("journaling", content)
+        return ai._journaling_prompt(content, profile, history, knowledge)
+
+    benchmark(assemble)
+
+
+def bench_past_self_prompt(benchmark, diary):
+    diary.use()
+    question = diary.questions()[1]
+    profile, history = db.get_profile(), _history(12)
+
+    def assemble():
+        knowledge = _knowledge("past_self", question)
+        entries = retrieval.entries_for_past_self(question)
+        return ai._past_self_prompt(question, profile, knowledge, entries, history)
+
+    prompt = benchmark(assemble)
+    benchmark.extra_info["prompt_chars"] = sum(len(part) for part in (prompt.prefix, prompt.system, prompt.user_input))
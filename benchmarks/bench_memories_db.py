@@ -0,0 +1,98 @@
+"""
+benchmarks/bench_memories_db.py
+-------------------------------
+memories_db reads and writes at diary scale: saving entries and tags, full and
+paged entry loads, the sidebar's aggregations and the knowledge summary.
+"""
+
+import memories_db as db
+import read_model
+
+WRITE_ROUNDS = 200
+
+
+# ── Writes ────────────────────────────────────────────────────────────────────
+
+def bench_save_entry(benchmark, diary):
+    diary.use(scratch=True)
+    benchmark.pedantic(
+        db.save_entry,
+        setup=lambda: ((diary.new_entry()[0], "margin note"), {}),
+        rounds=WRITE_ROUNDS,
+    )
+
+
+def bench_save_tags(benchmark, diary):
+    diary.use(scratch=True)
+
+    def new_tagged_entry():
+        content, tags = diary.new_entry()
+        return (db.save_entry(content), tags), {}
+
+    benchmark.pedantic(db.save_tags, setup=new_tagged_entry, rounds=WRITE_ROUNDS)
+
+
+# ── Entry reads ───────────────────────────────────────────────────────────────
+
+def bench_get_all_entries(benchmark, diary):
+    diary.use()
+    benchmark(db.get_all_entries)
+
+
+def bench_iter_entries_first_page(benchmark, diary):
+    diary.use()
+    benchmark(lambda: list(db.iter_entries(limit=db.ENTRY_PAGE_SIZE)))
+
+
+def bench_get_entries_range_month(benchmark, diary):
+    diary.use()
+    first, _ = db.get_first_last_dates()
+    start = db.datetime.fromisoformat(first).date()
+    benchmark(lambda: list(db.get_entries_range(start, start + db.timedelta(days=30))))
+
+
+def bench_search_entries_selective(benchmark, diary):
+    diary.use()
+    benchmark(db.search_entries, diary.people(20)[-1])
+
+
+def bench_search_entries_common(benchmark, diary):
+    diary.use()
+    benchmark(db.search_entries, "today")
+
+
+# ── Knowledge graph and sidebar ───────────────────────────────────────────────
+
+def bench_get_knowledge_summary(benchmark, diary):
+    diary.use()
+    benchmark(db.get_knowledge_summary)
+
+
+def bench_get_tag_stats(benchmark, diary):
+    diary.use()
+    benchmark(db.get_tag_stats)
+
+
+def _sidebar():
+    # What the sidebar reads on every rerun.
+    return db.get_entry_count(), db.get_profile(), db.get_tag_snapshot()
+
+
+def bench_sidebar_aggregation(benchmark, diary):
+    diary.use()
+    benchmark(_sidebar)
+
+
+def _sidebar_cached():
+    return read_model.entry_count(), read_model.profile(), read_model.tag_snapshot()
+
+
+def bench_sidebar_aggregation_cached(benchmark, diary):
+    diary.use()
+    benchmark(_sidebar_cached)
+
+
+def bench_expand_tags(benchmark, diary):
+    diary.use()
+    seeds = [t["id"] for t in db.find_tags_in_text(diary.questions()[0])]
+    benchmark(db.expand_tags, seeds)
@@ -0,0 +1,174 @@
+"""
+benchmarks/harness.py
+---------------------
+A small pytest-benchmark-style timer, so the suites run with the standard
+library only. Suites are modules named bench_*.py with functions
+
+    def bench_something(benchmark, diary):
+        benchmark(function, *args)
+
+`benchmark(fn, ...)` calibrates the number of rounds to the time budget and
+records wall-clock statistics; `benchmark.pedantic(fn, setup=..., rounds=...)`
+runs a fresh setup before every round, for functions that write. Results are
+saved as JSON in pytest-benchmark's layout (machine_info, commit_info,
+benchmarks[].stats), so they can be compared between commits.
+"""
+
+import importlib
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+MIN_TIME_SECONDS = 0.5
+MIN_ROUNDS = 3
+MAX_ROUNDS = 1000
+SUITES = ("bench_memories_db", "bench_context")
+
+
+class Benchmark:
+    """The `benchmark` fixture passed to each bench_* function."""
+
+    def __init__(self, name: str, group: str, min_time: float = MIN_TIME_SECONDS, max_rounds: int = MAX_ROUNDS):
+        self.name = name
+        self.group = group
+        self.min_time = min_time
+        self.max_rounds = max_rounds
+        self.timings: list[float] = []
+        self.extra_info: dict = {}
+
+    def __call__(self, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)  # warm-up round, also used to calibrate
+        first = time.perf_counter() - start
+        rounds = max(MIN_ROUNDS, min(self.max_rounds, int(self.min_time / max(first, 1e-9))))
+        for _ in range(rounds):
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            self.timings.append(time.perf_counter() - start)
+        return result
+
+    def pedantic(self, fn, setup=None, rounds: int = MIN_ROUNDS):
+        """
+        Time `rounds` calls of fn(*args, **kwargs), where `setup()` returns the
+        (args, kwargs) for each call and isn't timed.
+        """
+        result = None
+        for _ in range(rounds):
+            args, kwargs = setup() if setup else ((), {})
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            self.timings.append(time.perf_counter() - start)
+        return result
+
+    def stats(self) -> dict:
+        timings = sorted(self.timings)
+        return {
+            "min": timings[0],
+            "max": timings[-1],
+            "mean": statistics.fmean(timings),
+            "median": statistics.median(timings),
+            "stddev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+            "p95": timings[min(len(timings) - 1, int(0.95 * len(timings)))],
+            "rounds": len(timings),
+            "ops": len(timings) / sum(timings) if sum(timings) else 0.0,
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "group": self.group,
+            "extra_info": self.extra_info,
+            "stats": self.stats(),
+        }
+
+
+# ── Running ───────────────────────────────────────────────────────────────────
+
+def collect(suites=SUITES, select: str = "") -> list[tuple[str, str, object]]:
+    """(suite, name, function) for every bench_* function whose name contains `select`."""
+    found = []
+    for suite in suites:
+        module = importlib.import_module(f"benchmarks.{suite}")
+        for name, fn in vars(module).items():
+            if name.startswith("bench_") and callable(fn) and select in name:
+                found.append((suite, name, fn))
+    return found
+
+
+def run(benchmarks, diary, min_time: float = MIN_TIME_SECONDS, report=print) -> list[Benchmark]:
+    results = []
+    for suite, name, fn in benchmarks:
+        bench = Benchmark(name, suite, min_time)
+        fn(bench, diary)
+        if not bench.timings:
+            continue
+        results.append(bench)
+        stats = bench.stats()
+        report(f"{name:<40} median {stats['median'] * 1000:10.3f} ms   "
+               f"p95 {stats['p95'] * 1000:10.3f} ms   rounds {stats['rounds']}")
+    return results
+
+
+def _commit_info() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(
+                ["git", *args], capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ""
+    return {
+        "id": git("rev-parse", "HEAD"),
+        "branch": git("rev-parse", "--abbrev-ref", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+    }
+
+
+def save(results: list[Benchmark], path: Path, params: dict) -> Path:
+    data = {
+        "machine_info": {
+            "python_version": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "sqlite_version": sqlite3.sqlite_version,
+        },
+        "commit_info": _commit_info(),
+        "datetime": datetime.now(timezone.utc).isoformat(),
+        "params": params,
+        "benchmarks": [bench.as_dict() for bench in results],
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    return path
+
+
+# ── Comparing ─────────────────────────────────────────────────────────────────
+
+def compare(baseline_path: Path, current_path: Path, threshold: float = 0.10, report=print) -> list[str]:
+    """
+    Print median times of two result files side by side. Returns the names of
+    benchmarks that got slower by more than `threshold` (0.10 = 10%).
+    """
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    current = json.loads(Path(current_path).read_text(encoding="utf-8"))
+    if baseline.get("params") != current.get("params"):
+        report(f"warning: different parameters {baseline.get('params')} vs {current.get('params')}")
+    before = {b["name"]: b["stats"]["median"] for b in baseline["benchmarks"]}
+    regressions = []
+    for bench in current["benchmarks"]:
+        name, after = bench["name"], bench["stats"]["median"]
+        if name not in before:
+            report(f"{name:<40} {'(new)':>12} {after * 1000:10.3f} ms")
+            continue
+        change = after / before[name] - 1 if before[name] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        report(f"{name:<40} {before[name] * 1000:10.3f} ms {after * 1000:10.3f} ms {change:+8.1%}{flag}")
+    return regressions
@@ -0,0 +1,286 @@
+"""
+benchmarks/load.py
+------------------
+Load driver: N concurrent simulated users replaying journaling and Past Self
+sessions against a synthetic diary, the way app.py runs them (knowledge
+context, streamed reply alongside tag extraction, saving the entry and tags,
+history compaction, Past Self retrieval), with the model answered by
+fake_backend. Reports p50/p95/p99 per step, plus our own overhead: the time
+a turn spends outside the model backend.
+
+    python -m benchmarks.load --users 8 --latency lognormal:0.8,0.4
+    python fake_backend.py serve --port 8765 &
+    python -m benchmarks.load --users 32 --backend http://127.0.0.1:8765 --output load.json
+
+Writes go to a scratch copy of the diary, and the response cache is off.
+The ai_engine scheduler runs as configured (see --rpm, --tpm and
+--max-concurrent), and --error-rate exercises its retries.
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import ai_engine as ai
+import fake_backend
+import memories_db as db
+import retrieval
+from benchmarks import synthetic
+
+API_KEY = "load-test"
+
+
+# ── Timing ────────────────────────────────────────────────────────────────────
+
+class TimedBackend:
+    """Wraps a backend and adds up, per thread, the time spent inside it."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.name = f"timed-{inner.name}"
+        self.supports_context_cache = inner.supports_context_cache
+        self._local = threading.local()
+
+    def elapsed(self) -> float:
+        return getattr(self._local, "elapsed", 0.0)
+
+    def _add(self, seconds: float):
+        self._local.elapsed = self.elapsed() + seconds
+
+    def _timed_stream(self, chunks):
+        iterator = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._add(time.perf_counter() - start)
+            yield chunk
+
+    def chat(self, mode, api_key, history, text, stream=False, cached_content=None):
+        start = time.perf_counter()
+        try:
+            response = self.inner.chat(mode, api_key, history, text, stream, cached_content)
+        finally:
+            self._add(time.perf_counter() - start)
+        return self._timed_stream(response) if stream else response
+
+    def generate(self, mode, api_key, prompt, generation_config=None):
+        start = time.perf_counter()
+        try:
+            return self.inner.generate(mode, api_key, prompt, generation_config)
+        finally:
+            self._add(time.perf_counter() - start)
+
+
+class Recorder:
+    """Latency samples and error counts per step, shared by all users."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    def add(self, step: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(step, []).append(seconds)
+
+    def error(self, step: str):
+        with self._lock:
+            self.errors[step] = self.errors.get(step, 0) + 1
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+# ── Sessions ──────────────────────────────────────────────────────────────────
+
+def _ai_history(memory: ai.HistoryManager) -> list[dict]:
+    return [
+        {"role": "user" if m["role"] == "user" else "model", "content": m["content"]}
+        for m in memory.recent()
+    ]
+
+
+def _stream(step: str, chunks, recorder: Recorder, started: float) -> str:
+    parts = []
+    for chunk in chunks:
+        if not parts:
+            recorder.add(f"{step}_first_chunk", time.perf_counter() - started)
+        parts.append(chunk)
+    return "".join(parts)
+
+
+def journaling_turn(entry: str, memory: ai.HistoryManager, backend: TimedBackend, recorder: Recorder):
+    started, model_before = time.perf_counter(), backend.elapsed()
+    profile = db.get_profile()
+    knowledge = ai.knowledge_text("journaling", db.get_tag_stats(), entry, snapshot=db.get_knowledge_summary())
+    extraction = ai.submit(ai.extract_knowledge_tags, api_key=API_KEY, entry=entry, strict=True)
+    try:
+        response = _stream("journaling", ai.stream_journaling_response(
+            API_KEY, entry, profile, _ai_history(memory), knowledge, memory.summary
+        ), recorder, started)
+    except Exception:
+        recorder.error("journaling")
+        response = ""
+    waited = time.perf_counter()
+    try:
+        tags = extraction.result()
+        recorder.add("extraction", time.perf_counter() - started)
+    except Exception:
+        recorder.error("extraction")
+        tags = None
+    waited = time.perf_counter() - waited
+
+    entry_id = db.save_entry(entry, response)
+    if tags:
+        db.save_tags(entry_id, tags)
+    memory.add("user", entry)
+    memory.add("assistant", response)
+    elapsed = time.perf_counter() - started
+    recorder.add("journaling_turn", elapsed)
+    recorder.add("journaling_overhead", elapsed - waited - (backend.elapsed() - model_before))
+
+    started = time.perf_counter()
+    try:
+        if memory.compact(API_KEY):
+            recorder.add("compaction", time.perf_counter() - started)
+    except Exception:
+        recorder.error("compaction")
+
+
+def past_self_turn(question: str, memory: ai.HistoryManager, backend: TimedBackend, recorder: Recorder):
+    started, model_before = time.perf_counter(), backend.elapsed()
+    knowledge = ai.knowledge_text("past_self", db.get_tag_stats(), question, snapshot=db.get_knowledge_summary())
+    entries = retrieval.entries_for_past_self(question)
+    recorder.add("past_self_retrieval", time.perf_counter() - started)
+    try:
+        response = _stream("past_self", ai.stream_past_self_response(
+            API_KEY, question, db.get_profile(), knowledge, entries, _ai_history(memory), memory.summary
+        ), recorder, started)
+    except Exception:
+        recorder.error("past_self")
+        response = ""
+    memory.add("user", question)
+    memory.add("assistant", response)
+    elapsed = time.perf_counter() - started
+    recorder.add("past_self_turn", elapsed)
+    recorder.add("past_self_overhead", elapsed - (backend.elapsed() - model_before))
+
+
+def run_user(diary: synthetic.Diary, args, backend: TimedBackend, recorder: Recorder, lock: threading.Lock):
+    for _ in range(args.sessions):
+        journal = ai.HistoryManager("their journaling companion")
+        for _ in range(args.journal_turns):
+            with lock:  # the sample stream isn't thread-safe
+                entry, _ = diary.new_entry()
+            journaling_turn(entry, journal, backend, recorder)
+        past_self = ai.HistoryManager("a simulation of their past self")
+        for question in diary.questions()[:args.past_self_turns]:
+            past_self_turn(question, past_self, backend, recorder)
+
+
+# ── Report ────────────────────────────────────────────────────────────────────
+
+def summarize(recorder: Recorder, wall_seconds: float) -> dict:
+    steps = {}
+    for step, values in sorted(recorder.samples.items()):
+        steps[step] = {
+            "count": len(values),
+            "errors": recorder.errors.get(step, 0),
+            "mean": statistics.fmean(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": max(values),
+        }
+    for step, count in recorder.errors.items():
+        steps.setdefault(step, {"count": 0, "errors": count})
+    turns = sum(len(v) for k, v in recorder.samples.items() if k.endswith("_turn"))
+    return {"wall_seconds": wall_seconds, "turns_per_second": turns / wall_seconds, "steps": steps}
+
+
+def print_report(summary: dict):
+    print(f"\n{'step':<28}{'count':>7}{'errors':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for step, s in summary["steps"].items():
+        if not s["count"]:
+            print(f"{step:<28}{0:>7}{s['errors']:>7}")
+            continue
+        print(f"{step:<28}{s['count']:>7}{s['errors']:>7}"
+              + "".join(f"{s[k] * 1000:>10.1f}" for k in ("p50", "p95", "p99", "max")))
+    print(f"\n{summary['turns_per_second']:.2f} turns/s over {summary['wall_seconds']:.1f}s")
+    if "scheduler" in summary:
+        s = summary["scheduler"]
+        print(f"scheduler: {s['requests']} requests, {s['retries']} retries, {s['waited_seconds']:.1f}s spent queued")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=8, help="concurrent simulated users")
+    parser.add_argument("--sessions", type=int, default=1, help="sessions per user")
+    parser.add_argument("--journal-turns", type=int, default=4)
+    parser.add_argument("--past-self-turns", type=int, default=3)
+    parser.add_argument("--scale", choices=synthetic.SCALES, default="1k")
+    parser.add_argument("--seed", type=int, default=synthetic.DEFAULT_SEED)
+    parser.add_argument("--backend", default="fake", help="fake (in-process) or the URL of a fake_backend server")
+    parser.add_argument("--latency", default=fake_backend.DEFAULT_LATENCY)
+    parser.add_argument("--chunk-delay", default=fake_backend.DEFAULT_CHUNK_DELAY)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=ai.RATE_LIMIT_RPM, help="scheduler requests per minute (0 = no limit)")
+    parser.add_argument("--tpm", type=int, default=ai.RATE_LIMIT_TPM, help="scheduler prompt tokens per minute")
+    parser.add_argument("--max-concurrent", type=int, default=ai.MAX_CONCURRENT_REQUESTS)
+    parser.add_argument("--output", type=Path, help="also save the summary as JSON")
+    args = parser.parse_args(argv)
+
+    if args.backend == "fake":
+        inner = fake_backend.FakeBackend(fake_backend.FakeConfig(
+            latency=args.latency, chunk_delay=args.chunk_delay, error_rate=args.error_rate, seed=args.seed,
+        ))
+    else:
+        inner = fake_backend.HttpBackend(args.backend)
+    backend = TimedBackend(inner)
+    previous = ai.set_backend(backend)
+    ai.scheduler = ai.Scheduler(args.max_concurrent, args.rpm, args.tpm)
+    ai.response_cache = ai.ResponseCache(
+        Path(tempfile.mkdtemp()) / "cache.db", ai.CACHE_MAX_ENTRIES, set(), ai.CACHE_TTL_SECONDS
+    )
+
+    diary = synthetic.Diary(args.scale, args.seed)
+    diary.use(scratch=True)
+    recorder, lock = Recorder(), threading.Lock()
+    print(f"{args.users} users × {args.sessions} session(s) on the {args.scale} diary, backend {inner.name}")
+    started = time.perf_counter()
+    users = [
+        threading.Thread(target=run_user, args=(diary, args, backend, recorder, lock), name=f"user-{i}")
+        for i in range(args.users)
+    ]
+    try:
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+    finally:
+        ai.set_backend(previous)
+        diary.close()
+
+    summary = summarize(recorder, time.perf_counter() - started)
+    summary["params"] = {k: str(v) for k, v in vars(args).items() if k != "output"}
+    summary["scheduler"] = ai.scheduler.stats()
+    print_report(summary)
+    if args.output:
+        args.output.write_text(json.dumps(summary, indent=2), encoding="utf-8")
+        print(f"Saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
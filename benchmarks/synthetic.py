@@ -0,0 +1,312 @@
+"""
+benchmarks/synthetic.py
+-----------------------
+Seeded synthetic diaries for the benchmarks.
+Entries are written in English, Spanish or a mix of both, and come with tags of
+all five knowledge graph types drawn from the same vocabulary as the text, so
+full-text search, tag lookups and the co-occurrence graph see realistic data.
+People follow a Zipf-like distribution (family and a few friends show up in
+most entries, everyone else rarely), and the pool of people grows with the
+size of the diary.
+
+A diary is built by writing the original (schema v1) tables and letting
+memories_db.init_db() migrate them, so the resulting database is exactly what
+a long-lived installation would have. Built diaries are cached by scale and
+seed, as the larger ones take a while:
+
+    python -m benchmarks.synthetic 100k --seed 7
+"""
+
+import argparse
+import bisect
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+from itertools import accumulate
+from pathlib import Path
+
+import memories_db as db
+import read_model
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+DEFAULT_SEED = 7
+DATA_DIR = Path(__file__).parent / ".data"
+
+START_DATE = datetime(2015, 1, 1, 8, 0)
+SPAN_DAYS = 10 * 365
+LANGUAGE_WEIGHTS = {"en": 0.45, "es": 0.45, "mix": 0.10}
+INSERT_CHUNK = 10_000
+
+PROFILE = {
+    "name_and_life_stage": "Alex, 34, moving between Madrid and London",
+    "foundational_memory": "Summers at my grandmother's house by the sea",
+    "linguistic_style": "Short sentences, switches between English and Spanish",
+    "onboarding_complete": "true",
+}
+
+FIRST_NAMES = """
+Ana Luis Marta Pablo Lucía Javier Sara Diego Elena Carlos Laura Miguel Paula Andrés
+Sofía Daniel Clara Hugo Irene Mario Emma Jack Olivia Noah Chloe Liam Grace Oliver
+Isla Leo Zoe Adam Ruby Finn Nora Theo Alice Sam Maya Tom Iris Jorge Nuria Raúl
+""".split()
+SURNAMES = """
+García Martínez López Sánchez Pérez Gómez Fernández Ruiz Díaz Moreno Álvarez
+Romero Navarro Torres Smith Jones Taylor Brown Wilson Evans Walker Wright Hughes
+Green Hall Clarke Patel Murphy Baker
+""".split()
+
+FAMILY = {
+    "en": ["Mom", "my dad", "Grandma", "my brother", "my sister"],
+    "es": ["mamá", "mi papá", "la abuela", "mi hermano", "mi hermana"],
+}
+PLACES = {
+    "en": ["the park", "the office", "the beach", "the gym", "the library", "the market",
+           "the hospital", "the station", "the old café", "the river", "the airport", "home"],
+    "es": ["el parque", "la oficina", "la playa", "el gimnasio", "la biblioteca", "el mercado",
+           "el hospital", "la estación", "el café de siempre", "el río", "el aeropuerto", "casa"],
+}
+ACTIVITIES = {
+    "en": ["went for a run", "had dinner", "had a long talk", "argued", "cooked together",
+           "watched a film", "went shopping", "had coffee", "took a walk", "studied", "worked late",
+           "celebrated a birthday", "visited a doctor", "packed for a trip"],
+    "es": ["salí a correr", "cené", "tuve una larga charla", "discutí", "cocinamos juntos",
+           "vimos una película", "fui de compras", "tomé un café", "di un paseo", "estudié",
+           "trabajé hasta tarde", "celebramos un cumpleaños", "fui al médico", "hice la maleta"],
+}
+FEELINGS = {
+    "en": ["anxious", "happy", "tired", "grateful", "angry", "calm", "lonely", "excited", "sad", "proud"],
+    "es": ["ansioso", "feliz", "cansado", "agradecido", "enfadado", "tranquilo", "solo",
+           "emocionado", "triste", "orgulloso"],
+}
+TRIGGERS = {
+    "en": ["work deadlines", "money", "the move", "my health", "the exams", "family plans",
+           "the weather", "a message I got", "the news", "my future"],
+    "es": ["los plazos del trabajo", "el dinero", "la mudanza", "mi salud", "los exámenes",
+           "los planes familiares", "el tiempo", "un mensaje que recibí", "las noticias", "mi futuro"],
+}
+BELIEFS = {
+    "en": ["family comes first", "I have to earn rest", "people leave eventually",
+           "hard work always pays off", "I am not good enough", "small things matter most"],
+    "es": ["la familia es lo primero", "el descanso hay que ganárselo", "la gente acaba yéndose",
+           "el esfuerzo siempre compensa", "no soy suficiente", "las cosas pequeñas son las que importan"],
+}
+PHRASES = {
+    "en": ["to be honest", "whatever", "I guess", "anyway", "you know"],
+    "es": ["la verdad", "en fin", "o sea", "bueno", "ya ves"],
+}
+FILLER = {
+    "en": [
+        "The day started slowly and the light through the window was grey.",
+        "I keep thinking about what was said last week.",
+        "Lunch was quick, I ate standing up again.",
+        "The city felt louder than usual today.",
+        "I wrote a list of things to fix and crossed off only one.",
+        "Music helped a little on the way back.",
+        "There was a moment in the afternoon when everything felt fine.",
+        "I should sleep earlier, I say this every night.",
+        "It rained for an hour and then the sun came out as if nothing happened.",
+        "I called nobody and nobody called me. 🙂",
+    ],
+    "es": [
+        "El día empezó despacio y la luz de la ventana era gris.",
+        "Sigo pensando en lo que se dijo la semana pasada.",
+        "Comí rápido, otra vez de pie en la cocina.",
+        "La ciudad estaba más ruidosa que de costumbre.",
+        "Hice una lista de cosas pendientes y solo taché una.",
+        "La música me ayudó un poco en el camino de vuelta.",
+        "Hubo un momento por la tarde en que todo parecía estar bien.",
+        "Debería dormir antes, lo digo todas las noches.",
+        "Llovió una hora y luego salió el sol como si nada.",
+        "No llamé a nadie y nadie me llamó. 🙂",
+    ],
+}
+TEMPLATES = {
+    "en": ("Today I {activity} at {place} with {person}.", "I felt {feeling} about {trigger}.",
+           "{phrase}, {belief}."),
+    "es": ("Hoy {activity} en {place} con {person}.", "Me sentí {feeling} por {trigger}.",
+           "{phrase}, {belief}."),
+}
+
+
+class DiaryGenerator:
+    """
+    Deterministic stream of (content, created_at, tags) for `n_entries`
+    entries: the same seed and size always produce the same diary.
+    """
+
+    def __init__(self, n_entries: int, seed: int = DEFAULT_SEED):
+        self.n_entries = n_entries
+        self.rng = random.Random(seed)
+        pool_size = max(20, int(4 * n_entries ** 0.5))
+        names = [f"{first} {last}" for last in SURNAMES for first in FIRST_NAMES]
+        self.rng.shuffle(names)
+        self.people = names[:pool_size]
+        self.people_weights = list(accumulate(1 / (rank + 1) for rank in range(len(self.people))))
+
+    def _zipf_person(self) -> str:
+        point = self.rng.random() * self.people_weights[-1]
+        return self.people[bisect.bisect_left(self.people_weights, point)]
+
+    def _entry(self, language: str) -> tuple[str, list[dict]]:
+        rng = self.rng
+        lang = rng.choice(("en", "es")) if language == "mix" else language
+        other = "es" if lang == "en" else "en"
+
+        person = rng.choice(FAMILY[lang]) if rng.random() < 0.3 else self._zipf_person()
+        place = rng.choice(PLACES[lang])
+        activity = rng.choice(ACTIVITIES[lang])
+        feeling, trigger = rng.choice(FEELINGS[lang]), rng.choice(TRIGGERS[lang])
+        phrase, belief = rng.choice(PHRASES[lang]), rng.choice(BELIEFS[lang])
+
+        opening, mood, closing = TEMPLATES[lang]
+        filler_language = other if language == "mix" else lang
+        sentences = [opening.format(activity=activity, place=place, person=person)]
+        sentences += rng.sample(FILLER[filler_language], rng.randint(1, 6))
+        sentences.append(mood.format(feeling=feeling, trigger=trigger))
+        with_belief = rng.random() < 0.25
+        if with_belief:
+            sentences.append(closing.format(phrase=phrase, belief=belief).capitalize())
+        if rng.random() < 0.3:
+            sentences.append(f"{self._zipf_person()} {'called' if lang == 'en' else 'llamó'}.")
+
+        tags = [
+            {"type": "Event", "value": f"{activity} {'at' if lang == 'en' else 'en'} {place}"},
+            {"type": "Entity", "value": person},
+            {"type": "Entity", "value": place},
+            {"type": "Sentiment/Trigger", "value": f"{feeling}: {trigger}"},
+        ]
+        if with_belief:
+            tags += [{"type": "Core Belief", "value": belief}, {"type": "Syntax", "value": phrase}]
+        return " ".join(sentences), tags
+
+    def __iter__(self):
+        step = timedelta(days=SPAN_DAYS) / self.n_entries
+        languages, weights = list(LANGUAGE_WEIGHTS), list(LANGUAGE_WEIGHTS.values())
+        for i in range(self.n_entries):
+            created_at = START_DATE + step * i + timedelta(seconds=self.rng.randrange(60))
+            content, tags = self._entry(self.rng.choices(languages, weights)[0])
+            yield content, created_at.isoformat(), tags
+
+
+def build_diary(path: Path, n_entries: int, seed: int = DEFAULT_SEED) -> Path:
+    """Write a synthetic diary to `path` (which must not exist) and migrate it to the current schema."""
+    conn = sqlite3.connect(path)
+    db._migrate_v1(conn)
+    rows, tag_rows = [], []
+    entry_id = 0
+    for content, created_at, tags in DiaryGenerator(n_entries, seed):
+        entry_id += 1
+        rows.append((entry_id, content, "", created_at))
+        tag_rows += [(entry_id, t["type"], t["value"], created_at) for t in tags]
+        if len(rows) >= INSERT_CHUNK:
+            _insert(conn, rows, tag_rows)
+            rows, tag_rows = [], []
+    _insert(conn, rows, tag_rows)
+    now = datetime.now().isoformat()
+    conn.executemany(
+        "INSERT INTO profile (key, value, updated_at) VALUES (?, ?, ?)",
+        [(key, value, now) for key, value in PROFILE.items()]
+    )
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    conn.close()
+
+    previous = db.DB_PATH
+    db.DB_PATH = path
+    try:
+        db.init_db()
+        db.close_connections()
+    finally:
+        db.DB_PATH = previous
+    return path
+
+
+def _insert(conn: sqlite3.Connection, rows: list[tuple], tag_rows: list[tuple]):
+    conn.executemany(
+        "INSERT INTO journal_entries (id, content, ai_response, created_at) VALUES (?, ?, ?, ?)", rows
+    )
+    conn.executemany(
+        "INSERT INTO knowledge_graph (entry_id, tag_type, tag_value, created_at) VALUES (?, ?, ?, ?)", tag_rows
+    )
+
+
+def diary_path(scale: str, seed: int = DEFAULT_SEED, data_dir: Path = DATA_DIR) -> Path:
+    """The cached diary for a scale ("1k" … "1m") and seed, built on first use."""
+    path = data_dir / f"diary-{scale}-seed{seed}-v{db.SCHEMA_VERSION}.db"
+    if not path.exists():
+        data_dir.mkdir(parents=True, exist_ok=True)
+        building = path.with_suffix(".building")
+        if building.exists():
+            building.unlink()
+        build_diary(building, SCALES[scale], seed)
+        os.replace(building, path)
+    return path
+
+
+# ── Fixture ───────────────────────────────────────────────────────────────────
+
+class Diary:
+    """
+    The `diary` fixture passed to each benchmark: a cached synthetic diary,
+    plus fresh entries and questions in the same style for write and query
+    benchmarks. Writes go to a scratch copy, so the cached diary stays as built.
+    """
+
+    def __init__(self, scale: str, seed: int = DEFAULT_SEED, data_dir: Path = DATA_DIR):
+        self.scale, self.seed = scale, seed
+        self.n_entries = SCALES[scale]
+        self.path = diary_path(scale, seed, data_dir)
+        self._scratch: Path | None = None
+        self._generator = DiaryGenerator(self.n_entries, seed)
+        self._samples = iter(DiaryGenerator(10**9, seed + 1))
+
+    def use(self, scratch: bool = False):
+        """Point memories_db (and its read caches) at this diary or its scratch copy."""
+        path = self.scratch_path() if scratch else self.path
+        if db.DB_PATH != path:
+            db.DB_PATH = path
+            read_model.invalidate()
+            db.init_db()
+
+    def scratch_path(self) -> Path:
+        if self._scratch is None:
+            self._scratch = Path(tempfile.mkdtemp(prefix="diary-bench-")) / self.path.name
+            shutil.copyfile(self.path, self._scratch)
+        return self._scratch
+
+    def close(self):
+        db.close_connections()
+        if self._scratch is not None:
+            shutil.rmtree(self._scratch.parent, ignore_errors=True)
+            self._scratch = None
+
+    def new_entry(self) -> tuple[str, list[dict]]:
+        """A new (content, tags) pair in the style of the diary."""
+        content, _, tags = next(self._samples)
+        return content, tags
+
+    def people(self, k: int) -> list[str]:
+        """The k people written about most often."""
+        return self._generator.people[:k]
+
+    def questions(self) -> list[str]:
+        """Past Self questions, from a specific person to small talk."""
+        first, second = self.people(2)
+        return [
+            f"¿Qué hice con {first} en la playa?",
+            f"What did {second} and I argue about?",
+            "How did I feel about money back then?",
+            "¿Qué pensaba de mi mamá?",
+            "hola, ¿cómo estás?",
+        ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a cached synthetic diary.")
+    parser.add_argument("scale", choices=SCALES)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+    print(diary_path(args.scale, args.seed))
@@ -0,0 +1,210 @@
+"""
+context_builder.py
+------------------
+Relevance-ranked, token-budgeted knowledge context for AI prompts.
+Instead of pasting every knowledge graph tag into a prompt, tags are scored
+against the current message (lexical overlap, recency, frequency and tag type)
+and packed into a fixed token budget. Everything runs locally.
+"""
+
+import math
+import os
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import datetime
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("KNOWLEDGE_TOKEN_BUDGET", "600"))
+
+DEFAULT_TYPE_WEIGHTS = {
+    "Entity": 1.0,
+    "Event": 0.9,
+    "Core Belief": 0.9,
+    "Sentiment/Trigger": 0.8,
+    "Syntax": 0.6,
+}
+UNKNOWN_TYPE_WEIGHT = 0.5
+
+# Relative weight of each signal in a tag's score.
+LEXICAL_WEIGHT = 0.55
+RECENCY_WEIGHT = 0.25
+FREQUENCY_WEIGHT = 0.20
+RECENCY_HALF_LIFE_DAYS = 45
+
+EMPTY_CONTEXT = "No memories recorded yet."
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+# Short function words in the languages users journal in most (EN / ES).
+STOPWORDS = frozenset("""
+a an and are as at be but by for from had has have he her him his i if in is it its
+me my of on or our she so that the their them they this to was we were what when
+who why with you your
+al con de del el ella en es esta este la las lo los me mi mis no por que se su sus
+te tu un una y yo
+""".split())
+
+
+# ── Tokens ────────────────────────────────────────────────────────────────────
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local token estimate (no API call). Roughly one token per short word
+    or punctuation mark, one more per ~6 extra characters in longer words, and
+    one per character for scripts written without spaces (CJK).
+    """
+    if not text:
+        return 0
+    tokens = 0
+    for piece in _TOKEN_PIECE_RE.findall(text):
+        if len(piece) > 1 and not piece.isascii() and _is_unspaced_script(piece):
+            tokens += len(piece)
+        else:
+            tokens += 1 + (len(piece) - 1) // 6
+    return tokens
+
+
+def _is_unspaced_script(word: str) -> bool:
+    return any("぀" <= ch <= "鿿" or "가" <= ch <= "힯" for ch in word)
+
+
+def normalize_text(text: str) -> str:
+    """Casefold and strip accents so "Mamá" and "mama" compare equal."""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> list[str]:
+    """Normalized content words of `text`, stopwords removed."""
+    return [w for w in _WORD_RE.findall(normalize_text(text)) if w not in STOPWORDS]
+
+
+# ── Scoring ───────────────────────────────────────────────────────────────────
+
+def _stem(word: str) -> str:
+    # A crude prefix stem is enough to match "running"/"run", "amigos"/"amigo".
+    return word[:5]
+
+
+def _lexical_overlap(message_stems: set[str], value: str) -> float:
+    stems = {_stem(w) for w in tokenize(value)}
+    if not stems or not message_stems:
+        return 0.0
+    return len(stems & message_stems) / len(stems)
+
+
+def _parse_time(value) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def score_tags(
+    tags: list[dict],
+    message: str,
+    now: datetime | None = None,
+    type_weights: dict[str, float] | None = None,
+) -> list[tuple[float, dict]]:
+    """
+    Score tags against `message`, best first.
+    Each tag: {"tag_type", "tag_value"} plus optional "mentions" and "last_seen"
+    (as returned by memories_db.get_tag_stats()).
+    """
+    now = now or datetime.now()
+    weights = type_weights or DEFAULT_TYPE_WEIGHTS
+    message_stems = {_stem(w) for w in tokenize(message)}
+    max_mentions = max((t.get("mentions") or 1 for t in tags), default=1)
+    freq_norm = math.log1p(max_mentions)
+
+    scored = []
+    for position, tag in enumerate(tags):
+        lexical = _lexical_overlap(message_stems, tag["tag_value"])
+
+        last_seen = _parse_time(tag.get("last_seen") or tag.get("created_at"))
+        if last_seen is None:
+            recency = 0.0
+        else:
+            age_days = max((now - last_seen).total_seconds() / 86400, 0.0)
+            recency = 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+
+        frequency = math.log1p(tag.get("mentions") or 1) / freq_norm if freq_norm else 0.0
+
+        score = weights.get(tag["tag_type"], UNKNOWN_TYPE_WEIGHT) * (
+            LEXICAL_WEIGHT * lexical + RECENCY_WEIGHT * recency + FREQUENCY_WEIGHT * frequency
+        )
+        scored.append((score, position, tag))
+
+    # Ties keep first-seen order so the output is deterministic.
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [(score, tag) for score, _, tag in scored]
+
+
+# ── Packing ───────────────────────────────────────────────────────────────────
+
+@dataclass
+class KnowledgeContext:
+    """A packed knowledge context plus a record of what didn't fit."""
+    text: str
+    tokens: int
+    budget: int
+    included: list[dict] = field(default_factory=list)
+    dropped: list[dict] = field(default_factory=list)
+
+    def report(self) -> dict:
+        return {
+            "tokens": self.tokens,
+            "budget": self.budget,
+            "included": len(self.included),
+            "dropped": len(self.dropped),
+            "dropped_tags": [(t["tag_type"], t["tag_value"]) for t in self.dropped],
+        }
+
+
+def _render(included: list[dict]) -> str:
+    grouped: dict[str, list[str]] = {}
+    for tag in included:
+        grouped.setdefault(tag["tag_type"], []).append(tag["tag_value"])
+    return "\n".join(f"[{tag_type}]: {' | '.join(values)}" for tag_type, values in grouped.items())
+
+
+def build_knowledge_context(
+    tags: list[dict],
+    message: str,
+    budget_tokens: int | None = None,
+    now: datetime | None = None,
+    type_weights: dict[str, float] | None = None,
+) -> KnowledgeContext:
+    """
+    Pick the tags most relevant to `message` that fit in `budget_tokens`, and
+    render them in the same "[Type]: a | b" format as the full knowledge summary.
+    Groups keep the tags' original (first-seen) order.
+    """
+    budget = DEFAULT_TOKEN_BUDGET if budget_tokens is None else budget_tokens
+    if not tags:
+        return KnowledgeContext(EMPTY_CONTEXT, estimate_tokens(EMPTY_CONTEXT), budget)
+
+    order = {id(tag): i for i, tag in enumerate(tags)}
+    used = 0
+    seen_types: set[str] = set()
+    included, dropped = [], []
+    for _, tag in score_tags(tags, message, now=now, type_weights=type_weights):
+        # " | " separator (or "[Type]: " header and newline for a new group)
+        cost = estimate_tokens(tag["tag_value"]) + 1
+        if tag["tag_type"] not in seen_types:
+            cost += estimate_tokens(f"[{tag['tag_type']}]:") + 1
+        if used + cost > budget:
+            dropped.append(tag)
+            continue
+        used += cost
+        seen_types.add(tag["tag_type"])
+        included.append(tag)
+
+    included.sort(key=lambda t: order[id(t)])
+    text = _render(included) if included else ""
+    return KnowledgeContext(text, estimate_tokens(text), budget, included, dropped)
@@ -0,0 +1,239 @@
+"""
+extraction_worker.py
+--------------------
+Background tag extraction for AI of Memories.
+Entries whose knowledge graph tags couldn't be extracted right away are queued
+in the `jobs` table (memories_db) and processed here by a small pool of worker
+threads, in batches of up to ai_engine.MAX_BATCH_ENTRIES entries per request,
+with exponential backoff between attempts. Jobs are keyed by entry id, so an
+entry is never tagged twice. A claimed batch's lease is renewed while it
+waits for the model, however long the scheduler queue makes that.
+
+Backfill entries that have no tags yet (uses GEMINI_API_KEY from .env):
+    python extraction_worker.py backfill --workers 4
+"""
+
+import argparse
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+import memories_db as db
+import ai_engine as ai
+import tracing
+
+log = logging.getLogger(__name__)
+
+EXTRACT_TAGS = "extract_tags"
+
+WORKER_COUNT = int(os.getenv("EXTRACTION_WORKERS", "2"))
+MAX_ATTEMPTS = 6
+BASE_RETRY_SECONDS = 5.0
+MAX_RETRY_SECONDS = 15 * 60.0
+LEASE_SECONDS = 120.0
+LEASE_RENEW_SECONDS = LEASE_SECONDS / 3
+POLL_SECONDS = 5.0
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter: ~5s, 10s, 20s, … capped at 15 minutes."""
+    delay = min(BASE_RETRY_SECONDS * 2 ** (attempts - 1), MAX_RETRY_SECONDS)
+    return delay * random.uniform(0.5, 1.5)
+
+
+def process_jobs(api_key: str, jobs: list[dict]):
+    """Extract and save tags for a list of claimed jobs, recording each outcome."""
+    with tracing.request("extraction_batch", jobs=len(jobs)), _leased(jobs):
+        _process_jobs(api_key, jobs)
+
+
+@contextmanager
+def _leased(jobs: list[dict]):
+    """Keep renewing the jobs' lease until the block exits, so no other worker reclaims them."""
+    done = threading.Event()
+    entry_ids = [job["entry_id"] for job in jobs]
+
+    def renew():
+        while not done.wait(LEASE_RENEW_SECONDS):
+            try:
+                db.renew_jobs(EXTRACT_TAGS, entry_ids, LEASE_SECONDS)
+            except Exception:
+                log.exception("extraction worker: could not renew the lease of %d jobs", len(entry_ids))
+
+    thread = threading.Thread(target=renew, name="extraction-lease", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def _process_jobs(api_key: str, jobs: list[dict]):
+    attempts, entries = {}, []
+    for job in jobs:
+        entry = db.get_entry(job["entry_id"])
+        if entry is None:
+            db.fail_job(EXTRACT_TAGS, job["entry_id"], "entry no longer exists", retry_at=None)
+            continue
+        attempts[entry["id"]] = job["attempts"]
+        entries.append((entry["id"], entry["content"]))
+
+    # Nobody is waiting on these: interactive replies go first.
+    with ai.background():
+        results, errors = ai.extract_knowledge_tags_batch(api_key, entries)
+
+    for entry_id, tags in results.items():
+        # save_tags is idempotent per entry, so a job re-run after a crash
+        # between these two calls doesn't duplicate anything.
+        if tags:
+            db.save_tags(entry_id=entry_id, tags=tags)
+        db.complete_job(EXTRACT_TAGS, entry_id)
+    for entry_id, e in errors.items():
+        if attempts[entry_id] >= MAX_ATTEMPTS:
+            retry_at = None
+        else:
+            retry_at = datetime.now() + timedelta(seconds=retry_delay(attempts[entry_id]))
+        db.fail_job(EXTRACT_TAGS, entry_id, f"{type(e).__name__}: {e}", retry_at)
+
+
+def _claim_batch() -> list[dict]:
+    return db.claim_jobs(EXTRACT_TAGS, limit=ai.MAX_BATCH_ENTRIES, lease_seconds=LEASE_SECONDS)
+
+
+class ExtractionWorker:
+    """A pool of threads draining the extraction queue until stopped."""
+
+    def __init__(self, api_key: str, workers: int = WORKER_COUNT):
+        self.api_key = api_key
+        self.workers = max(1, workers)
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self):
+        if self.is_alive():
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"extraction-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def is_alive(self) -> bool:
+        return any(t.is_alive() for t in self._threads)
+
+    def wake(self):
+        """Check the queue now instead of at the next poll."""
+        self._wake.set()
+
+    def stop(self, timeout: float | None = None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                self._step()
+            except Exception:
+                # The thread must outlive a bad batch or a locked database; the
+                # batch's jobs are claimed again once their lease runs out.
+                failures += 1
+                log.exception("extraction worker: iteration failed (%d in a row)", failures)
+                self._stop.wait(retry_delay(failures))
+            else:
+                failures = 0
+
+    def _step(self):
+        jobs = _claim_batch()
+        if not jobs:
+            self._wake.wait(POLL_SECONDS)
+            self._wake.clear()
+            return
+        process_jobs(self.api_key, jobs)
+
+
+# One worker per process, shared by every Streamlit session.
+_worker: ExtractionWorker | None = None
+_worker_lock = threading.Lock()
+
+
+def ensure_worker(api_key: str) -> ExtractionWorker:
+    """
+    Start the process-wide worker if needed, or point it at a new key. Cheap
+    enough to call on every rerun: the queue is only re-checked right away when
+    the key changes; call .wake() after queueing a job.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = ExtractionWorker(api_key)
+        key_changed = _worker.api_key != api_key
+        _worker.api_key = api_key
+        _worker.start()
+    if key_changed:
+        _worker.wake()
+    return _worker
+
+
+def queue_untagged_entries(retry_failed: bool = False) -> int:
+    """Queue every entry that has no tags and no extraction job. Returns how many were queued."""
+    entry_ids = db.find_untagged_entries(EXTRACT_TAGS, include_failed=retry_failed)
+    return sum(db.enqueue_job(EXTRACT_TAGS, i, retry_failed=retry_failed) for i in entry_ids)
+
+
+def backfill(api_key: str, workers: int = WORKER_COUNT, retry_failed: bool = False) -> dict:
+    """Queue untagged entries and process the queue until nothing is due."""
+    queued = queue_untagged_entries(retry_failed=retry_failed)
+
+    def drain():
+        while True:
+            jobs = _claim_batch()
+            if not jobs:
+                return
+            process_jobs(api_key, jobs)
+
+    threads = [threading.Thread(target=drain) for _ in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"queued": queued, **db.get_job_counts(EXTRACT_TAGS)}
+
+
+def main(argv: list[str] | None = None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Knowledge graph tag extraction jobs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("backfill", help="extract tags for every entry that has none")
+    run.add_argument("--workers", type=int, default=WORKER_COUNT)
+    run.add_argument("--retry-failed", action="store_true", help="also retry jobs that gave up")
+    sub.add_parser("status", help="show job counts by status")
+    args = parser.parse_args(argv)
+
+    db.init_db()
+    if args.command == "status":
+        print(db.get_job_counts(EXTRACT_TAGS))
+        return
+
+    api_key = os.getenv("GEMINI_API_KEY", "")
+    if not api_key:
+        parser.error("GEMINI_API_KEY is not set")
+    started = time.perf_counter()
+    stats = backfill(api_key, workers=args.workers, retry_failed=args.retry_failed)
+    print(f"{stats} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
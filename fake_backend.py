@@ -0,0 +1,393 @@
+"""
+fake_backend.py
+---------------
+A local stand-in for the Gemini API (see ai_engine.ModelBackend), for working
+offline and for load and latency testing without network access or quota.
+Replies are templated from the prompt (margin notes, Past Self answers,
+history summaries, and valid extraction JSON for single and batched
+extraction) or canned per mode. Latency follows a configurable distribution,
+streamed replies arrive in chunks, and a share of calls can fail with the
+same errors the real API raises (429 ResourceExhausted, 503 ServiceUnavailable).
+
+In-process:
+    AI_BACKEND=fake FAKE_LATENCY=lognormal:0.8,0.4 streamlit run app.py
+
+Over HTTP, so the network hop is part of the measurement:
+    python fake_backend.py serve --port 8765 --latency lognormal:0.8,0.4 --error-rate 0.02
+    AI_BACKEND=http://127.0.0.1:8765 streamlit run app.py
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from google.api_core import exceptions as google_exceptions
+
+import tag_parser
+
+DEFAULT_LATENCY = "lognormal:0.6,0.4"
+DEFAULT_CHUNK_DELAY = "fixed:0.03"
+DEFAULT_PORT = 8765
+
+
+# ── Latency distributions ─────────────────────────────────────────────────────
+
+class Latency:
+    """
+    Seconds to wait, drawn from a distribution given as "kind:params":
+    fixed:S, uniform:LOW,HIGH, normal:MEAN,STDDEV, lognormal:MEDIAN,SIGMA
+    or exponential:MEAN. Draws are never negative.
+    """
+
+    KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exponential": 1}
+
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(":")
+        self.kind = kind.strip()
+        try:
+            self.params = [float(p) for p in params.split(",")] if params else []
+        except ValueError:
+            raise ValueError(f"bad latency {spec!r}") from None
+        if self.KINDS.get(self.kind) != len(self.params):
+            raise ValueError(f"bad latency {spec!r} (expected e.g. fixed:0.2 or lognormal:0.8,0.4)")
+        self.spec = spec
+
+    def sample(self, rng: random.Random) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = rng.gauss(p[0], p[1])
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(math.log(p[0]), p[1]) if p[0] > 0 else 0.0
+        else:
+            value = rng.expovariate(1 / p[0]) if p[0] > 0 else 0.0
+        return max(0.0, value)
+
+
+# ── Replies ───────────────────────────────────────────────────────────────────
+
+_SPANISH_RE = re.compile(r"[ñ¿¡]|\b(que|el|la|los|las|hoy|con|por|pero|mi|yo)\b", re.IGNORECASE)
+_NAME_RE = re.compile(r"\b[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?: [A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)?")
+_SENTENCE_RE = re.compile(r"[^.!?¿¡\n]+")
+_ENTRY_RE = re.compile(r'<entry id="([^"]+)">\n(.*?)\n</entry>', re.DOTALL)
+_FEELINGS = {
+    "anxious", "happy", "tired", "grateful", "angry", "calm", "lonely", "excited", "sad", "proud",
+    "ansioso", "feliz", "cansado", "agradecido", "enfadado", "tranquilo", "solo", "emocionado",
+    "triste", "orgulloso",
+}
+
+TEMPLATES = {
+    "journaling": {
+        "en": "That stayed with you — “{echo}”. What part of today do you most want to remember?",
+        "es": "Eso se quedó contigo — «{echo}». ¿Qué parte de hoy quieres recordar más?",
+    },
+    "past_self": {
+        "en": "I remember writing about {topic}. Back then it felt bigger than it looks from here.",
+        "es": "Recuerdo escribir sobre {topic}. Entonces me parecía más grande de lo que parece ahora.",
+    },
+    "history": {
+        "en": "The user talked about {topic} and reflected on how it made them feel.",
+        "es": "El usuario habló de {topic} y reflexionó sobre cómo se sintió.",
+    },
+}
+DEFAULT_TEMPLATE = {"en": "I hear you: “{echo}”.", "es": "Te escucho: «{echo}»."}
+
+
+def _language(text: str) -> str:
+    return "es" if len(_SPANISH_RE.findall(text)) >= 2 else "en"
+
+
+def _user_part(text: str) -> str:
+    # Inline prompts put the user's input after the last separator.
+    return text.rsplit("\n---\n", 1)[-1].split(":", 1)[-1].strip()
+
+
+def _names(text: str) -> list[str]:
+    """Capitalized words and pairs ("Ana García"), skipping each sentence's first word."""
+    names = []
+    for sentence in _SENTENCE_RE.findall(text):
+        sentence = sentence.strip()
+        first = sentence.split(" ", 1)
+        names += _NAME_RE.findall(first[1]) if len(first) > 1 else []
+    return list(dict.fromkeys(names))
+
+
+def fake_tags(entry: str) -> list[dict]:
+    """Plausible, schema-valid tags for an entry: names, the opening clause, feelings."""
+    tags = [{"type": "Entity", "value": name} for name in _names(entry)]
+    opening = re.split(r"[.!?\n]", entry.strip(), maxsplit=1)[0]
+    if opening:
+        tags.insert(0, {"type": "Event", "value": " ".join(opening.split()[:8])})
+    words = re.findall(r"\w+", entry.lower())
+    for i, word in enumerate(words):
+        if word in _FEELINGS:
+            tags.append({"type": "Sentiment/Trigger", "value": " ".join(words[i:i + 4])})
+    return tag_parser.clean_tags(tags)
+
+
+def reply_text(mode: str, text: str, canned: dict[str, str]) -> str:
+    """The fake model's reply to a prompt, as a string (JSON for the extraction modes)."""
+    if mode in canned:
+        return canned[mode]
+    if mode == "extraction":
+        return json.dumps(fake_tags(text.rsplit("Journal entry:", 1)[-1].strip()), ensure_ascii=False)
+    if mode == "extraction_batch":
+        entries = _ENTRY_RE.findall(text)
+        return json.dumps([{"id": i, "tags": fake_tags(body)} for i, body in entries], ensure_ascii=False)
+    user = _user_part(text)
+    words = user.split()
+    echo = " ".join(words[:10]) + ("…" if len(words) > 10 else "")
+    names = _names(user)
+    topic = names[0] if names else " ".join(words[-4:]).rstrip("?.!") or "that"
+    template = TEMPLATES.get(mode, DEFAULT_TEMPLATE)[_language(user)]
+    return template.format(echo=echo, topic=topic)
+
+
+# ── In-process backend ────────────────────────────────────────────────────────
+
+@dataclass
+class FakeConfig:
+    latency: str = DEFAULT_LATENCY          # until the reply (or its first chunk)
+    chunk_delay: str = DEFAULT_CHUNK_DELAY  # between streamed chunks
+    chunk_words: int = 3
+    error_rate: float = 0.0
+    error_codes: tuple = (429, 503)
+    seed: int | None = None
+    responses: dict = field(default_factory=dict)  # canned reply text by mode
+
+    @classmethod
+    def from_env(cls) -> "FakeConfig":
+        """FAKE_LATENCY, FAKE_CHUNK_DELAY, FAKE_ERROR_RATE, FAKE_SEED and FAKE_RESPONSES (a JSON file)."""
+        responses = {}
+        if os.getenv("FAKE_RESPONSES"):
+            with open(os.environ["FAKE_RESPONSES"], encoding="utf-8") as f:
+                responses = json.load(f)
+        seed = os.getenv("FAKE_SEED")
+        return cls(
+            latency=os.getenv("FAKE_LATENCY", DEFAULT_LATENCY),
+            chunk_delay=os.getenv("FAKE_CHUNK_DELAY", DEFAULT_CHUNK_DELAY),
+            error_rate=float(os.getenv("FAKE_ERROR_RATE", "0")),
+            seed=int(seed) if seed else None,
+            responses=responses,
+        )
+
+
+class FakeResponse:
+    """A reply or streamed chunk, shaped like the SDK's (just `.text`)."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeBackend:
+    """ai_engine.ModelBackend answering locally after a simulated delay."""
+
+    name = "fake"
+    supports_context_cache = False
+
+    def __init__(self, config: FakeConfig | None = None, sleep=time.sleep):
+        self.config = config or FakeConfig()
+        self.latency = Latency(self.config.latency)
+        self.chunk_delay = Latency(self.config.chunk_delay)
+        self.sleep = sleep
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "errors": 0, "simulated_seconds": 0.0}
+
+    def _draw(self) -> tuple[float, int | None]:
+        """(latency, error status or None) for the next call."""
+        with self._lock:
+            self._stats["calls"] += 1
+            delay = self.latency.sample(self._rng)
+            error = None
+            if self._rng.random() < self.config.error_rate:
+                error = self._rng.choice(self.config.error_codes)
+                self._stats["errors"] += 1
+            self._stats["simulated_seconds"] += delay
+        return delay, error
+
+    def _chunk_pause(self):
+        with self._lock:
+            delay = self.chunk_delay.sample(self._rng)
+            self._stats["simulated_seconds"] += delay
+        self.sleep(delay)
+
+    def _start(self, mode: str, text: str) -> str:
+        delay, error = self._draw()
+        self.sleep(delay)
+        if error:
+            raise google_exceptions.from_http_status(error, f"fake backend: injected {error} for {mode}")
+        return reply_text(mode, text, self.config.responses)
+
+    def _chunks(self, reply: str):
+        words = reply.split(" ")
+        size = max(1, self.config.chunk_words)
+        for i in range(0, len(words), size):
+            if i:
+                self._chunk_pause()
+            yield FakeResponse(" ".join(words[i:i + size]) + (" " if i + size < len(words) else ""))
+
+    def chat(self, mode, api_key, history, text, stream=False, cached_content=None):
+        reply = self._start(mode, text)
+        return self._chunks(reply) if stream else FakeResponse(reply)
+
+    def generate(self, mode, api_key, prompt, generation_config=None):
+        return FakeResponse(self._start(mode, prompt))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+# ── HTTP server and client ────────────────────────────────────────────────────
+# POST /v1/chat {"mode", "history", "text", "stream"} and
+# POST /v1/generate {"mode", "prompt"} answer {"text": ...}, or for streams one
+# JSON object per line as chunks are produced. Errors come back as their HTTP
+# status with {"error": message}. GET /v1/stats reports the backend's counters.
+
+class _Handler(BaseHTTPRequestHandler):
+    backend: FakeBackend
+
+    def log_message(self, format, *args):
+        pass  # one line per request would swamp a load test
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/v1/stats":
+            self._send_json(200, self.backend.stats())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        try:
+            if self.path == "/v1/chat":
+                response = self.backend.chat(
+                    request.get("mode", ""), "", request.get("history", []), request.get("text", ""),
+                    stream=bool(request.get("stream")),
+                )
+            elif self.path == "/v1/generate":
+                response = self.backend.generate(request.get("mode", ""), "", request.get("prompt", ""))
+            else:
+                self._send_json(404, {"error": "not found"})
+                return
+        except google_exceptions.GoogleAPIError as e:
+            self._send_json(e.code or 500, {"error": e.message})
+            return
+
+        if isinstance(response, FakeResponse):
+            self._send_json(200, {"text": response.text})
+            return
+        # Streamed: no Content-Length, the body ends when the connection closes.
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for chunk in response:
+            self.wfile.write(json.dumps({"text": chunk.text}, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.wfile.flush()
+        self.close_connection = True
+
+
+def make_server(backend: FakeBackend, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """An HTTP server for `backend` (port 0 picks a free one); run it with serve_forever()."""
+    handler = type("FakeHandler", (_Handler,), {"backend": backend})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+class HttpBackend:
+    """ai_engine.ModelBackend talking to a `python fake_backend.py serve` instance."""
+
+    name = "http"
+    supports_context_cache = False
+
+    def __init__(self, url: str, timeout: float = 120.0):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or DEFAULT_PORT
+        self.timeout = timeout
+
+    def _post(self, path: str, payload: dict) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        conn.request("POST", path, body, {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        if response.status != 200:
+            message = json.loads(response.read() or b"{}").get("error", response.reason)
+            conn.close()
+            raise google_exceptions.from_http_status(response.status, message)
+        return conn, response
+
+    def _stream(self, conn: http.client.HTTPConnection, response: http.client.HTTPResponse):
+        try:
+            for line in response:
+                if line.strip():
+                    yield FakeResponse(json.loads(line)["text"])
+        finally:
+            conn.close()
+
+    def chat(self, mode, api_key, history, text, stream=False, cached_content=None):
+        conn, response = self._post("/v1/chat", {"mode": mode, "history": history, "text": text, "stream": stream})
+        if stream:
+            return self._stream(conn, response)
+        try:
+            return FakeResponse(json.loads(response.read())["text"])
+        finally:
+            conn.close()
+
+    def generate(self, mode, api_key, prompt, generation_config=None):
+        conn, response = self._post("/v1/generate", {"mode": mode, "prompt": prompt})
+        try:
+            return FakeResponse(json.loads(response.read())["text"])
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Gemini stand-in for load and latency testing.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="serve the fake backend over HTTP")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--latency", default=DEFAULT_LATENCY, help="e.g. fixed:0.2, lognormal:0.8,0.4")
+    serve.add_argument("--chunk-delay", default=DEFAULT_CHUNK_DELAY)
+    serve.add_argument("--error-rate", type=float, default=0.0, help="share of calls failing with 429/503")
+    serve.add_argument("--seed", type=int)
+    serve.add_argument("--responses", help="JSON file of canned reply text by mode")
+    args = parser.parse_args()
+
+    canned = {}
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            canned = json.load(f)
+    config = FakeConfig(
+        latency=args.latency, chunk_delay=args.chunk_delay, error_rate=args.error_rate,
+        seed=args.seed, responses=canned,
+    )
+    server = make_server(FakeBackend(config), args.host, args.port)
+    print(f"Fake Gemini backend on http://{args.host}:{server.server_port} (latency {args.latency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
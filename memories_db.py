@@ -6,47 +6,569 @@ Stores: user profile, journal entries, and structured knowledge graph tags.
 All data belongs to the user and stays on their local machine.
 """
 
+import atexit
 import sqlite3
 import json
-from datetime import datetime
+import threading
+from collections.abc import Iterator
+from datetime import date, datetime, timedelta
 from pathlib import Path
 
+import tag_canonicalizer
+import tag_parser
+
 DB_PATH = Path(__file__).parent / "memories.db"
 
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
+# ── Connection management ────────────────────────────────────────────────────
+# Each thread keeps one long-lived connection per database file, so a Streamlit
+# rerun reuses the same handle (and its prepared-statement cache) instead of
+# reconnecting and re-reading the schema on every call. When a thread exits its
+# connection goes back to an idle pool for the next thread (Streamlit runs each
+# rerun on a fresh script thread). WAL mode lets other sessions keep reading
+# while one of them writes.
+
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",   # durable under WAL, far fewer fsyncs
+    "PRAGMA cache_size = -16000",    # ~16 MB page cache
+    "PRAGMA mmap_size = 268435456",  # 256 MB memory-mapped reads
+    "PRAGMA temp_store = MEMORY",
+)
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_SECONDS = 10.0
+MAX_IDLE_CONNECTIONS = 4
+
+_local = threading.local()
+_pool_lock = threading.Lock()
+_pool: dict[tuple[int, str], tuple[threading.Thread, sqlite3.Connection]] = {}
+_idle: dict[str, list[sqlite3.Connection]] = {}
+_pool_generation = 0  # bumped by close_connections() to invalidate thread caches
+
+
+def _open_connection(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT_SECONDS,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        # A connection is only ever used by one thread at a time; it is handed
+        # to another thread only after its owner has exited.
+        check_same_thread=False,
+    )
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
+def _reclaim_dead_threads():
+    """Move connections owned by finished threads back to the idle pool."""
+    for key, (thread, conn) in list(_pool.items()):
+        if thread.is_alive():
+            continue
+        del _pool[key]
+        idle = _idle.setdefault(key[1], [])
+        if len(idle) < MAX_IDLE_CONNECTIONS and not conn.in_transaction:
+            idle.append(conn)
+        else:
+            conn.close()
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Return this thread's pooled connection to DB_PATH, opening it on first use.
+    Use it as `with get_connection() as conn:` — the block commits or rolls
+    back, but the connection itself stays open for the next call.
+    """
+    path = str(DB_PATH)
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.generation != _pool_generation:
+        conns = _local.conns = {}
+        _local.generation = _pool_generation
+    conn = conns.get(path)
+    if conn is None:
+        with _pool_lock:
+            _reclaim_dead_threads()
+            idle = _idle.get(path)
+            conn = idle.pop() if idle else None
+        if conn is None:
+            conn = _open_connection(path)
+        with _pool_lock:
+            _pool[(threading.get_ident(), path)] = (threading.current_thread(), conn)
+        conns[path] = conn
+    return conn
+
+
+def close_connections():
+    """Close every pooled connection. Registered to run at interpreter exit."""
+    global _pool_generation
+    with _pool_lock:
+        _pool_generation += 1
+        conns = [conn for _, conn in _pool.values()]
+        conns += [conn for idle in _idle.values() for conn in idle]
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _pool.clear()
+        _idle.clear()
+
+
+atexit.register(close_connections)
+
+
+# ── Schema migrations ────────────────────────────────────────────────────────
+# The schema version lives in `PRAGMA user_version`. Each migration upgrades the
+# database by exactly one version inside its own transaction, so an existing
+# memories.db is brought up to date in place the next time the app starts.
+
+def _execute_script(conn: sqlite3.Connection, script: str):
+    """
+    Run a multi-statement script inside the caller's transaction.
+    (`executescript` would commit first, which breaks migration atomicity.)
+    """
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ""
+    if statement.strip():
+        conn.execute(statement)
+
+
+def _migrate_v1(conn: sqlite3.Connection):
+    """Original schema: profile, journal entries and a flat tag table."""
+    _execute_script(conn, """
+        CREATE TABLE IF NOT EXISTS profile (
+            id INTEGER PRIMARY KEY,
+            key TEXT UNIQUE NOT NULL,
+            value TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS journal_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            content TEXT NOT NULL,
+            ai_response TEXT,
+            created_at TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS knowledge_graph (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            entry_id INTEGER,
+            tag_type TEXT NOT NULL,
+            tag_value TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (entry_id) REFERENCES journal_entries(id)
+        );
+    """)
+
+
+def _migrate_v2(conn: sqlite3.Connection):
+    """
+    Normalize tags: each distinct (tag_type, tag_value) is stored once in `tags`
+    and linked to entries through `entry_tags`. `knowledge_graph` becomes a view
+    with the old columns, so existing queries keep working.
+    """
+    _execute_script(conn, """
+        CREATE TABLE tags (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tag_type TEXT NOT NULL,
+            tag_value TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE UNIQUE INDEX idx_tags_type_value ON tags (tag_type, tag_value);
+
+        CREATE TABLE entry_tags (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            entry_id INTEGER,
+            tag_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            UNIQUE (entry_id, tag_id),  -- also serves as the entry_id index
+            FOREIGN KEY (entry_id) REFERENCES journal_entries(id),
+            FOREIGN KEY (tag_id) REFERENCES tags(id)
+        );
+        CREATE INDEX idx_entry_tags_tag_id ON entry_tags (tag_id);
+        CREATE INDEX idx_entry_tags_created_at ON entry_tags (created_at);
+
+        CREATE INDEX IF NOT EXISTS idx_journal_entries_created_at
+            ON journal_entries (created_at);
+
+        -- Tag ids follow first-seen order, like the old per-row ordering.
+        INSERT INTO tags (tag_type, tag_value, created_at)
+            SELECT tag_type, tag_value, MIN(created_at)
+            FROM knowledge_graph
+            GROUP BY tag_type, tag_value
+            ORDER BY MIN(created_at), MIN(id);
+
+        INSERT OR IGNORE INTO entry_tags (entry_id, tag_id, created_at)
+            SELECT kg.entry_id, t.id, kg.created_at
+            FROM knowledge_graph kg
+            JOIN tags t ON t.tag_type = kg.tag_type AND t.tag_value = kg.tag_value
+            ORDER BY kg.created_at, kg.id;
+
+        DROP TABLE knowledge_graph;
+
+        CREATE VIEW knowledge_graph AS
+            SELECT et.id, et.entry_id, t.tag_type, t.tag_value, et.created_at
+            FROM entry_tags et
+            JOIN tags t ON t.id = et.tag_id;
+    """)
+
+
+def _migrate_v3(conn: sqlite3.Connection):
+    """
+    Materialized knowledge summary: one row per tag type holding its distinct
+    values in first-seen order, maintained incrementally by save_tags(), plus a
+    `meta` table whose `summary_version` counter marks it as changed.
+    """
+    _execute_script(conn, """
+        CREATE TABLE meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT INTO meta (key, value) VALUES ('summary_version', 0);
+
+        CREATE TABLE tag_summary (
+            tag_type TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            tag_values TEXT NOT NULL
+        );
+    """)
+    grouped: dict[str, list[str]] = {}
+    for row in conn.execute("SELECT tag_type, tag_value FROM tags ORDER BY id"):
+        grouped.setdefault(row["tag_type"], []).append(row["tag_value"])
+    conn.executemany(
+        "INSERT INTO tag_summary (tag_type, position, tag_values) VALUES (?, ?, ?)",
+        [(tag_type, i, " | ".join(values)) for i, (tag_type, values) in enumerate(grouped.items())]
+    )
+
+
+def _fts5_available(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _migrate_v4(conn: sqlite3.Connection):
+    """
+    Full-text index over entry content (FTS5, BM25 ranking), kept in sync with
+    journal_entries by triggers. Skipped on SQLite builds without FTS5; retrieval then falls back to
+    recent entries.
+    """
+    if not _fts5_available(conn):
+        return
+    _execute_script(conn, """
+        CREATE VIRTUAL TABLE journal_fts USING fts5(
+            content,
+            content = 'journal_entries',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        );
+
+        CREATE TRIGGER journal_entries_fts_insert AFTER INSERT ON journal_entries BEGIN
+            INSERT INTO journal_fts (rowid, content) VALUES (new.id, new.content);
+        END;
+        CREATE TRIGGER journal_entries_fts_delete AFTER DELETE ON journal_entries BEGIN
+            INSERT INTO journal_fts (journal_fts, rowid, content)
+                VALUES ('delete', old.id, old.content);
+        END;
+        CREATE TRIGGER journal_entries_fts_update AFTER UPDATE OF content ON journal_entries BEGIN
+            INSERT INTO journal_fts (journal_fts, rowid, content)
+                VALUES ('delete', old.id, old.content);
+            INSERT INTO journal_fts (rowid, content) VALUES (new.id, new.content);
+        END;
+
+        INSERT INTO journal_fts (journal_fts) VALUES ('rebuild');
+    """)
+
+
+def _migrate_v5(conn: sqlite3.Connection):
+    """Durable job queue for background work (tag extraction), one job per entry and kind."""
+    _execute_script(conn, """
+        CREATE TABLE jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            entry_id INTEGER NOT NULL,
+            status TEXT NOT NULL,          -- pending | running | done | failed
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            run_after TEXT NOT NULL,
+            locked_until TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            UNIQUE (kind, entry_id),
+            FOREIGN KEY (entry_id) REFERENCES journal_entries(id)
+        );
+        CREATE INDEX idx_jobs_kind_status_run_after ON jobs (kind, status, run_after);
+    """)
+
+
+def _migrate_v6(conn: sqlite3.Connection):
+    """
+    Per-type distinct tag counts on tag_summary (kept up to date by save_tags)
+    and an index to read each type's newest tags, for get_tag_snapshot().
+    """
+    _execute_script(conn, """
+        ALTER TABLE tag_summary ADD COLUMN tag_count INTEGER NOT NULL DEFAULT 0;
+        UPDATE tag_summary SET tag_count =
+            (SELECT COUNT(*) FROM tags WHERE tags.tag_type = tag_summary.tag_type);
+        CREATE INDEX idx_tags_type_id ON tags (tag_type, id);
+    """)
+
+
+def _rebuild_tag_summary(conn: sqlite3.Connection):
+    grouped: dict[str, list[str]] = {}
+    for row in conn.execute("SELECT tag_type, tag_value FROM tags ORDER BY id"):
+        grouped.setdefault(row["tag_type"], []).append(row["tag_value"])
+    conn.execute("DELETE FROM tag_summary")
+    conn.executemany(
+        "INSERT INTO tag_summary (tag_type, position, tag_values, tag_count) VALUES (?, ?, ?, ?)",
+        [(tag_type, i, " | ".join(values), len(values)) for i, (tag_type, values) in enumerate(grouped.items())]
+    )
+    conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'summary_version'")
+
+
+def _migrate_v7(conn: sqlite3.Connection):
+    """
+    Canonical tags (see tag_canonicalizer): every spelling seen for a tag is
+    kept in `tag_aliases` under its canonical key, pointing at the one `tags`
+    row for it, and filed in `tag_blocks` for plural lookups. Existing variants
+    are merged into their first-seen tag, `tags` gains mention counts, and
+    tag_summary is rebuilt without the duplicates. Merged variant rows are
+    moved to `merged_tags`, with the entries they were linked to, so a merge
+    can be undone.
+    """
+    _execute_script(conn, """
+        CREATE TABLE tag_aliases (
+            tag_type TEXT NOT NULL,
+            alias_key TEXT NOT NULL,
+            tag_id INTEGER NOT NULL,
+            PRIMARY KEY (tag_type, alias_key),
+            FOREIGN KEY (tag_id) REFERENCES tags(id)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE tag_blocks (
+            tag_type TEXT NOT NULL,
+            block TEXT NOT NULL,
+            alias_key TEXT NOT NULL,
+            tag_id INTEGER NOT NULL,
+            PRIMARY KEY (tag_type, block, alias_key)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE merged_tags (
+            id INTEGER PRIMARY KEY,     -- the variant's former tags.id
+            tag_type TEXT NOT NULL,
+            tag_value TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            merged_into INTEGER NOT NULL,
+            entry_ids TEXT NOT NULL,    -- JSON array of the entries it was linked to
+            FOREIGN KEY (merged_into) REFERENCES tags(id)
+        );
+
+        ALTER TABLE tags ADD COLUMN mentions INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE tags ADD COLUMN last_seen TEXT;
+    """)
+
+    index = tag_canonicalizer.TagIndex()
+    aliases, merges = {}, []
+    for row in conn.execute("SELECT id, tag_type, tag_value FROM tags ORDER BY id").fetchall():
+        key = tag_canonicalizer.canonical_key(row["tag_type"], row["tag_value"])
+        if not key:
+            continue
+        canonical = index.find(row["tag_type"], key)
+        if canonical is None:
+            canonical = row["id"]
+        else:
+            merges.append((canonical, row["id"]))
+        index.add(row["tag_type"], key, canonical)
+        aliases.setdefault((row["tag_type"], key), canonical)
+
+    _save_aliases(conn, [(tag_type, key, tag_id) for (tag_type, key), tag_id in aliases.items()])
+    conn.executemany(
+        "INSERT INTO merged_tags (id, tag_type, tag_value, created_at, merged_into, entry_ids) "
+        "SELECT id, tag_type, tag_value, created_at, ?, ? FROM tags WHERE id = ?",
+        [
+            (canonical, json.dumps([
+                row[0] for row in conn.execute("SELECT entry_id FROM entry_tags WHERE tag_id = ?", (variant,))
+            ]), variant)
+            for canonical, variant in merges
+        ]
+    )
+    # An entry linked to both a variant and its canonical tag keeps one link.
+    conn.executemany("UPDATE OR IGNORE entry_tags SET tag_id = ? WHERE tag_id = ?", merges)
+    conn.executemany("DELETE FROM entry_tags WHERE tag_id = ?", [(variant,) for _, variant in merges])
+    conn.executemany("DELETE FROM tags WHERE id = ?", [(variant,) for _, variant in merges])
+    conn.execute(
+        "UPDATE tags SET "
+        "mentions = (SELECT COUNT(*) FROM entry_tags WHERE tag_id = tags.id), "
+        "last_seen = (SELECT MAX(created_at) FROM entry_tags WHERE tag_id = tags.id)"
+    )
+    _rebuild_tag_summary(conn)
+
+
+def _migrate_v8(conn: sqlite3.Connection):
+    """
+    Co-occurrence graph over canonical tags: one `tag_edges` row per direction
+    for every pair of tags linked to the same entry, weighted by how many
+    entries they share. WITHOUT ROWID keeps each tag's adjacency list
+    contiguous on disk under its (src, dst) key. Backfilled from entry_tags.
+    """
+    _execute_script(conn, """
+        CREATE TABLE tag_edges (
+            src INTEGER NOT NULL,
+            dst INTEGER NOT NULL,
+            weight INTEGER NOT NULL,
+            last_seen TEXT NOT NULL,
+            PRIMARY KEY (src, dst)
+        ) WITHOUT ROWID;
+
+        INSERT INTO tag_edges (src, dst, weight, last_seen)
+            SELECT a.tag_id, b.tag_id, COUNT(*), MAX(a.created_at)
+            FROM entry_tags a
+            JOIN entry_tags b ON b.entry_id = a.entry_id AND b.tag_id != a.tag_id
+            GROUP BY a.tag_id, b.tag_id;
+    """)
+
+
+def _migrate_v9(conn: sqlite3.Connection):
+    """
+    Usage ledger: one `usage_log` row per model call (tokens in and out,
+    latency), and `usage_daily` totals per day and mode, kept up to date by
+    record_usage() so reports and budgets never scan the log.
+    """
+    _execute_script(conn, """
+        CREATE TABLE usage_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            backend TEXT NOT NULL DEFAULT '',
+            input_tokens INTEGER NOT NULL,
+            output_tokens INTEGER NOT NULL,
+            latency_ms REAL NOT NULL,
+            ok INTEGER NOT NULL DEFAULT 1
+        );
+
+        CREATE TABLE usage_daily (
+            day TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            calls INTEGER NOT NULL DEFAULT 0,
+            errors INTEGER NOT NULL DEFAULT 0,
+            input_tokens INTEGER NOT NULL DEFAULT 0,
+            output_tokens INTEGER NOT NULL DEFAULT 0,
+            latency_ms REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, mode)
+        ) WITHOUT ROWID;
+    """)
+
+
+def _migrate_v10(conn: sqlite3.Connection):
+    """
+    Plural twins are found through their folded key (tag_canonicalizer.fold_key),
+    an exact lookup, instead of a capped scan of shared blocks: tag_blocks is
+    refiled under folded keys. merged_tags also takes spellings merged by
+    save_tags(), which never had a `tags` row: the variant's former tag id
+    moves to `former_tag_id` (NULL for those), and each spelling is kept once.
+    """
+    _execute_script(conn, """
+        CREATE TABLE merged_tags_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            former_tag_id INTEGER,      -- the variant's tags.id, if it had one
+            tag_type TEXT NOT NULL,
+            tag_value TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            merged_into INTEGER NOT NULL,
+            entry_ids TEXT NOT NULL,    -- JSON array of the entries it was linked to
+            UNIQUE (tag_type, tag_value),
+            FOREIGN KEY (merged_into) REFERENCES tags(id)
+        );
+        INSERT OR IGNORE INTO merged_tags_new
+            (former_tag_id, tag_type, tag_value, created_at, merged_into, entry_ids)
+            SELECT id, tag_type, tag_value, created_at, merged_into, entry_ids
+            FROM merged_tags ORDER BY id;
+        DROP TABLE merged_tags;
+        ALTER TABLE merged_tags_new RENAME TO merged_tags;
+
+        DELETE FROM tag_blocks;
+    """)
+    aliases = conn.execute("SELECT tag_type, alias_key, tag_id FROM tag_aliases").fetchall()
+    _save_aliases(conn, [tuple(row) for row in aliases])
+
+
+MIGRATIONS = [
+    _migrate_v1,
+    _migrate_v2,
+    _migrate_v3,
+    _migrate_v4,
+    _migrate_v5,
+    _migrate_v6,
+    _migrate_v7,
+    _migrate_v8,
+    _migrate_v9,
+    _migrate_v10,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply every pending migration in order. Returns the resulting version."""
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if get_schema_version(conn) >= version:
+            continue
+        # IMMEDIATE takes the write lock up front, so two processes starting
+        # at once can't both apply the same migration.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) < version:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return get_schema_version(conn)
+
+
+_initialized_paths: set[str] = set()
+
+
 def init_db():
-    """Create all tables if they don't exist."""
-    with get_connection() as conn:
-        conn.executescript("""
-            CREATE TABLE IF NOT EXISTS profile (
-                id INTEGER PRIMARY KEY,
-                key TEXT UNIQUE NOT NULL,
-                value TEXT NOT NULL,
-                updated_at TEXT NOT NULL
-            );
-
-            CREATE TABLE IF NOT EXISTS journal_entries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                content TEXT NOT NULL,
-                ai_response TEXT,
-                created_at TEXT NOT NULL
-            );
-
-            CREATE TABLE IF NOT EXISTS knowledge_graph (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                entry_id INTEGER,
-                tag_type TEXT NOT NULL,
-                tag_value TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                FOREIGN KEY (entry_id) REFERENCES journal_entries(id)
-            );
-        """)
+    """Create or upgrade the schema to SCHEMA_VERSION (once per process and file)."""
+    path = str(DB_PATH)
+    if path in _initialized_paths:
+        return
+    conn = get_connection()
+    if get_schema_version(conn) < SCHEMA_VERSION:
+        migrate(conn)
+    _initialized_paths.add(path)
+
+
+# ── Data version ──────────────────────────────────────────────────────────────
+# Bumped after every committed write that changes what the app reads (entries,
+# tags, profile), so read caches such as read_model can tell when to refetch.
+# It only sees writes made by this process.
+
+_data_version = 0
+_data_version_lock = threading.Lock()
+
+
+def data_version() -> int:
+    return _data_version
+
+
+def _bump_data_version():
+    global _data_version
+    with _data_version_lock:
+        _data_version += 1
 
 
 # ── Profile ──────────────────────────────────────────────────────────────────
@@ -59,6 +581,7 @@ def set_profile(key: str, value: str):
             "ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at",
             (key, value, now)
         )
+    _bump_data_version()
 
 
 def get_profile() -> dict:
@@ -75,14 +598,24 @@ def profile_is_complete() -> bool:
 
 # ── Journal Entries ───────────────────────────────────────────────────────────
 
-def save_entry(content: str, ai_response: str = "") -> int:
+def save_entry(
+    content: str, ai_response: str = "", job_kind: str | None = None, job_run_after: datetime | None = None
+) -> int:
+    """
+    Store an entry and return its id. With `job_kind`, a pending job for it is
+    queued in the same transaction (due at `job_run_after`, default now), so
+    the entry is never saved without the job that finishes processing it.
+    """
     now = datetime.now().isoformat()
     with get_connection() as conn:
         cursor = conn.execute(
             "INSERT INTO journal_entries (content, ai_response, created_at) VALUES (?, ?, ?)",
             (content, ai_response, now)
         )
-        return cursor.lastrowid
+        if job_kind is not None:
+            _insert_job(conn, job_kind, cursor.lastrowid, _iso(job_run_after or datetime.now()))
+    _bump_data_version()
+    return cursor.lastrowid
 
 
 def get_all_entries() -> list[dict]:
@@ -93,52 +626,810 @@ def get_all_entries() -> list[dict]:
     return [dict(row) for row in rows]
 
 
+ENTRY_COLUMNS = ("id", "content", "ai_response", "created_at")
+ENTRY_PAGE_SIZE = 200
+
+
+def _entry_columns(columns) -> str:
+    unknown = set(columns) - set(ENTRY_COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown journal_entries columns: {sorted(unknown)}")
+    # The keyset columns are always selected; callers can ignore them.
+    return ", ".join(dict.fromkeys(["id", "created_at", *columns]))
+
+
+def iter_entries(
+    after_id: int = 0,
+    limit: int | None = None,
+    columns=ENTRY_COLUMNS,
+    page_size: int = ENTRY_PAGE_SIZE,
+) -> Iterator[dict]:
+    """
+    Stream entries with id > `after_id` in id (= writing) order, at most
+    `limit` of them, fetching `page_size` rows per query (keyset pagination,
+    no OFFSET). Only `columns` are loaded, so skipping content/ai_response
+    keeps large diaries cheap. Resume a scan from the last id you saw.
+    Bad arguments raise ValueError here, not at the first next().
+    """
+    if page_size <= 0:
+        raise ValueError(f"page_size must be a positive number of rows, got {page_size}")
+    if limit is not None and limit < 0:
+        raise ValueError(f"limit must be None or a non-negative number of entries, got {limit}")
+    return _iter_entry_pages(after_id, limit, _entry_columns(columns), page_size)
+
+
+def _iter_entry_pages(after_id: int, limit: int | None, select: str, page_size: int) -> Iterator[dict]:
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        with get_connection() as conn:
+            rows = conn.execute(
+                f"SELECT {select} FROM journal_entries WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, size)
+            ).fetchall()
+        for row in rows:
+            yield dict(row)
+        if len(rows) < size:
+            return
+        after_id = rows[-1]["id"]
+        if remaining is not None:
+            remaining -= len(rows)
+
+
+def _as_timestamp(value: date | datetime | str) -> str:
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def get_entries_range(
+    start: date | datetime | str,
+    end: date | datetime | str,
+    columns=ENTRY_COLUMNS,
+    page_size: int = ENTRY_PAGE_SIZE,
+) -> Iterator[dict]:
+    """
+    Stream entries written in [start, end), oldest first, paging on
+    (created_at, id) over idx_journal_entries_created_at. Dates mean midnight,
+    so get_entries_range(date(2024, 5, 1), date(2024, 6, 1)) is all of May.
+    """
+    select = _entry_columns(columns)
+    start, end = _as_timestamp(start), _as_timestamp(end)
+    last_created, last_id = start, 0
+    while True:
+        with get_connection() as conn:
+            rows = conn.execute(
+                f"SELECT {select} FROM journal_entries "
+                "WHERE (created_at, id) > (?, ?) AND created_at < ? "
+                "ORDER BY created_at, id LIMIT ?",
+                (last_created, last_id, end, page_size)
+            ).fetchall()
+        for row in rows:
+            yield dict(row)
+        if len(rows) < page_size:
+            return
+        last_created, last_id = rows[-1]["created_at"], rows[-1]["id"]
+
+
+def get_first_last_dates() -> tuple[str, str] | None:
+    """created_at of the oldest and newest entries, or None if there are none."""
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT MIN(created_at) AS first, MAX(created_at) AS last FROM journal_entries"
+        ).fetchone()
+    return (row["first"], row["last"]) if row["first"] else None
+
+
 def get_entry_count() -> int:
     with get_connection() as conn:
         row = conn.execute("SELECT COUNT(*) as cnt FROM journal_entries").fetchone()
     return row["cnt"]
 
 
+def get_recent_entries(limit: int) -> list[dict]:
+    """The `limit` most recent entries, oldest first."""
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT * FROM journal_entries ORDER BY created_at DESC, id DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+    return [dict(row) for row in reversed(rows)]
+
+
+def get_latest_entry_id() -> int:
+    with get_connection() as conn:
+        row = conn.execute("SELECT MAX(id) AS max_id FROM journal_entries").fetchone()
+    return row["max_id"] or 0
+
+
+def get_entry(entry_id: int) -> dict | None:
+    with get_connection() as conn:
+        row = conn.execute("SELECT * FROM journal_entries WHERE id = ?", (entry_id,)).fetchone()
+    return dict(row) if row else None
+
+
+# ── Full-text index ───────────────────────────────────────────────────────────
+
+def fts_enabled() -> bool:
+    """True if this database has the FTS5 entry index (schema v4 with FTS5)."""
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'journal_fts'"
+        ).fetchone()
+    return row is not None
+
+
+def get_match_counts(fts_queries: list[str], cap: int) -> dict[str, int]:
+    """
+    How many entries match each FTS5 query, counting no further than `cap`
+    so very common words stay cheap to check.
+    """
+    counts = {}
+    with get_connection() as conn:
+        for fts_query in fts_queries:
+            row = conn.execute(
+                "SELECT COUNT(*) AS cnt FROM ("
+                "SELECT 1 FROM journal_fts WHERE journal_fts MATCH ? LIMIT ?)",
+                (fts_query, cap)
+            ).fetchone()
+            counts[fts_query] = row["cnt"]
+    return counts
+
+
+def match_entries(fts_query: str, limit: int, min_id: int = 0) -> list[dict]:
+    """
+    Entries matching an FTS5 query, best BM25 rank first (lower `rank` is
+    better). `min_id` restricts the search to newer entries.
+    """
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT e.id, e.content, e.created_at, bm25(journal_fts) AS rank "
+            "FROM journal_fts JOIN journal_entries e ON e.id = journal_fts.rowid "
+            "WHERE journal_fts MATCH ? AND journal_fts.rowid > ? "
+            "ORDER BY rank LIMIT ?",
+            (fts_query, min_id, limit)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+# ── Search ────────────────────────────────────────────────────────────────────
+# Diary search for the UI. Snippets mark matches with HIGHLIGHT_START/END
+# control characters rather than HTML, so callers escape the text first and
+# then swap the markers for their own highlighting.
+# BM25 has to score every match before it can sort, so a query matching most
+# of the diary ("hoy") is only ranked over its SEARCH_RANK_WINDOW newest
+# matches; selective queries are ranked over all of them.
+
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+SNIPPET_TOKENS = 24
+SEARCH_MAX_TERMS = 8
+SEARCH_RANK_WINDOW = 2000
+
+
+def _search_terms(query: str) -> list[str]:
+    return tag_canonicalizer.normalize(query).split()[:SEARCH_MAX_TERMS]
+
+
+def _search_fts_query(terms: list[str]) -> str:
+    # Every word must appear. Quoted so user text is never read as FTS5 syntax.
+    return " AND ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _date_bounds(date_range) -> tuple[str, str]:
+    """created_at bounds [low, high) for an optional (start, end) pair of inclusive dates."""
+    start, end = date_range or (None, None)
+    if isinstance(end, date) and not isinstance(end, datetime):
+        end += timedelta(days=1)
+    return (_as_timestamp(start) if start else "", _as_timestamp(end) if end else "9999")
+
+
+def search_entries(query: str, limit: int = 20, date_range=None) -> list[dict]:
+    """
+    Entries matching every word of `query`, best BM25 rank first. Each result
+    has id, created_at, content and a `snippet` with matches wrapped in
+    HIGHLIGHT_START/HIGHLIGHT_END. `date_range` is an optional (start, end)
+    pair of dates, both inclusive; either side may be None.
+    Without FTS5 this falls back to a substring scan, newest first.
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return []
+    low, high = _date_bounds(date_range)
+    if not fts_enabled():
+        return _search_entries_scan(terms, limit, low, high)
+
+    fts_query = _search_fts_query(terms)
+    with get_connection() as conn:
+        low_id, high_id = 0, -1
+        if date_range:
+            # Entries in the date range lie within these ids, which FTS5 can
+            # restrict on directly; created_at is still checked per row below.
+            row = conn.execute(
+                "SELECT MIN(id) AS low_id, MAX(id) AS high_id FROM journal_entries "
+                "WHERE created_at >= ? AND created_at < ?",
+                (low, high)
+            ).fetchone()
+            if row["low_id"] is None:
+                return []
+            low_id, high_id = row["low_id"], row["high_id"]
+        else:
+            high_id = conn.execute("SELECT MAX(id) AS max_id FROM journal_entries").fetchone()["max_id"] or 0
+        window = conn.execute(
+            "SELECT rowid FROM journal_fts WHERE journal_fts MATCH ? AND rowid BETWEEN ? AND ? "
+            "ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+            (fts_query, low_id, high_id, SEARCH_RANK_WINDOW - 1)
+        ).fetchone()
+        if window:
+            low_id = window["rowid"]
+        rows = conn.execute(
+            "SELECT e.id, e.created_at, e.content, "
+            "snippet(journal_fts, 0, ?, ?, '…', ?) AS snippet "
+            "FROM journal_fts JOIN journal_entries e ON e.id = journal_fts.rowid "
+            "WHERE journal_fts MATCH ? AND journal_fts.rowid BETWEEN ? AND ? "
+            "AND e.created_at >= ? AND e.created_at < ? "
+            "ORDER BY rank LIMIT ?",
+            (HIGHLIGHT_START, HIGHLIGHT_END, SNIPPET_TOKENS, fts_query, low_id, high_id, low, high, limit)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def _search_entries_scan(terms: list[str], limit: int, low: str, high: str) -> list[dict]:
+    # LIKE is only case-insensitive for ASCII and doesn't fold accents; good
+    # enough for the rare SQLite build without FTS5.
+    where = " AND ".join(["content LIKE ?"] * len(terms))
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT id, created_at, content FROM journal_entries "
+            f"WHERE {where} AND created_at >= ? AND created_at < ? "
+            "ORDER BY created_at DESC, id DESC LIMIT ?",
+            (*(f"%{term}%" for term in terms), low, high, limit)
+        ).fetchall()
+    results = []
+    for row in rows:
+        entry = dict(row)
+        words = entry["content"].split()
+        entry["snippet"] = " ".join(words[:SNIPPET_TOKENS]) + ("…" if len(words) > SNIPPET_TOKENS else "")
+        results.append(entry)
+    return results
+
+
+# ── Jobs ──────────────────────────────────────────────────────────────────────
+# A small durable queue: at most one job per (kind, entry_id), so enqueueing is
+# idempotent. Claimed jobs hold a lease; if the process dies mid-job the lease
+# expires and another worker picks it up again.
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat()
+
+
+def _insert_job(conn: sqlite3.Connection, kind: str, entry_id: int, run_after: str) -> sqlite3.Cursor:
+    now = _iso(datetime.now())
+    return conn.execute(
+        "INSERT OR IGNORE INTO jobs (kind, entry_id, status, run_after, created_at, updated_at) "
+        "VALUES (?, ?, 'pending', ?, ?, ?)",
+        (kind, entry_id, run_after, now, now)
+    )
+
+
+def enqueue_job(kind: str, entry_id: int, retry_failed: bool = False) -> bool:
+    """
+    Queue a job unless one already exists for this entry. With `retry_failed`,
+    a job that previously exhausted its attempts is reset to pending.
+    Returns True if a job was queued.
+    """
+    now = _iso(datetime.now())
+    with get_connection() as conn:
+        cursor = _insert_job(conn, kind, entry_id, now)
+        if not cursor.rowcount and retry_failed:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, run_after = ?, updated_at = ? "
+                "WHERE kind = ? AND entry_id = ? AND status = 'failed'",
+                (now, now, kind, entry_id)
+            )
+        return cursor.rowcount > 0
+
+
+def claim_jobs(kind: str, limit: int, lease_seconds: float) -> list[dict]:
+    """
+    Atomically claim up to `limit` due jobs (pending, or running with an
+    expired lease) and mark them running. Returns the claimed job rows.
+    """
+    now = datetime.now()
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(
+            "SELECT * FROM jobs WHERE kind = ? AND ("
+            "(status = 'pending' AND run_after <= ?) OR "
+            "(status = 'running' AND locked_until < ?)) "
+            "ORDER BY run_after, id LIMIT ?",
+            (kind, _iso(now), _iso(now), limit)
+        ).fetchall()
+        locked_until = _iso(now + timedelta(seconds=lease_seconds))
+        conn.executemany(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+            "locked_until = ?, updated_at = ? WHERE id = ?",
+            [(locked_until, _iso(now), row["id"]) for row in rows]
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return [dict(row, status="running", attempts=row["attempts"] + 1) for row in rows]
+
+
+def renew_jobs(kind: str, entry_ids: list[int], lease_seconds: float):
+    """Push back the lease of jobs still running, so nobody reclaims them mid-batch."""
+    if not entry_ids:
+        return
+    now = datetime.now()
+    with get_connection() as conn:
+        conn.execute(
+            f"UPDATE jobs SET locked_until = ?, updated_at = ? WHERE kind = ? AND status = 'running' "
+            f"AND entry_id IN ({', '.join('?' * len(entry_ids))})",
+            (_iso(now + timedelta(seconds=lease_seconds)), _iso(now), kind, *entry_ids)
+        )
+
+
+def complete_job(kind: str, entry_id: int):
+    """Mark the job done, recording it even if it was never queued."""
+    now = _iso(datetime.now())
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO jobs (kind, entry_id, status, run_after, created_at, updated_at) "
+            "VALUES (?, ?, 'done', ?, ?, ?) "
+            "ON CONFLICT(kind, entry_id) DO UPDATE SET "
+            "status = 'done', locked_until = NULL, last_error = NULL, updated_at = excluded.updated_at",
+            (kind, entry_id, now, now, now)
+        )
+
+
+def fail_job(kind: str, entry_id: int, error: str, retry_at: datetime | None):
+    """Record a failed attempt: back to pending until `retry_at`, or failed for good if None."""
+    now = _iso(datetime.now())
+    with get_connection() as conn:
+        if retry_at is None:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', last_error = ?, locked_until = NULL, "
+                "updated_at = ? WHERE kind = ? AND entry_id = ?",
+                (error, now, kind, entry_id)
+            )
+        else:
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', last_error = ?, run_after = ?, "
+                "locked_until = NULL, updated_at = ? WHERE kind = ? AND entry_id = ?",
+                (error, _iso(retry_at), now, kind, entry_id)
+            )
+
+
+def get_job_counts(kind: str) -> dict[str, int]:
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT status, COUNT(*) AS cnt FROM jobs WHERE kind = ? GROUP BY status", (kind,)
+        ).fetchall()
+    return {row["status"]: row["cnt"] for row in rows}
+
+
+def find_untagged_entries(kind: str, include_failed: bool = False) -> list[int]:
+    """
+    Ids of entries with no knowledge graph tags and no job of `kind` (or,
+    with `include_failed`, a job that failed permanently).
+    """
+    job_filter = "j.id IS NULL OR j.status = 'failed'" if include_failed else "j.id IS NULL"
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT e.id FROM journal_entries e "
+            "LEFT JOIN jobs j ON j.kind = ? AND j.entry_id = e.id "
+            "WHERE NOT EXISTS (SELECT 1 FROM entry_tags et WHERE et.entry_id = e.id) "
+            f"AND ({job_filter}) "
+            "ORDER BY e.id",
+            (kind,)
+        ).fetchall()
+    return [row["id"] for row in rows]
+
+
+# ── Usage ledger ──────────────────────────────────────────────────────────────
+# Written by ai_engine after every model call. Usage isn't part of what the
+# app's cached reads show, so recording it doesn't bump the data version.
+
+def record_usage(
+    mode: str,
+    input_tokens: int,
+    output_tokens: int,
+    latency_ms: float,
+    backend: str = "",
+    ok: bool = True,
+):
+    """Log one model call and add it to its day's totals."""
+    now = datetime.now()
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO usage_log (created_at, mode, backend, input_tokens, output_tokens, latency_ms, ok) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (now.isoformat(), mode, backend, input_tokens, output_tokens, latency_ms, int(ok))
+        )
+        conn.execute(
+            "INSERT INTO usage_daily (day, mode, calls, errors, input_tokens, output_tokens, latency_ms) "
+            "VALUES (?, ?, 1, ?, ?, ?, ?) "
+            "ON CONFLICT(day, mode) DO UPDATE SET "
+            "calls = calls + 1, errors = errors + excluded.errors, "
+            "input_tokens = input_tokens + excluded.input_tokens, "
+            "output_tokens = output_tokens + excluded.output_tokens, "
+            "latency_ms = latency_ms + excluded.latency_ms",
+            (now.date().isoformat(), mode, int(not ok), input_tokens, output_tokens, latency_ms)
+        )
+
+
+def get_daily_usage(days: int = 30) -> list[dict]:
+    """Per-day, per-mode totals for the last `days` days, newest first."""
+    since = (datetime.now().date() - timedelta(days=days - 1)).isoformat()
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT day, mode, calls, errors, input_tokens, output_tokens, "
+            "latency_ms / calls AS avg_latency_ms "
+            "FROM usage_daily WHERE day >= ? ORDER BY day DESC, mode",
+            (since,)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_usage_for_day(day: str | None = None) -> dict[str, int]:
+    """Tokens (input + output) used per mode on `day` (ISO date, default today)."""
+    day = day or datetime.now().date().isoformat()
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT mode, input_tokens + output_tokens AS tokens FROM usage_daily WHERE day = ?", (day,)
+        ).fetchall()
+    return {row["mode"]: row["tokens"] for row in rows}
+
+
 # ── Knowledge Graph ───────────────────────────────────────────────────────────
 
+def _save_aliases(conn: sqlite3.Connection, aliases: list[tuple[str, str, int]]):
+    """Record (tag_type, alias key, tag id) rows, filed under their folded keys."""
+    conn.executemany(
+        "INSERT OR IGNORE INTO tag_aliases (tag_type, alias_key, tag_id) VALUES (?, ?, ?)", aliases
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO tag_blocks (tag_type, block, alias_key, tag_id) VALUES (?, ?, ?, ?)",
+        [(tag_type, tag_canonicalizer.fold_key(key), key, tag_id) for tag_type, key, tag_id in aliases]
+    )
+
+
+def _resolve_tag(
+    conn: sqlite3.Connection, entry_id: int, tag_type: str, tag_value: str, now: str
+) -> tuple[int, bool] | None:
+    """
+    The canonical tag id for a value, creating the tag if nothing matches.
+    Returns (tag id, created), or None for a blank value. A value merged into
+    a plural twin is recorded in merged_tags with the entry it came from.
+    """
+    key = tag_canonicalizer.canonical_key(tag_type, tag_value)
+    if not key:
+        return None
+    row = conn.execute(
+        "SELECT tag_id FROM tag_aliases WHERE tag_type = ? AND alias_key = ?", (tag_type, key)
+    ).fetchone()
+    if row:
+        return row["tag_id"], False
+
+    tag_id = None
+    if tag_type in tag_canonicalizer.FUZZY_TYPES:
+        # Every plural twin of `key` is filed under the same folded key.
+        candidates = conn.execute(
+            "SELECT alias_key, tag_id FROM tag_blocks WHERE tag_type = ? AND block = ?",
+            (tag_type, tag_canonicalizer.fold_key(key))
+        ).fetchall()
+        tag_id = tag_canonicalizer.best_match(tag_type, key, [tuple(c) for c in candidates])
+
+    created = False
+    if tag_id is not None:
+        conn.execute(
+            "INSERT OR IGNORE INTO merged_tags (tag_type, tag_value, created_at, merged_into, entry_ids) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (tag_type, tag_value, now, tag_id, json.dumps([entry_id]))
+        )
+    else:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO tags (tag_type, tag_value, created_at) VALUES (?, ?, ?)",
+            (tag_type, tag_value, now)
+        )
+        if cursor.rowcount:
+            tag_id, created = cursor.lastrowid, True
+        else:
+            tag_id = conn.execute(
+                "SELECT id FROM tags WHERE tag_type = ? AND tag_value = ?", (tag_type, tag_value)
+            ).fetchone()["id"]
+    _save_aliases(conn, [(tag_type, key, tag_id)])
+    return tag_id, created
+
+
 def save_tags(entry_id: int, tags: list[dict]):
     """
     Save structured tags extracted from a journal entry.
     Each tag: {"type": "Event"|"Entity"|..., "value": "..."}
+    Values are mapped onto canonical tags (tag_canonicalizer), so "Mom" and
+    "Mamá" link the entry to the same tag and count as two mentions of it.
     """
     now = datetime.now().isoformat()
-    with get_connection() as conn:
+    pairs = [(t.get("type", "Unknown"), t.get("value", "")) for t in tags]
+    conn = get_connection()
+    # IMMEDIATE: two writers resolving the same new spelling must not both create a tag.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        new_tags = 0
+        tag_ids = []
+        for tag_type, tag_value in pairs:
+            resolved = _resolve_tag(conn, entry_id, tag_type, tag_value, now)
+            if resolved is None:
+                continue
+            tag_id, created = resolved
+            tag_ids.append(tag_id)
+            if created:
+                # First time this value is seen: append it to its type's line.
+                conn.execute(
+                    "INSERT INTO tag_summary (tag_type, position, tag_values, tag_count) "
+                    "VALUES (?, (SELECT COUNT(*) FROM tag_summary), ?, 1) "
+                    "ON CONFLICT(tag_type) DO UPDATE SET "
+                    "tag_values = tag_values || ' | ' || excluded.tag_values, "
+                    "tag_count = tag_count + 1",
+                    (tag_type, tag_value)
+                )
+                new_tags += 1
+        if new_tags:
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'summary_version'")
+        linked = [
+            row["tag_id"] for row in conn.execute("SELECT tag_id FROM entry_tags WHERE entry_id = ?", (entry_id,))
+        ]
+        added = []
+        for tag_id in dict.fromkeys(tag_ids):
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO entry_tags (entry_id, tag_id, created_at) VALUES (?, ?, ?)",
+                (entry_id, tag_id, now)
+            )
+            if cursor.rowcount:
+                conn.execute(
+                    "UPDATE tags SET mentions = mentions + 1, last_seen = ? WHERE id = ?", (now, tag_id)
+                )
+                added.append(tag_id)
+        # Each newly linked tag now co-occurs with every other tag of the entry.
+        pairs = [(a, b) for i, a in enumerate(added) for b in linked + added[:i]]
         conn.executemany(
-            "INSERT INTO knowledge_graph (entry_id, tag_type, tag_value, created_at) VALUES (?, ?, ?, ?)",
-            [(entry_id, t.get("type", "Unknown"), t.get("value", ""), now) for t in tags]
+            "INSERT INTO tag_edges (src, dst, weight, last_seen) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT(src, dst) DO UPDATE SET weight = weight + 1, last_seen = excluded.last_seen",
+            [(a, b, now) for a, b in pairs] + [(b, a, now) for a, b in pairs]
         )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    _bump_data_version()
 
 
 def get_all_tags() -> list[dict]:
     with get_connection() as conn:
         rows = conn.execute(
-            "SELECT tag_type, tag_value, created_at FROM knowledge_graph ORDER BY created_at ASC"
+            "SELECT tag_type, tag_value, created_at FROM knowledge_graph ORDER BY created_at ASC, id ASC"
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_tag_stats() -> list[dict]:
+    """
+    One row per distinct tag, in first-seen order, with how often and how
+    recently it was mentioned. Feeds context_builder's relevance ranking.
+    """
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT tag_type, tag_value, mentions, created_at AS first_seen, last_seen "
+            "FROM tags ORDER BY id"
         ).fetchall()
     return [dict(row) for row in rows]
 
 
+def get_tag_snapshot(preview: int = 3, order: str = "recent") -> list[dict]:
+    """
+    Per-type overview of the knowledge graph for the sidebar, one dict per tag
+    type in first-seen order: {"tag_type", "count" (distinct tags), "preview"
+    (up to `preview` values)}.
+    order="recent" previews the newest tags of each type and only reads
+    `preview` rows per type off idx_tags_type_id, however many tags there are;
+    order="frequent" previews the most mentioned ones, which ranks every tag.
+    """
+    if order == "recent":
+        ranked = """
+            SELECT s.tag_type, t.tag_value,
+                   ROW_NUMBER() OVER (PARTITION BY s.tag_type ORDER BY t.id DESC) AS rn
+            FROM tag_summary s
+            JOIN tags t ON t.id IN (
+                SELECT id FROM tags WHERE tag_type = s.tag_type ORDER BY id DESC LIMIT :n
+            )
+        """
+    elif order == "frequent":
+        ranked = """
+            SELECT tag_type, tag_value,
+                   ROW_NUMBER() OVER (PARTITION BY tag_type ORDER BY mentions DESC, id) AS rn
+            FROM tags
+        """
+    else:
+        raise ValueError(f"unknown snapshot order: {order!r}")
+
+    with get_connection() as conn:
+        rows = conn.execute(
+            f"WITH ranked AS ({ranked}) "
+            "SELECT s.tag_type, s.tag_count, r.tag_value "
+            "FROM tag_summary s "
+            "LEFT JOIN ranked r ON r.tag_type = s.tag_type AND r.rn <= :n "
+            "ORDER BY s.position, r.rn",
+            {"n": preview}
+        ).fetchall()
+
+    snapshot: dict[str, dict] = {}
+    for row in rows:
+        group = snapshot.setdefault(
+            row["tag_type"], {"tag_type": row["tag_type"], "count": row["tag_count"], "preview": []}
+        )
+        if row["tag_value"] is not None:
+            group["preview"].append(row["tag_value"])
+    return list(snapshot.values())
+
+
+# ── Knowledge graph traversal ─────────────────────────────────────────────────
+# Nodes are canonical tags, edges are co-occurrence counts (tag_edges), so
+# related memories can be found locally without sending the tag list anywhere.
+
+def find_tags_in_text(text: str, max_words: int = 3, types=None) -> list[dict]:
+    """
+    Tags whose canonical key matches a run of up to `max_words` words of
+    `text` (so "¿Qué dijo mi mamá?" finds the Entity "Mamá"). Each result:
+    id, tag_type, tag_value, mentions; longest matches first.
+    """
+    words = tag_canonicalizer.normalize(text).split()
+    phrases = {
+        " ".join(words[i:i + n])
+        for n in range(max_words, 0, -1)
+        for i in range(len(words) - n + 1)
+    }
+    found: dict[int, dict] = {}
+    with get_connection() as conn:
+        for tag_type in types or tag_parser.TAG_TYPES:
+            keys = list({k for k in (tag_canonicalizer.canonical_key(tag_type, p) for p in phrases) if k})
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = conn.execute(
+                    "SELECT a.alias_key, t.id, t.tag_type, t.tag_value, t.mentions "
+                    "FROM tag_aliases a JOIN tags t ON t.id = a.tag_id "
+                    f"WHERE a.tag_type = ? AND a.alias_key IN ({', '.join('?' * len(chunk))})",
+                    (tag_type, *chunk)
+                ).fetchall()
+                for row in rows:
+                    found.setdefault(row["id"], {**dict(row), "words": len(row["alias_key"].split())})
+    results = sorted(found.values(), key=lambda t: (-t["words"], -t["mentions"], t["id"]))
+    for tag in results:
+        del tag["alias_key"], tag["words"]
+    return results
+
+
+def get_neighbors(tag_id: int, limit: int = 10, min_weight: int = 1) -> list[dict]:
+    """Tags that co-occur with `tag_id`, heaviest edge first: id, tag_type, tag_value, weight."""
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT t.id, t.tag_type, t.tag_value, e.weight "
+            "FROM tag_edges e JOIN tags t ON t.id = e.dst "
+            "WHERE e.src = ? AND e.weight >= ? "
+            "ORDER BY e.weight DESC, e.last_seen DESC LIMIT ?",
+            (tag_id, min_weight, limit)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_related_tags(tag_ids: list[int], k: int = 10) -> list[dict]:
+    """
+    Top-k tags co-occurring with any of `tag_ids` (which are excluded),
+    by summed edge weight: id, tag_type, tag_value, weight.
+    """
+    if not tag_ids:
+        return []
+    marks = ", ".join("?" * len(tag_ids))
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT t.id, t.tag_type, t.tag_value, SUM(e.weight) AS weight "
+            "FROM tag_edges e JOIN tags t ON t.id = e.dst "
+            f"WHERE e.src IN ({marks}) AND e.dst NOT IN ({marks}) "
+            "GROUP BY e.dst ORDER BY weight DESC, t.id LIMIT ?",
+            (*tag_ids, *tag_ids, k)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def expand_tags(tag_ids: list[int], hops: int = 2, fanout: int = 5, limit: int = 20) -> list[dict]:
+    """
+    Breadth-first k-hop expansion from `tag_ids`, following each node's
+    `fanout` heaviest edges. Returns up to `limit` reached tags (seeds
+    excluded) with the hop they were first reached at and a score that
+    halves with every hop, best first. Cost is bounded by fanout ** hops.
+    """
+    seen = set(tag_ids)
+    frontier = list(dict.fromkeys(tag_ids))
+    reached: dict[int, dict] = {}
+    for hop in range(1, hops + 1):
+        next_frontier = []
+        for node in frontier:
+            neighbors = get_neighbors(node, limit=fanout)
+            total = sum(n["weight"] for n in neighbors) or 1
+            for n in neighbors:
+                score = 0.5 ** (hop - 1) * n["weight"] / total
+                if n["id"] in reached:
+                    reached[n["id"]]["score"] += score
+                elif n["id"] not in seen:
+                    seen.add(n["id"])
+                    reached[n["id"]] = {**n, "hop": hop, "score": score}
+                    next_frontier.append(n["id"])
+        frontier = next_frontier
+        if not frontier:
+            break
+    results = sorted(reached.values(), key=lambda t: (-t["score"], t["hop"], t["id"]))[:limit]
+    for tag in results:
+        del tag["weight"]
+    return results
+
+
+# At most this many tags are read per get_entries_for_tags() call (one indexed query each).
+MAX_ENTRY_TAG_LOOKUPS = 16
+
+
+def get_entries_for_tags(tag_ids: list[int], limit: int = 5, exclude_ids=()) -> list[dict]:
+    """
+    Entries most recently tagged with any of `tag_ids`, newest first (id,
+    content, created_at). Each tag only contributes its newest links, read
+    backwards off idx_entry_tags_tag_id, so a tag on half the diary costs the
+    same as a rare one. Only the first MAX_ENTRY_TAG_LOOKUPS distinct tags
+    are read; callers pass their most relevant tags first.
+    """
+    excluded = set(exclude_ids)
+    candidates: set[int] = set()
+    with get_connection() as conn:
+        for tag_id in list(dict.fromkeys(tag_ids))[:MAX_ENTRY_TAG_LOOKUPS]:
+            rows = conn.execute(
+                "SELECT entry_id FROM entry_tags WHERE tag_id = ? ORDER BY id DESC LIMIT ?",
+                (tag_id, limit + len(excluded))
+            ).fetchall()
+            candidates.update(row["entry_id"] for row in rows if row["entry_id"] not in excluded)
+        newest = sorted(candidates, reverse=True)[:limit]
+        if not newest:
+            return []
+        rows = conn.execute(
+            "SELECT id, content, created_at FROM journal_entries "
+            f"WHERE id IN ({', '.join('?' * len(newest))}) ORDER BY id DESC",
+            newest
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+# Rendered summary for the last summary_version seen, per database file.
+_summary_cache: dict[str, tuple[int, str]] = {}
+
+
 def get_knowledge_summary() -> str:
-    """Returns a formatted summary of all knowledge graph tags for AI context."""
-    tags = get_all_tags()
-    if not tags:
-        return "No memories recorded yet."
-
-    grouped: dict[str, list] = {}
-    for t in tags:
-        grouped.setdefault(t["tag_type"], []).append(t["tag_value"])
-
-    lines = []
-    for tag_type, values in grouped.items():
-        # Deduplicate while preserving order
-        seen = []
-        for v in values:
-            if v not in seen:
-                seen.append(v)
-        lines.append(f"[{tag_type}]: {' | '.join(seen)}")
-
-    return "\n".join(lines)
+    """
+    Returns a formatted summary of all knowledge graph tags for AI context.
+    Reads the materialized tag_summary table; when summary_version hasn't moved
+    since the last call, the cached text is returned after a single lookup.
+    """
+    path = str(DB_PATH)
+    with get_connection() as conn:
+        version = conn.execute(
+            "SELECT value FROM meta WHERE key = 'summary_version'"
+        ).fetchone()["value"]
+        cached = _summary_cache.get(path)
+        if cached and cached[0] == version:
+            return cached[1]
+        rows = conn.execute(
+            "SELECT tag_type, tag_values FROM tag_summary ORDER BY position"
+        ).fetchall()
+
+    if rows:
+        summary = "\n".join(f"[{row['tag_type']}]: {row['tag_values']}" for row in rows)
+    else:
+        summary = "No memories recorded yet."
+    _summary_cache[path] = (version, summary)
+    return summary
@@ -0,0 +1,127 @@
+"""
+read_model.py
+-------------
+Memoized reads for the Streamlit app.
+Every interaction reruns app.py from the top, so the sidebar and modes would
+otherwise query SQLite on every click. Reads here are cached in-process, shared
+by all sessions, and keyed by memories_db.data_version(), which every write
+(save_entry, save_tags, set_profile) bumps. A rerun with no new writes is
+served entirely from memory.
+
+Writes from other processes (e.g. `python extraction_worker.py backfill`)
+don't bump this process's version, so cached reads also expire after
+READ_MODEL_MAX_AGE seconds.
+
+Free-text searches are keyed by whatever the user types, so only the latest
+SEARCH_CACHE_SIZE of them are kept, and all are dropped when the data changes.
+
+Returned values are shared between callers: treat them as read-only.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import memories_db as db
+
+MAX_AGE_SECONDS = float(os.getenv("READ_MODEL_MAX_AGE", "60"))
+SEARCH_CACHE_SIZE = int(os.getenv("READ_MODEL_SEARCH_CACHE_SIZE", "32"))
+
+# (name, args) -> (data version, fetched at, value)
+_cache: dict[tuple, tuple[int, float, object]] = {}
+# Search args -> (fetched at, results), least recently used first; all for _search_version.
+_searches: OrderedDict[tuple, tuple[float, list[dict]]] = OrderedDict()
+_search_version = None
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _memoized(name: str, loader, *args):
+    key = (name, args)
+    version = db.data_version()
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == version and now - cached[1] < MAX_AGE_SECONDS:
+            _stats["hits"] += 1
+            return cached[2]
+        _stats["misses"] += 1
+    # The version is read before querying, so a write that lands mid-query
+    # leaves this result stale-tagged and it is refetched on the next read.
+    value = loader(*args)
+    with _lock:
+        _cache[key] = (version, now, value)
+    return value
+
+
+def invalidate():
+    """Drop every cached read (e.g. after writing to the database from elsewhere)."""
+    with _lock:
+        _cache.clear()
+        _searches.clear()
+
+
+def stats() -> dict:
+    with _lock:
+        return {**_stats, "cached": len(_cache) + len(_searches), "version": db.data_version()}
+
+
+# ── Reads ─────────────────────────────────────────────────────────────────────
+
+def entry_count() -> int:
+    return _memoized("entry_count", db.get_entry_count)
+
+
+def profile() -> dict:
+    return _memoized("profile", db.get_profile)
+
+
+def profile_is_complete() -> bool:
+    return _memoized("profile_is_complete", db.profile_is_complete)
+
+
+def first_last_dates() -> tuple[str, str] | None:
+    return _memoized("first_last_dates", db.get_first_last_dates)
+
+
+def all_tags() -> list[dict]:
+    return _memoized("all_tags", db.get_all_tags)
+
+
+def tag_snapshot(preview: int = 3, order: str = "recent") -> list[dict]:
+    return _memoized("tag_snapshot", db.get_tag_snapshot, preview, order)
+
+
+def tag_stats() -> list[dict]:
+    return _memoized("tag_stats", db.get_tag_stats)
+
+
+def knowledge_summary() -> str:
+    return _memoized("knowledge_summary", db.get_knowledge_summary)
+
+
+def search_entries(query: str, limit: int = 20, date_range=None) -> list[dict]:
+    global _search_version
+    key = (query, limit, date_range)
+    version = db.data_version()
+    now = time.monotonic()
+    with _lock:
+        if version != _search_version:
+            _searches.clear()
+            _search_version = version
+        cached = _searches.get(key)
+        if cached and now - cached[0] < MAX_AGE_SECONDS:
+            _searches.move_to_end(key)
+            _stats["hits"] += 1
+            return cached[1]
+        _stats["misses"] += 1
+    value = db.search_entries(query, limit, date_range)
+    with _lock:
+        # Same rule as _memoized(): a result from an older version isn't kept.
+        if version == _search_version:
+            _searches[key] = (now, value)
+            _searches.move_to_end(key)
+            while len(_searches) > SEARCH_CACHE_SIZE:
+                _searches.popitem(last=False)
+    return value
@@ -0,0 +1,175 @@
+"""
+retrieval.py
+------------
+Local retrieval over the whole diary for Past Self Mode.
+Candidates come from the FTS5 index in memories_db (BM25 ranking), then get
+re-ranked with hashed bag-of-words vectors computed on the fly, so only a
+bounded number of entries is ever loaded into memory. Tags named in the
+question are expanded over the co-occurrence graph to pull in a few related
+entries that share no words with it. No API calls.
+"""
+
+import math
+import zlib
+
+import memories_db as db
+from context_builder import tokenize
+
+# Distinct words taken from a question; each is searched with its plural twin.
+MAX_QUERY_TERMS = 12
+MIN_TERM_CHARS = 3
+# Question filler that tokenize() keeps ("what did I think about…").
+QUERY_STOPWORDS = frozenset("""
+about also any been being can could did does doing done dont else ever feel felt
+get got how just know knew like more much remember said say should some tell than
+then there think thought told very want was well were will would
+algo aqui alli como cual cuando donde dije dijo era eran estaba estar esto eso fue
+hay hice hizo mas muy nada otra otro para pense pero pienso porque puedo quien
+fui fuimos pensaba recuerdas recuerdo sentia siento sobre tambien tenia tengo todo ya
+""".split())
+CANDIDATE_POOL = 30
+# Words found in more than this share of entries (but never fewer than
+# COMMON_TERM_MIN_ENTRIES) are too common to rank by; when a question only has
+# common words, just the newest entries are searched. Counting stops at
+# COMMON_TERM_MAX_ENTRIES, so a very common word costs little to check.
+COMMON_TERM_RATIO = 0.10
+COMMON_TERM_MIN_ENTRIES = 50
+COMMON_TERM_MAX_ENTRIES = 200
+COMMON_TERM_WINDOW = 2000
+
+VECTOR_DIMS = 1 << 12
+# Only the start of long entries is vectorized, which bounds re-ranking cost.
+VECTOR_TEXT_CHARS = 2000
+BM25_WEIGHT = 0.7
+VECTOR_WEIGHT = 0.3
+
+# Graph expansion: hops and per-node fanout bound the traversal; at most
+# GRAPH_ENTRIES extra entries are added to a Past Self context.
+GRAPH_HOPS = 2
+GRAPH_FANOUT = 5
+GRAPH_TAGS = 8
+GRAPH_ENTRIES = 3
+
+
+# ── Hashed vectors ────────────────────────────────────────────────────────────
+
+def _stem(word: str) -> str:
+    return word[:5]
+
+
+def hashed_vector(text: str) -> dict[int, float]:
+    """L2-normalized sparse vector of hashed word stems and stem bigrams."""
+    stems = [_stem(w) for w in tokenize(text)]
+    features = stems + [f"{a} {b}" for a, b in zip(stems, stems[1:])]
+    counts: dict[int, int] = {}
+    for feature in features:
+        # crc32 rather than hash(): stable across processes.
+        index = zlib.crc32(feature.encode("utf-8")) % VECTOR_DIMS
+        counts[index] = counts.get(index, 0) + 1
+    weights = {i: 1.0 + math.log(c) for i, c in counts.items()}
+    norm = math.sqrt(sum(w * w for w in weights.values()))
+    return {i: w / norm for i, w in weights.items()} if norm else {}
+
+
+def cosine(a: dict[int, float], b: dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(i, 0.0) for i, w in a.items())
+
+
+# ── Query building ────────────────────────────────────────────────────────────
+
+def _query_terms(question: str) -> list[str]:
+    """Distinct content words of `question`, in order, at most MAX_QUERY_TERMS."""
+    words = [
+        word for word in tokenize(question)
+        if len(word) >= MIN_TERM_CHARS and word not in QUERY_STOPWORDS
+    ]
+    return list(dict.fromkeys(words))[:MAX_QUERY_TERMS]
+
+
+def _variants(word: str) -> list[str]:
+    # Cheap plural folding, both ways: "amigos" <-> "amigo".
+    if len(word) > 3 and word.endswith("s"):
+        return [word, word[:-1]]
+    return [word, word + "s"]
+
+
+def _word_query(word: str) -> str:
+    # Quoted so user text can never be read as FTS5 syntax.
+    return "(" + " OR ".join('"' + term.replace('"', '""') + '"' for term in _variants(word)) + ")"
+
+
+def _fts_query(words: list[str]) -> str:
+    return " OR ".join(_word_query(word) for word in words)
+
+
+# ── Search ────────────────────────────────────────────────────────────────────
+
+def find_relevant_entries(question: str, k: int = 8) -> list[dict]:
+    """
+    Top-k entries most relevant to `question` across the whole diary, best
+    first. Each result has id, content, created_at and a `score` in [0, 1].
+    Returns [] when nothing matches or the FTS index isn't available.
+    """
+    terms = _query_terms(question)
+    if not terms or not db.fts_enabled():
+        return []
+
+    latest_id = db.get_latest_entry_id()
+    limit = min(max(COMMON_TERM_MIN_ENTRIES, int(latest_id * COMMON_TERM_RATIO)), COMMON_TERM_MAX_ENTRIES)
+    counts = db.get_match_counts([_word_query(t) for t in terms], cap=limit + 1)
+    selective = [t for t in terms if 0 < counts[_word_query(t)] <= limit]
+    common = [t for t in terms if counts[_word_query(t)] > limit]
+
+    if selective:
+        candidates = db.match_entries(_fts_query(selective), CANDIDATE_POOL)
+    elif common:
+        candidates = db.match_entries(
+            _fts_query(common), CANDIDATE_POOL, min_id=max(latest_id - COMMON_TERM_WINDOW, 0)
+        )
+    else:
+        return []
+    if not candidates:
+        return []
+
+    query_vector = hashed_vector(question)
+    best_bm25 = max(-c["rank"] for c in candidates) or 1.0
+    for c in candidates:
+        c["score"] = (
+            BM25_WEIGHT * (-c.pop("rank") / best_bm25)
+            + VECTOR_WEIGHT * cosine(query_vector, hashed_vector(c["content"][:VECTOR_TEXT_CHARS]))
+        )
+    candidates.sort(key=lambda c: c["score"], reverse=True)
+    return candidates[:k]
+
+
+def graph_related_entries(question: str, k: int = GRAPH_ENTRIES, exclude_ids=()) -> list[dict]:
+    """
+    Entries reached through the knowledge graph: tags named in `question`,
+    plus the tags most often seen with them (up to GRAPH_HOPS away), then the
+    newest entries carrying those tags. Newest first.
+    """
+    seeds = [t["id"] for t in db.find_tags_in_text(question)][:GRAPH_TAGS]
+    if not seeds:
+        return []
+    related = db.expand_tags(seeds, hops=GRAPH_HOPS, fanout=GRAPH_FANOUT, limit=GRAPH_TAGS)
+    return db.get_entries_for_tags(seeds + [t["id"] for t in related], k, exclude_ids)
+
+
+def entries_for_past_self(question: str, k: int = 12, recent: int = 5) -> list[dict]:
+    """
+    Context entries for a Past Self reply, most important first: the most
+    relevant matches (best first), a few graph-related entries, then the
+    latest few entries (so small talk still has something to draw on),
+    deduplicated. Prompt builders keep them in this order when trimming to a
+    budget and show the ones kept chronologically.
+    """
+    selected: dict[int, dict] = {}
+    for entry in find_relevant_entries(question, k):
+        selected.setdefault(entry["id"], entry)
+    for entry in graph_related_entries(question, exclude_ids=selected):
+        selected.setdefault(entry["id"], entry)
+    for entry in db.get_recent_entries(recent):
+        selected.setdefault(entry["id"], entry)
+    return list(selected.values())
@@ -0,0 +1,122 @@
+"""
+tag_canonicalizer.py
+--------------------
+Canonical keys for knowledge graph tags, so variants of one thing ("Mom",
+"my mom", "Mamá") are stored as a single tag.
+A tag's key is its value NFKC-normalized, casefolded and stripped of accents
+and punctuation; for entities, leading possessives/articles are dropped and
+common family words are mapped through an alias table. Keys that still differ
+are merged only when every word matches up to a plural ending ("reunión" /
+"reuniones"); names never are, so "Daniel" and "Daniela" stay two people.
+Plural twins always share a folded key (fold_key()), so candidates are looked
+up by that key exactly, never by scanning other tags.
+memories_db stores the keys (tag_aliases / tag_blocks) and uses these
+functions both in save_tags() and when migrating existing tags.
+"""
+
+import re
+import unicodedata
+
+# Words dropped from the start of entity values: "my mom" -> "mom".
+ENTITY_DETERMINERS = frozenset("""
+my our his her their the a an
+mi mis tu tus su sus nuestro nuestra nuestros nuestras el la los las un una
+""".split())
+
+# Normalized entity keys that name the same person. Values are the canonical key.
+ENTITY_ALIASES = {
+    **dict.fromkeys(["mom", "mum", "mother", "mommy", "mummy", "mama", "mami", "madre"], "mother"),
+    **dict.fromkeys(["dad", "father", "daddy", "papa", "papi", "padre"], "father"),
+    **dict.fromkeys(["grandma", "grandmother", "granny", "abuela", "abuelita"], "grandmother"),
+    **dict.fromkeys(["grandpa", "grandfather", "granddad", "abuelo", "abuelito"], "grandfather"),
+    **dict.fromkeys(["brother", "bro", "hermano"], "brother"),
+    **dict.fromkeys(["sister", "sis", "hermana"], "sister"),
+    **dict.fromkeys(["husband", "esposo", "marido"], "husband"),
+    **dict.fromkeys(["wife", "esposa"], "wife"),
+}
+
+# Types whose values can be merged across plural endings. Entities are names
+# (one letter apart is another person) and Syntax tags record exact phrasing,
+# so only identical keys are merged there.
+FUZZY_TYPES = frozenset({"Event", "Sentiment/Trigger", "Core Belief"})
+PLURAL_ENDINGS = ("s", "es")
+MIN_STEM_CHARS = 3
+
+_NON_WORD_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def normalize(value: str) -> str:
+    """NFKC, casefolded, accents and punctuation removed, single spaces."""
+    text = unicodedata.normalize("NFKD", unicodedata.normalize("NFKC", value).casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD_RE.sub(" ", text).strip()
+
+
+def canonical_key(tag_type: str, value: str) -> str:
+    """The key two tags of `tag_type` must share to be the same tag ("" for blank values)."""
+    key = normalize(value)
+    if tag_type == "Entity":
+        words = key.split()
+        while len(words) > 1 and words[0] in ENTITY_DETERMINERS:
+            words.pop(0)
+        key = " ".join(words)
+        key = ENTITY_ALIASES.get(key, key)
+    return key
+
+
+def _fold_word(word: str) -> str:
+    # Trailing "s"/"e" letters come off one at a time, so "amigos" -> "amigo"
+    # and "reuniones" -> "reunione" -> "reunion": a word and its plural end up
+    # the same. Unrelated words may fold together too; same_key() decides.
+    while len(word) > MIN_STEM_CHARS and word[-1] in "se":
+        word = word[:-1]
+    return word
+
+
+def fold_key(key: str) -> str:
+    """A key with plural endings folded away. Keys that are the same up to plurals share it."""
+    return " ".join(_fold_word(word) for word in key.split())
+
+
+def _same_word(a: str, b: str) -> bool:
+    """Equal, or one is the other plus a plural ending ("amigo" / "amigos")."""
+    if a == b:
+        return True
+    short, long = sorted((a, b), key=len)
+    return len(short) >= MIN_STEM_CHARS and any(long == short + ending for ending in PLURAL_ENDINGS)
+
+
+def same_key(a: str, b: str) -> bool:
+    """Whether two keys differ at most in the plural endings of their words."""
+    words_a, words_b = a.split(), b.split()
+    return len(words_a) == len(words_b) and all(map(_same_word, words_a, words_b))
+
+
+def best_match(tag_type: str, key: str, candidates) -> int | None:
+    """Tag id of the first (alias key, tag id) candidate that is the same key up to plurals."""
+    if tag_type not in FUZZY_TYPES:
+        return None
+    for candidate_key, tag_id in candidates:
+        if same_key(key, candidate_key):
+            return tag_id
+    return None
+
+
+class TagIndex:
+    """In-memory key and folded-key index, for canonicalizing many tags at once (migrations)."""
+
+    def __init__(self):
+        self._keys: dict[tuple[str, str], int] = {}
+        self._folds: dict[tuple[str, str], list[tuple[str, int]]] = {}
+
+    def find(self, tag_type: str, key: str) -> int | None:
+        tag_id = self._keys.get((tag_type, key))
+        if tag_id is not None:
+            return tag_id
+        return best_match(tag_type, key, self._folds.get((tag_type, fold_key(key)), ()))
+
+    def add(self, tag_type: str, key: str, tag_id: int):
+        if (tag_type, key) in self._keys:
+            return
+        self._keys[(tag_type, key)] = tag_id
+        self._folds.setdefault((tag_type, fold_key(key)), []).append((key, tag_id))
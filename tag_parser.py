@@ -0,0 +1,200 @@
+"""
+tag_parser.py
+-------------
+Tolerant parsing of knowledge graph tags out of model responses.
+Extraction asks for schema-constrained JSON, which normally parses in one
+json.loads(). When a response still comes back fenced, with a preamble, with
+trailing text or cut off, a single pass over the text recovers every complete
+JSON object in it, so the tags that did arrive aren't thrown away. Tag types
+are checked against the five knowledge graph categories and values are
+normalized.
+"""
+
+import json
+import re
+import unicodedata
+from collections.abc import Iterator
+
+TAG_TYPES = ("Event", "Entity", "Sentiment/Trigger", "Core Belief", "Syntax")
+
+# Spellings models use for the five types (compared casefolded, without spaces).
+TYPE_ALIASES = {
+    "event": "Event",
+    "entity": "Entity",
+    "person": "Entity",
+    "place": "Entity",
+    "sentiment/trigger": "Sentiment/Trigger",
+    "sentiment-trigger": "Sentiment/Trigger",
+    "sentiment": "Sentiment/Trigger",
+    "trigger": "Sentiment/Trigger",
+    "emotion": "Sentiment/Trigger",
+    "corebelief": "Core Belief",
+    "core_belief": "Core Belief",
+    "belief": "Core Belief",
+    "syntax": "Syntax",
+    "phrase": "Syntax",
+}
+
+MAX_VALUE_CHARS = 200
+
+# JSON schemas for Gemini structured output (response_schema).
+TAG_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string", "enum": list(TAG_TYPES)},
+        "value": {"type": "string"},
+    },
+    "required": ["type", "value"],
+}
+TAGS_SCHEMA = {"type": "array", "items": TAG_SCHEMA}
+BATCH_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "id": {"type": "string"},
+            "tags": TAGS_SCHEMA,
+        },
+        "required": ["id", "tags"],
+    },
+}
+
+_SPACE_RE = re.compile(r"\s+")
+_STRIP_CHARS = " \t\r\n\"'`“”‘’«».,;:"
+
+
+# ── Normalization ─────────────────────────────────────────────────────────────
+
+def normalize_type(tag_type) -> str | None:
+    """One of TAG_TYPES, or None if `tag_type` isn't recognizable as one."""
+    if not isinstance(tag_type, str):
+        return None
+    return TYPE_ALIASES.get(tag_type.casefold().replace(" ", ""))
+
+
+def normalize_value(value) -> str:
+    """NFC, single spaces, no wrapping quotes or trailing punctuation, capped length."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str):
+        return ""
+    value = _SPACE_RE.sub(" ", unicodedata.normalize("NFC", value)).strip(_STRIP_CHARS)
+    return value[:MAX_VALUE_CHARS].rstrip()
+
+
+def clean_tags(items) -> list[dict]:
+    """Valid, normalized {"type", "value"} tags from `items`, deduplicated, in order."""
+    if not isinstance(items, list):
+        return []
+    tags, seen = [], set()
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        tag_type = normalize_type(item.get("type"))
+        value = normalize_value(item.get("value"))
+        if tag_type is None or not value:
+            continue
+        key = (tag_type, value.casefold())
+        if key not in seen:
+            seen.add(key)
+            tags.append({"type": tag_type, "value": value})
+    return tags
+
+
+# ── Scanning ──────────────────────────────────────────────────────────────────
+
+def _strip_fences(text: str) -> str:
+    raw = text.strip()
+    if raw.startswith("```"):
+        raw = raw.split("\n", 1)[1] if "\n" in raw else raw[3:]
+        if raw.rstrip().endswith("```"):
+            raw = raw.rstrip()[:-3]
+    return raw.strip()
+
+
+def iter_objects(text: str) -> Iterator[dict]:
+    """
+    Every complete JSON object in `text`, innermost first, in one pass.
+    Tracks string/escape state and brace depth, and only decodes an object's
+    slice once its closing brace arrives, so surrounding prose, fences and a
+    truncated tail are skipped.
+    """
+    starts: list[int] = []
+    in_string = escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            starts.append(i)
+        elif ch == "}" and starts:
+            start = starts.pop()
+            try:
+                obj = json.loads(text[start:i + 1])
+            except ValueError:
+                continue
+            if isinstance(obj, dict):
+                yield obj
+
+
+def _loads(text: str):
+    """json.loads of the response (fences stripped), or None if it isn't valid JSON."""
+    try:
+        return json.loads(_strip_fences(text))
+    except ValueError:
+        return None
+
+
+# ── Parsing ───────────────────────────────────────────────────────────────────
+
+def parse_tags(text: str) -> list[dict]:
+    """
+    Tags from a single-entry extraction response. Raises ValueError only if
+    the response has neither valid JSON nor any recoverable tag object.
+    """
+    parsed = _loads(text)
+    if isinstance(parsed, dict) and "tags" in parsed:
+        parsed = parsed["tags"]
+    if isinstance(parsed, list):
+        return clean_tags(parsed)
+    if isinstance(parsed, dict):
+        return clean_tags([parsed])
+
+    found = [obj for obj in iter_objects(text) if "type" in obj and "value" in obj]
+    if not found:
+        raise ValueError("no tags could be recovered from the response")
+    return clean_tags(found)
+
+
+def parse_batch(text: str) -> dict[str, list[dict]]:
+    """
+    Tags by entry id (as a string) from a batched extraction response:
+    [{"id": "12", "tags": [...]}, ...], or the older {"12": [...]} form.
+    Entries whose object is cut off are left out, so the caller retries them.
+    Raises ValueError if no entry at all can be recovered.
+    """
+    parsed = _loads(text)
+    if isinstance(parsed, dict) and not ("id" in parsed and "tags" in parsed):
+        return {str(k): clean_tags(v) for k, v in parsed.items() if isinstance(v, list)}
+    if isinstance(parsed, dict):
+        parsed = [parsed]
+    if isinstance(parsed, list):
+        items = parsed
+    else:
+        items = list(iter_objects(text))
+
+    results = {
+        str(item["id"]): clean_tags(item["tags"])
+        for item in items
+        if isinstance(item, dict) and "id" in item and isinstance(item.get("tags"), list)
+    }
+    if not results and not (isinstance(parsed, list) and not parsed):
+        raise ValueError("no entries could be recovered from the batch response")
+    return results
+
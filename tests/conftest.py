@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Before ai_engine is imported: no API calls, no response cache in the repo.
+os.environ.setdefault("AI_BACKEND", "fake")
+os.environ.setdefault("AI_CACHE_PATH", str(Path(tempfile.mkdtemp(prefix="ai-cache-")) / "ai_cache.db"))
+
+import memories_db as db  # noqa: E402
+import read_model  # noqa: E402
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """memories_db pointed at a fresh, fully migrated database in tmp_path."""
+    path = tmp_path / "memories.db"
+    db.close_connections()
+    monkeypatch.setattr(db, "DB_PATH", path)
+    read_model.invalidate()
+    db.init_db()
+    yield path
+    db.close_connections()
+    read_model.invalidate()
@@ -0,0 +1,92 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import ai_engine as ai
+
+SNAPSHOT = "[Entity]: " + " | ".join(f"persona{i}" for i in range(400))
+
+
+class SlowCacheClient:
+    """cachedContents stub whose uploads wait until `release` is set."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.created = []
+
+    def create_cached_content(self, request, **kwargs):
+        self.release.wait(5)
+        self.created.append(request.cached_content.system_instruction.parts[0].text)
+        return SimpleNamespace(name=f"cachedContents/{len(self.created)}")
+
+    def delete_cached_content(self, request, **kwargs):
+        pass
+
+
+class CachingBackend:
+    name = "stub"
+    supports_context_cache = True
+
+    def __init__(self):
+        self.cached_content = []
+
+    def chat(self, mode, api_key, history, text, stream=False, cached_content=None):
+        self.cached_content.append(cached_content)
+        return SimpleNamespace(text="ok")
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    client = SlowCacheClient()
+    registry = ai.ClientRegistry(client_factory=lambda key: None, cache_client_factory=lambda key: client)
+    monkeypatch.setattr(ai, "client_registry", registry)
+    monkeypatch.setattr(ai, "context_cache", ai.ContextCache(registry, True, 100, 3600))
+    monkeypatch.setattr(ai, "CONTEXT_CACHE_MIN_TOKENS", 100)
+    monkeypatch.setattr(ai, "backend", CachingBackend())
+    monkeypatch.setattr(ai.response_cache, "modes", set())
+    return client
+
+
+def _wait_for_upload():
+    for _ in range(250):
+        if not ai.context_cache._uploading:
+            return
+        threading.Event().wait(0.02)
+    raise AssertionError("upload still running")
+
+
+def test_snapshot_is_used_only_once_its_cache_is_live(cache):
+    profile = {"name_and_life_stage": "Ana"}
+    # No live handle yet: ranked context now, upload in the background (not awaited).
+    first = ai.knowledge_text("past_self", [], "hola", snapshot=SNAPSHOT, api_key="k", profile=profile)
+    assert first != SNAPSHOT
+    cache.release.set()
+    _wait_for_upload()
+
+    knowledge = ai.knowledge_text("past_self", [], "hola", snapshot=SNAPSHOT, api_key="k", profile=profile)
+    assert knowledge == SNAPSHOT
+    # The prompt builder keeps the snapshot whole, so the turn hits the uploaded prefix.
+    ai.get_past_self_response("k", "hola", profile, knowledge, [], [])
+    assert ai.backend.cached_content == ["cachedContents/1"]
+    assert len(cache.created) == 1
+
+
+def test_snapshot_too_big_for_the_prompt_is_never_uploaded(cache, monkeypatch):
+    cache.release.set()
+    monkeypatch.setitem(ai.PROMPT_TOKEN_BUDGETS, "past_self", ai._cached_tokens(ai.PAST_SELF_SYSTEM_PROMPT) + 1000)
+    knowledge = ai.knowledge_text("past_self", [], "hola", snapshot=SNAPSHOT, api_key="k", profile={})
+    _wait_for_upload()
+    assert knowledge != SNAPSHOT
+    assert cache.created == []
+
+
+def test_failed_upload_keeps_the_ranked_context(cache):
+    def fail(request, **kwargs):
+        raise ai.google_exceptions.PermissionDenied("no")
+
+    cache.create_cached_content = fail
+    for _ in range(2):
+        assert ai.knowledge_text("past_self", [], "hola", snapshot=SNAPSHOT, api_key="k") != SNAPSHOT
+        _wait_for_upload()
+    assert ai.context_cache.stats()["failed"] == 1
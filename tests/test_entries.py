@@ -0,0 +1,16 @@
+import pytest
+
+import memories_db as db
+
+
+def test_iter_entries_pages_in_id_order(temp_db):
+    ids = [db.save_entry(f"entrada {i}") for i in range(7)]
+    assert [e["id"] for e in db.iter_entries(page_size=3)] == ids
+    assert [e["id"] for e in db.iter_entries(after_id=ids[2], limit=3, page_size=2)] == ids[3:6]
+    assert list(db.iter_entries(limit=0)) == []
+
+
+@pytest.mark.parametrize("kwargs", [{"limit": -1}, {"page_size": 0}, {"page_size": -5}])
+def test_iter_entries_rejects_bad_arguments_eagerly(temp_db, kwargs):
+    with pytest.raises(ValueError):
+        db.iter_entries(**kwargs)
@@ -0,0 +1,37 @@
+import time
+from datetime import datetime, timedelta
+
+import extraction_worker
+import memories_db as db
+
+KIND = extraction_worker.EXTRACT_TAGS
+
+
+def _job(entry_id):
+    row = db.get_connection().execute(
+        "SELECT * FROM jobs WHERE kind = ? AND entry_id = ?", (KIND, entry_id)
+    ).fetchone()
+    return dict(row) if row else None
+
+
+def test_save_entry_queues_its_job_in_the_same_write(temp_db):
+    due = db.save_entry("hoy", job_kind=KIND)
+    later = db.save_entry("mañana", job_kind=KIND, job_run_after=datetime.now() + timedelta(minutes=5))
+    assert _job(due)["status"] == _job(later)["status"] == "pending"
+
+    claimed = db.claim_jobs(KIND, limit=10, lease_seconds=60)
+    assert [job["entry_id"] for job in claimed] == [due]
+
+    db.complete_job(KIND, later)
+    assert _job(later)["status"] == "done"
+    assert db.claim_jobs(KIND, limit=10, lease_seconds=60) == []
+
+
+def test_batch_lease_is_renewed_while_processing(temp_db, monkeypatch):
+    monkeypatch.setattr(extraction_worker, "LEASE_RENEW_SECONDS", 0.05)
+    entry = db.save_entry("hoy", job_kind=KIND)
+    jobs = db.claim_jobs(KIND, limit=1, lease_seconds=0.01)
+    with extraction_worker._leased(jobs):
+        time.sleep(0.2)
+        assert db.claim_jobs(KIND, limit=1, lease_seconds=60) == []
+    assert _job(entry)["locked_until"] > datetime.now().isoformat()
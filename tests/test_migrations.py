@@ -0,0 +1,91 @@
+import sqlite3
+
+import pytest
+
+import memories_db as db
+import read_model
+
+# What the original app wrote: one flat knowledge_graph row per tag mention.
+BASELINE_ENTRIES = [
+    (1, "Cené con mamá y Ana", "2024-01-01T20:00:00"),
+    (2, "Otra reunión con amigos", "2024-01-02T20:00:00"),
+    (3, "Ana me llamó", "2024-01-03T20:00:00"),
+]
+BASELINE_TAGS = [
+    (1, "Entity", "Mamá", "2024-01-01T20:00:00"),
+    (1, "Entity", "Ana", "2024-01-01T20:00:00"),
+    (1, "Event", "Reunión con amigos", "2024-01-01T20:00:00"),
+    (2, "Event", "reuniones con amigo", "2024-01-02T20:00:00"),
+    (2, "Entity", "Ana", "2024-01-02T20:00:00"),
+    (3, "Entity", "Ana", "2024-01-03T20:00:00"),
+    (3, "Entity", "my mom", "2024-01-03T20:00:00"),
+]
+
+
+@pytest.fixture
+def baseline_db(tmp_path, monkeypatch):
+    """A database as the original app left it (schema v1, user_version 0), opened through memories_db."""
+    path = tmp_path / "memories.db"
+    conn = sqlite3.connect(path)
+    db._migrate_v1(conn)
+    conn.executemany(
+        "INSERT INTO journal_entries (id, content, ai_response, created_at) VALUES (?, ?, '', ?)",
+        BASELINE_ENTRIES
+    )
+    conn.executemany(
+        "INSERT INTO knowledge_graph (entry_id, tag_type, tag_value, created_at) VALUES (?, ?, ?, ?)",
+        BASELINE_TAGS
+    )
+    conn.commit()
+    conn.close()
+    db.close_connections()
+    monkeypatch.setattr(db, "DB_PATH", path)
+    read_model.invalidate()
+    db.init_db()
+    yield path
+    db.close_connections()
+    read_model.invalidate()
+
+
+def _rows(sql, *params):
+    return [tuple(row) for row in db.get_connection().execute(sql, params).fetchall()]
+
+
+def test_baseline_database_migrates_to_the_latest_version(baseline_db):
+    conn = db.get_connection()
+    assert db.get_schema_version(conn) == db.SCHEMA_VERSION == len(db.MIGRATIONS)
+    assert db.migrate(conn) == db.SCHEMA_VERSION  # nothing left to apply
+
+
+def test_tags_are_normalized_and_variants_merged(baseline_db):
+    assert _rows("SELECT tag_type, tag_value, mentions FROM tags ORDER BY id") == [
+        ("Entity", "Mamá", 2),
+        ("Entity", "Ana", 3),
+        ("Event", "Reunión con amigos", 2),
+    ]
+    assert _rows("SELECT tag_value, entry_ids FROM merged_tags ORDER BY id") == [
+        ("reuniones con amigo", "[2]"),
+        ("my mom", "[3]"),
+    ]
+    # The old table survives as a view with its columns.
+    assert _rows("SELECT entry_id, tag_value FROM knowledge_graph WHERE entry_id = 3 ORDER BY tag_value") == [
+        (3, "Ana"), (3, "Mamá"),
+    ]
+
+
+def test_derived_tables_are_backfilled(baseline_db):
+    assert db.get_knowledge_summary() == "[Entity]: Mamá | Ana\n[Event]: Reunión con amigos"
+    assert _rows("SELECT tag_type, tag_count FROM tag_summary ORDER BY position") == [("Entity", 2), ("Event", 1)]
+    mom, ana, _ = [row[0] for row in _rows("SELECT id FROM tags ORDER BY id")]
+    assert _rows("SELECT weight FROM tag_edges WHERE src = ? AND dst = ?", mom, ana) == [(2,)]
+    assert _rows("SELECT COUNT(*) FROM jobs") == [(0,)]
+    assert _rows("SELECT COUNT(*) FROM usage_log") == [(0,)]
+    if db.fts_enabled():
+        # Entries written before the index existed are searchable.
+        assert sorted(e["id"] for e in db.search_entries("Ana")) == [1, 3]
+
+
+def test_new_writes_work_after_migrating(baseline_db):
+    entry_id = db.save_entry("Mamá vino a casa")
+    db.save_tags(entry_id, [{"type": "Entity", "value": "mi mamá"}])
+    assert _rows("SELECT tag_value, mentions FROM tags WHERE tag_type = 'Entity' ORDER BY id")[0] == ("Mamá", 3)
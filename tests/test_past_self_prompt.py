@@ -0,0 +1,20 @@
+import ai_engine as ai
+
+
+def _entry(entry_id: int, day: str, word: str) -> dict:
+    return {"id": entry_id, "created_at": f"{day}T10:00:00", "content": f"{word} " * 300}
+
+
+def test_entries_fill_the_budget_in_relevance_order(monkeypatch):
+    # Most relevant first: an old entry, then two newer, less relevant ones.
+    entries = [_entry(1, "2019-05-01", "hospital"), _entry(7, "2024-03-02", "trabajo"), _entry(9, "2024-03-09", "casa")]
+    cost = ai._cached_tokens(f"[2019-05-01]: {entries[0]['content']}")
+    # Room for two of the three entries once chat history gets its quarter.
+    monkeypatch.setattr(ai, "_budget_left", lambda *parts: int(2.5 * cost / 0.75))
+
+    prompt = ai._past_self_prompt("¿Y el hospital?", {}, "", entries, [])
+
+    assert "hospital" in prompt.system and "trabajo" in prompt.system
+    assert "casa" not in prompt.system
+    # The kept entries are shown oldest first.
+    assert prompt.system.index("[2019-05-01]") < prompt.system.index("[2024-03-02]")
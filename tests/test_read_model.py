@@ -0,0 +1,54 @@
+import memories_db as db
+import read_model
+
+
+def test_reads_are_served_from_memory_until_a_write(temp_db):
+    assert read_model.entry_count() == 0
+    misses = read_model.stats()["misses"]
+    assert read_model.entry_count() == 0
+    assert read_model.stats()["misses"] == misses
+
+    db.save_entry("hoy")
+    assert read_model.entry_count() == 1
+
+
+def test_every_kind_of_write_invalidates(temp_db):
+    entry = db.save_entry("hoy")
+    assert read_model.profile() == {}
+    assert read_model.knowledge_summary() == "No memories recorded yet."
+
+    db.set_profile("name", "Ana")
+    assert read_model.profile() == {"name": "Ana"}
+
+    db.save_tags(entry, [{"type": "Entity", "value": "Luis"}])
+    assert read_model.knowledge_summary() == "[Entity]: Luis"
+
+
+def test_cached_reads_expire_for_writes_from_other_processes(temp_db, monkeypatch):
+    assert read_model.entry_count() == 0
+    # A write that doesn't go through this process's memories_db functions.
+    with db.get_connection() as conn:
+        conn.execute("INSERT INTO journal_entries (content, ai_response, created_at) VALUES ('x', '', '2024')")
+    assert read_model.entry_count() == 0
+    monkeypatch.setattr(read_model, "MAX_AGE_SECONDS", 0)
+    assert read_model.entry_count() == 1
+
+
+def test_invalidate_drops_everything(temp_db):
+    assert read_model.entry_count() == 0
+    with db.get_connection() as conn:
+        conn.execute("INSERT INTO journal_entries (content, ai_response, created_at) VALUES ('x', '', '2024')")
+    read_model.invalidate()
+    assert read_model.entry_count() == 1
+
+
+def test_searches_are_bounded_and_dropped_on_write(temp_db, monkeypatch):
+    monkeypatch.setattr(read_model, "SEARCH_CACHE_SIZE", 2)
+    db.save_entry("fui al parque con Ana")
+    for query in ("parque", "Ana", "fui"):
+        assert len(read_model.search_entries(query)) == 1
+    assert list(read_model._searches) == [("Ana", 20, None), ("fui", 20, None)]
+
+    db.save_entry("otra vez al parque")
+    assert len(read_model.search_entries("parque")) == 2
+    assert list(read_model._searches) == [("parque", 20, None)]
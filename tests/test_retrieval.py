@@ -0,0 +1,31 @@
+import memories_db as db
+import retrieval
+
+
+def test_query_terms_skip_filler_and_keep_every_content_word():
+    question = "What did I think about Ana's new job at the hospital with Pedro?"
+    assert retrieval._query_terms(question) == ["ana", "new", "job", "hospital", "pedro"]
+
+
+def test_query_terms_cap_distinct_words_not_variants():
+    words = [f"palabra{i}" for i in range(20)]
+    terms = retrieval._query_terms(" ".join(words + words))
+    assert terms == words[:retrieval.MAX_QUERY_TERMS]
+
+
+def test_word_query_matches_plural_twins():
+    assert retrieval._word_query("amigos") == '("amigos" OR "amigo")'
+    assert retrieval._word_query("amigo") == '("amigo" OR "amigos")'
+
+
+def test_small_diary_keeps_words_seen_in_a_few_entries(temp_db):
+    if not db.fts_enabled():
+        return
+    for i in range(20):
+        db.save_entry(f"Día {i}: fui al hospital con Pedro" if i < 3 else f"Día {i}: trabajo tranquilo")
+    # "hospital" is in 3 of 20 entries: still searched alongside the rarer "pedrito".
+    db.save_entry("Pedrito vino a casa")
+    found = retrieval.find_relevant_entries("¿Qué pasó con Pedrito en el hospital?", k=8)
+    contents = [e["content"] for e in found]
+    assert "Pedrito vino a casa" in contents
+    assert any("hospital" in c for c in contents)
@@ -0,0 +1,28 @@
+import threading
+
+import ai_engine as ai
+
+
+def _background_call(scheduler: ai.Scheduler, tokens: int, timeout: float) -> bool:
+    """Whether a background request of `tokens` is admitted within `timeout` seconds."""
+    done = threading.Event()
+
+    def run():
+        with ai.background():
+            scheduler.call("extraction_batch", tokens, lambda: None)
+        done.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    return done.wait(timeout)
+
+
+def test_background_request_above_reserve_is_admitted():
+    scheduler = ai.Scheduler(4, tpm=600_000)  # 10k tokens/s refill
+    # Bigger than what background requests may use while leaving the reserve.
+    assert _background_call(scheduler, 550_000, timeout=2)
+
+
+def test_background_request_above_reserve_waits_for_a_full_bucket():
+    scheduler = ai.Scheduler(4, tpm=600_000)
+    scheduler.call("journaling", 5_000, lambda: None)
+    assert _background_call(scheduler, 550_000, timeout=5)
@@ -0,0 +1,78 @@
+from datetime import date
+
+import pytest
+
+import memories_db as db
+
+START, END = db.HIGHLIGHT_START, db.HIGHLIGHT_END
+
+
+def _save(content, created_at=None):
+    entry_id = db.save_entry(content)
+    if created_at:
+        with db.get_connection() as conn:
+            conn.execute("UPDATE journal_entries SET created_at = ? WHERE id = ?", (created_at, entry_id))
+    return entry_id
+
+
+@pytest.fixture
+def fts_db(temp_db):
+    if not db.fts_enabled():
+        pytest.skip("this SQLite build has no FTS5")
+    return temp_db
+
+
+def test_every_word_must_match_and_best_rank_comes_first(fts_db):
+    both = _save("Fui a la playa con Ana. La playa estaba llena, la playa es lo mejor.")
+    once = _save("Ana llamó; hablamos de la playa un rato.")
+    _save("Ana vino a cenar.")
+    assert [e["id"] for e in db.search_entries("playa Ana")] == [both, once]
+
+
+def test_matches_fold_case_and_accents(fts_db):
+    entry = _save("Reunión con MAMÁ en el café")
+    for query in ("reunion", "mama cafe", "CAFÉ"):
+        assert [e["id"] for e in db.search_entries(query)] == [entry]
+
+
+def test_snippets_wrap_every_match_in_markers(fts_db):
+    _save("Hoy vi a Luis en el parque y después Luis me llamó")
+    snippet = db.search_entries("luis")[0]["snippet"]
+    assert snippet.count(f"{START}Luis{END}") == 2
+    assert "<" not in snippet
+
+
+def test_user_text_is_never_read_as_fts_syntax(fts_db):
+    _save('Dijo "hola" y se fue')
+    assert len(db.search_entries('"hola')) == 1
+    for query in ("AND", "NEAR(", "*", "a OR"):
+        db.search_entries(query)  # no OperationalError
+
+
+def test_date_range_is_inclusive(fts_db):
+    _save("gym", "2024-03-01T08:00:00")
+    march = _save("gym", "2024-03-31T22:00:00")
+    _save("gym", "2024-04-01T08:00:00")
+    found = db.search_entries("gym", date_range=(date(2024, 3, 2), date(2024, 3, 31)))
+    assert [e["id"] for e in found] == [march]
+    assert db.search_entries("gym", date_range=(date(2025, 1, 1), None)) == []
+
+
+def test_index_follows_edits_and_deletes(fts_db):
+    entry = _save("texto original")
+    with db.get_connection() as conn:
+        conn.execute("UPDATE journal_entries SET content = 'texto corregido' WHERE id = ?", (entry,))
+    assert db.search_entries("original") == []
+    assert [e["id"] for e in db.search_entries("corregido")] == [entry]
+    with db.get_connection() as conn:
+        conn.execute("DELETE FROM journal_entries WHERE id = ?", (entry,))
+    assert db.search_entries("corregido") == []
+
+
+def test_scan_fallback_without_fts(temp_db, monkeypatch):
+    monkeypatch.setattr(db, "fts_enabled", lambda: False)
+    older = _save("paseo con Ana", "2024-01-01T10:00:00")
+    newer = _save("otro paseo con Ana y Luis", "2024-01-02T10:00:00")
+    found = db.search_entries("paseo ana")
+    assert [e["id"] for e in found] == [newer, older]
+    assert found[0]["snippet"] == "otro paseo con Ana y Luis"
@@ -0,0 +1,74 @@
+import memories_db as db
+
+BACKFILL = """
+    SELECT a.tag_id, b.tag_id, COUNT(*)
+    FROM entry_tags a
+    JOIN entry_tags b ON b.entry_id = a.entry_id AND b.tag_id != a.tag_id
+    GROUP BY a.tag_id, b.tag_id
+    ORDER BY 1, 2
+"""
+
+
+def _edges():
+    rows = db.get_connection().execute("SELECT src, dst, weight FROM tag_edges ORDER BY src, dst").fetchall()
+    return [tuple(row) for row in rows]
+
+
+def _ids(*values):
+    conn = db.get_connection()
+    return [conn.execute("SELECT id FROM tags WHERE tag_value = ?", (v,)).fetchone()["id"] for v in values]
+
+
+def _tag(value, tag_type="Entity"):
+    return {"type": tag_type, "value": value}
+
+
+def test_edges_are_symmetric_and_weighted_by_shared_entries(temp_db):
+    first, second = db.save_entry("uno"), db.save_entry("dos")
+    db.save_tags(first, [_tag("Ana"), _tag("Luis")])
+    db.save_tags(second, [_tag("Ana"), _tag("Luis"), _tag("Pedro")])
+    ana, luis, pedro = _ids("Ana", "Luis", "Pedro")
+
+    assert _edges() == sorted([
+        (ana, luis, 2), (luis, ana, 2),
+        (ana, pedro, 1), (pedro, ana, 1),
+        (luis, pedro, 1), (pedro, luis, 1),
+    ])
+
+
+def test_saving_tags_again_does_not_reweight(temp_db):
+    entry = db.save_entry("uno")
+    db.save_tags(entry, [_tag("Ana"), _tag("Luis")])
+    db.save_tags(entry, [_tag("Ana"), _tag("luis")])
+    assert [weight for _, _, weight in _edges()] == [1, 1]
+
+
+def test_tags_added_later_link_to_the_entry_existing_tags(temp_db):
+    entry = db.save_entry("uno")
+    db.save_tags(entry, [_tag("Ana")])
+    db.save_tags(entry, [_tag("Luis"), _tag("Mudanza", "Event")])
+    ana, luis, move = _ids("Ana", "Luis", "Mudanza")
+    assert _edges() == sorted([
+        (ana, luis, 1), (luis, ana, 1), (ana, move, 1), (move, ana, 1), (luis, move, 1), (move, luis, 1),
+    ])
+
+
+def test_incremental_edges_match_a_backfill(temp_db):
+    people = ["Ana", "Luis", "Pedro", "Marta"]
+    for i in range(12):
+        entry = db.save_entry(f"entrada {i}")
+        db.save_tags(entry, [_tag(people[i % 4]), _tag(people[(i * 3) % 4]), _tag(f"Evento {i % 2}", "Event")])
+    rows = db.get_connection().execute(BACKFILL).fetchall()
+    assert _edges() == [tuple(row) for row in rows]
+
+
+def test_traversal_queries(temp_db):
+    for tags in ([_tag("Ana"), _tag("Luis")], [_tag("Ana"), _tag("Luis")], [_tag("Ana"), _tag("Pedro")],
+                 [_tag("Pedro"), _tag("Marta")]):
+        db.save_tags(db.save_entry("x"), tags)
+    ana, luis, pedro, marta = _ids("Ana", "Luis", "Pedro", "Marta")
+
+    assert [(n["id"], n["weight"]) for n in db.get_neighbors(ana)] == [(luis, 2), (pedro, 1)]
+    assert [t["id"] for t in db.get_related_tags([ana, luis])] == [pedro]
+    expanded = db.expand_tags([luis], hops=3)
+    assert [(t["id"], t["hop"]) for t in expanded] == [(ana, 1), (pedro, 2), (marta, 3)]
@@ -0,0 +1,70 @@
+import pytest
+
+from tag_parser import TAG_TYPES, parse_batch, parse_tags
+
+# Malformed outputs seen from (or plausible for) the model, with the tags each
+# must yield; None means the response has to be rejected with ValueError.
+TAGS_CORPUS = [
+    ('[{"type": "Entity", "value": "Mamá"}]', [("Entity", "Mamá")]),
+    ('```json\n[{"type": "Event", "value": "trip to Lisbon"}]\n```', [("Event", "trip to Lisbon")]),
+    ('```\n[{"type": "Event", "value": "x"}]```', [("Event", "x")]),
+    ('Here are the tags:\n[{"type": "Entity", "value": "Ana"}]\nHope this helps!', [("Entity", "Ana")]),
+    ('[{"type": "Entity", "value": "Ana"}, {"type": "Event", "value": "cumple', [("Entity", "Ana")]),
+    ('[{"type": "entity", "value": "  \\"Luis\\"  "}, {"type": "Person", "value": "Luis"}]', [("Entity", "Luis")]),
+    ('[{"type": "Sentiment", "value": "anxious about exams."}]', [("Sentiment/Trigger", "anxious about exams")]),
+    ('[{"type": "Mood", "value": "happy"}, {"type": "Core Belief", "value": ""}]', []),
+    ('[{"type": "Syntax", "value": "a {brace} and \\"quote\\" inside"}]', [("Syntax", 'a {brace} and "quote" inside')]),
+    ('{"tags": [{"type": "Event", "value": "moved"}]}', [("Event", "moved")]),
+    ('[]', []),
+    ('[{"type": "Event", "value": 2024}]', [("Event", "2024")]),
+    ('I could not find anything to extract.', None),
+    ('[{"type": "Ent', None),
+    ('', None),
+]
+
+BATCH_CORPUS = [
+    ('[{"id": "1", "tags": [{"type": "Entity", "value": "Ana"}]}, {"id": "2", "tags": []}]',
+     {"1": [("Entity", "Ana")], "2": []}),
+    ('{"1": [{"type": "Event", "value": "x"}], "2": []}', {"1": [("Event", "x")], "2": []}),
+    ('```json\n[{"id": "1", "tags": [{"type": "Entity", "value": "Ana"}]}, {"id": "2", "tags": [{"type": "Ev',
+     {"1": [("Entity", "Ana")]}),
+    ('Sure!\n[{"id": 7, "tags": [{"type": "belief", "value": "family first"}]}] done', {"7": [("Core Belief", "family first")]}),
+    ('[]', {}),
+    ('nothing here', None),
+]
+
+
+def _as_pairs(tags):
+    return [(t["type"], t["value"]) for t in tags]
+
+
+@pytest.mark.parametrize("text,expected", TAGS_CORPUS)
+def test_parse_tags(text, expected):
+    if expected is None:
+        with pytest.raises(ValueError):
+            parse_tags(text)
+    else:
+        assert _as_pairs(parse_tags(text)) == expected
+
+
+@pytest.mark.parametrize("text,expected", BATCH_CORPUS)
+def test_parse_batch(text, expected):
+    if expected is None:
+        with pytest.raises(ValueError):
+            parse_batch(text)
+    else:
+        assert {k: _as_pairs(v) for k, v in parse_batch(text).items()} == expected
+
+
+@pytest.mark.parametrize("parse", [parse_tags, parse_batch])
+@pytest.mark.parametrize("text", [text for text, _ in TAGS_CORPUS + BATCH_CORPUS])
+def test_truncated_responses_raise_or_yield_valid_tags(parse, text):
+    # A response cut off anywhere must either raise ValueError or return valid tags.
+    for cut in range(len(text) + 1):
+        try:
+            result = parse(text[:cut])
+        except ValueError:
+            continue
+        groups = result.values() if isinstance(result, dict) else [result]
+        for tags in groups:
+            assert all(t["type"] in TAG_TYPES and t["value"] for t in tags), (text[:cut], result)
@@ -0,0 +1,60 @@
+import memories_db as db
+
+
+def _summary_version():
+    return db.get_connection().execute("SELECT value FROM meta WHERE key = 'summary_version'").fetchone()["value"]
+
+
+def _summary_rows():
+    rows = db.get_connection().execute(
+        "SELECT tag_type, position, tag_values, tag_count FROM tag_summary ORDER BY position"
+    ).fetchall()
+    return [tuple(row) for row in rows]
+
+
+def test_empty_diary_summary(temp_db):
+    assert db.get_knowledge_summary() == "No memories recorded yet."
+
+
+def test_summary_grows_in_first_seen_order(temp_db):
+    first, second = db.save_entry("uno"), db.save_entry("dos")
+    db.save_tags(first, [{"type": "Entity", "value": "Ana"}, {"type": "Event", "value": "Mudanza"}])
+    db.save_tags(second, [{"type": "Entity", "value": "Luis"}, {"type": "Core Belief", "value": "La familia primero"}])
+
+    assert db.get_knowledge_summary() == (
+        "[Entity]: Ana | Luis\n[Event]: Mudanza\n[Core Belief]: La familia primero"
+    )
+    assert [(tag_type, count) for tag_type, _, _, count in _summary_rows()] == [
+        ("Entity", 2), ("Event", 1), ("Core Belief", 1),
+    ]
+
+
+def test_only_new_tags_change_the_summary(temp_db):
+    first, second = db.save_entry("uno"), db.save_entry("dos")
+    db.save_tags(first, [{"type": "Entity", "value": "Ana"}])
+    version = _summary_version()
+    summary = db.get_knowledge_summary()
+
+    # Another mention of a known tag (or one of its spellings) leaves it alone.
+    db.save_tags(second, [{"type": "Entity", "value": "ana"}])
+    assert _summary_version() == version
+    assert db.get_knowledge_summary() is summary
+
+    db.save_tags(second, [{"type": "Entity", "value": "Pedro"}])
+    assert _summary_version() == version + 1
+    assert db.get_knowledge_summary() == "[Entity]: Ana | Pedro"
+
+
+def test_incremental_summary_matches_a_rebuild(temp_db):
+    for i in range(5):
+        entry = db.save_entry(f"entrada {i}")
+        db.save_tags(entry, [
+            {"type": "Event", "value": f"Evento {i % 3}"},
+            {"type": "Entity", "value": f"Persona {i % 2}"},
+            {"type": "Sentiment/Trigger", "value": "estrés" if i % 2 else "calma"},
+        ])
+    incremental = _summary_rows()
+    conn = db.get_connection()
+    with conn:
+        db._rebuild_tag_summary(conn)
+    assert _summary_rows() == incremental
@@ -0,0 +1,80 @@
+import memories_db as db
+import tag_canonicalizer
+
+
+def _tags(tag_type):
+    rows = db.get_connection().execute(
+        "SELECT id, tag_value, mentions FROM tags WHERE tag_type = ? ORDER BY id", (tag_type,)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def _tag_values(tag_type):
+    return sorted(t["tag_value"] for t in _tags(tag_type))
+
+
+def _merged():
+    rows = db.get_connection().execute(
+        "SELECT tag_type, tag_value, merged_into, entry_ids FROM merged_tags ORDER BY id"
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def test_fold_key_is_shared_by_plural_twins():
+    for a, b in [("reunión con amigos", "reuniones con amigo"), ("clase", "clases"), ("ansiedad", "ansiedades")]:
+        a, b = tag_canonicalizer.canonical_key("Event", a), tag_canonicalizer.canonical_key("Event", b)
+        assert tag_canonicalizer.same_key(a, b)
+        assert tag_canonicalizer.fold_key(a) == tag_canonicalizer.fold_key(b)
+
+
+def test_plural_twins_merge_and_names_do_not(temp_db):
+    first = db.save_entry("uno")
+    second = db.save_entry("dos")
+    db.save_tags(first, [{"type": "Event", "value": "Reunión con amigos"}, {"type": "Entity", "value": "Daniel"}])
+    db.save_tags(second, [{"type": "Event", "value": "reuniones con amigo"}, {"type": "Entity", "value": "Daniela"}])
+
+    assert _tag_values("Event") == ["Reunión con amigos"]
+    assert _tag_values("Entity") == ["Daniel", "Daniela"]
+    assert _tags("Event")[0]["mentions"] == 2
+
+
+def test_later_merges_keep_their_original_spelling(temp_db):
+    first = db.save_entry("uno")
+    second = db.save_entry("dos")
+    db.save_tags(first, [{"type": "Event", "value": "Cena familiar"}])
+    db.save_tags(second, [{"type": "Event", "value": "Cenas familiares"}])
+    db.save_tags(second, [{"type": "Event", "value": "Cenas familiares"}])
+
+    tag_id = _tags("Event")[0]["id"]
+    assert _merged() == [
+        {"tag_type": "Event", "tag_value": "Cenas familiares", "merged_into": tag_id, "entry_ids": f"[{second}]"}
+    ]
+
+
+def test_plural_twin_found_among_many_similar_keys(temp_db):
+    # Hundreds of tags sharing the same leading words must not push the twin out of reach.
+    entry = db.save_entry("uno")
+    db.save_tags(entry, [{"type": "Event", "value": f"reunión de trabajo {i:03d}"} for i in range(300)])
+    db.save_tags(entry, [{"type": "Event", "value": "reunión de trabajo con clientes"}])
+
+    later = db.save_entry("dos")
+    db.save_tags(later, [{"type": "Event", "value": "reuniones de trabajo con cliente"}])
+
+    values = _tag_values("Event")
+    assert len(values) == 301
+    assert "reuniones de trabajo con cliente" not in values
+    assert _merged()[0]["tag_value"] == "reuniones de trabajo con cliente"
+
+
+def test_entries_for_tags_reads_a_bounded_number_of_tags(temp_db, monkeypatch):
+    monkeypatch.setattr(db, "MAX_ENTRY_TAG_LOOKUPS", 2)
+    ids = []
+    for name in ("Ana", "Luis", "Pedro"):
+        entry = db.save_entry(f"con {name}")
+        db.save_tags(entry, [{"type": "Entity", "value": name}])
+        ids.append(entry)
+    tag_ids = [t["id"] for t in _tags("Entity")]
+
+    found = db.get_entries_for_tags(tag_ids + tag_ids, limit=5)
+    assert [e["id"] for e in found] == [ids[1], ids[0]]
+    assert db.get_entries_for_tags(tag_ids, limit=5, exclude_ids=[ids[1]])[0]["id"] == ids[0]
@@ -0,0 +1,10 @@
+import ai_engine as ai
+import tracing
+
+
+def test_only_model_facing_ai_engine_calls_are_traced():
+    names = tracing._public_functions(ai)
+    assert "extract_knowledge_tags" in names
+    assert "stream_journaling_response" in names
+    for name in ("background", "retry_delay", "prompt_budget", "split_into_batches", "set_backend"):
+        assert name not in names
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+import pytest
+
+import ai_engine as ai
+import memories_db as db
+
+
+class BlockedReply:
+    """A response whose tokens were billed but whose .text raises, like a safety block."""
+
+    usage_metadata = SimpleNamespace(prompt_token_count=120, candidates_token_count=0)
+
+    @property
+    def text(self):
+        raise ValueError("the reply was blocked")
+
+
+class BlockingBackend:
+    name = "stub"
+    supports_context_cache = False
+
+    def generate(self, mode, api_key, prompt, generation_config=None):
+        return BlockedReply()
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ai, "backend", BlockingBackend())
+    monkeypatch.setattr(db, "record_usage", lambda *args: calls.append(args))
+    return calls
+
+
+def test_blocked_extraction_is_still_recorded(recorded):
+    with pytest.raises(ValueError):
+        ai._extract("key", "hoy fui al parque", key="blocked-single")
+    assert [(mode, tokens, ok) for mode, tokens, _, _, _, ok in recorded] == [("extraction", 120, False)]
+
+
+def test_blocked_batch_extraction_is_still_recorded(recorded):
+    with pytest.raises(ValueError):
+        ai._request_batch("key", [(1, "uno"), (2, "dos")])
+    assert [(mode, tokens, ok) for mode, tokens, _, _, _, ok in recorded] == [("extraction_batch", 120, False)]
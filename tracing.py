@@ -0,0 +1,501 @@
+"""
+tracing.py
+----------
+Hot-path instrumentation for AI of Memories.
+With AI_TRACE=1, every public memories_db, retrieval and ai_engine function,
+the response and context caches, scheduler waits and every model call are
+timed as spans
+nested under the request that triggered them (a Streamlit rerun's sidebar or
+page, or an extraction batch). Spans carry prompt sizes (characters and
+estimated tokens), cache hits and model latency (including time to the first
+streamed chunk).
+
+Finished spans can be written to
+  - AI_TRACE_FILE       JSON Lines, one span per line
+  - AI_TRACE_OTLP_FILE  OTLP/JSON lines (one ExportTraceServiceRequest each),
+                        the OpenTelemetry file-exporter format, which a
+                        collector's otlpjsonfile receiver can ingest
+and the last AI_TRACE_KEEP requests are kept in memory for the debug panel in
+the app's sidebar.
+
+Functions are wrapped only when tracing is enabled: with AI_TRACE unset the
+instrumented modules run their original, unwrapped code, and request() hands
+back a shared no-op context manager.
+"""
+
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar, copy_context
+
+from dotenv import load_dotenv
+
+import context_builder
+
+load_dotenv()
+
+TRACE_ENABLED = os.getenv("AI_TRACE", "0") == "1"
+TRACE_FILE = os.getenv("AI_TRACE_FILE", "")
+TRACE_OTLP_FILE = os.getenv("AI_TRACE_OTLP_FILE", "")
+TRACE_KEEP = int(os.getenv("AI_TRACE_KEEP", "20"))
+SERVICE_NAME = "ai-of-memories"
+
+enabled = False
+
+
+# ── Spans ─────────────────────────────────────────────────────────────────────
+
+class Span:
+    """One timed operation. Times are nanoseconds; `children` are nested spans."""
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "start_ns", "_t0",
+        "duration_ns", "attributes", "children", "error",
+    )
+
+    def __init__(self, name: str, parent: "Span | None", attributes: dict | None = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else ""
+        self.start_ns = time.time_ns()
+        self._t0 = time.perf_counter_ns()
+        self.duration_ns: int | None = None
+        self.attributes = dict(attributes or {})
+        self.children: list[Span] = []
+        self.error = ""
+
+    @property
+    def duration_ms(self) -> float | None:
+        return None if self.duration_ns is None else self.duration_ns / 1e6
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_current: ContextVar[Span | None] = ContextVar("tracing_current_span", default=None)
+_lock = threading.Lock()
+_recent: deque[Span] = deque(maxlen=TRACE_KEEP)
+
+
+def _start(name: str, parent: Span | None, attributes: dict | None = None) -> Span:
+    span = Span(name, parent, attributes)
+    if parent is not None:
+        with _lock:
+            parent.children.append(span)
+    return span
+
+
+def _end(span: Span, error: BaseException | None = None):
+    span.duration_ns = time.perf_counter_ns() - span._t0
+    # Streamlit's st.rerun()/st.stop() unwind with BaseExceptions; only real errors count.
+    if isinstance(error, Exception):
+        span.error = f"{type(error).__name__}: {error}"
+    _export(span)
+
+
+class _SpanContext:
+    def __init__(self, name: str, attributes: dict, root: bool):
+        self.name = name
+        self.attributes = attributes
+        self.root = root
+
+    def __enter__(self) -> Span:
+        self.span = _start(self.name, _current.get(), self.attributes)
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        _end(self.span, exc)
+        if self.root and not self.span.parent_id:
+            with _lock:
+                _recent.append(self.span)
+        return False
+
+
+_NOOP = nullcontext()
+
+
+def request(name: str, **attributes):
+    """
+    Context manager for a unit of work worth a breakdown (a page render, an
+    extraction batch). Instrumented calls inside it become its child spans.
+    """
+    if not enabled:
+        return _NOOP
+    return _SpanContext(name, attributes, root=True)
+
+
+def span(name: str, **attributes):
+    """Context manager for a nested span; a no-op outside a request."""
+    if not enabled or _current.get() is None:
+        return _NOOP
+    return _SpanContext(name, attributes, root=False)
+
+
+def _traced_iter(span: Span, iterator):
+    """Yield from `iterator` with `span` current, ending it when the iterator is done."""
+    error, count = None, 0
+    try:
+        while True:
+            token = _current.set(span)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current.reset(token)
+            if not count:
+                span.attributes["first_item_ms"] = (time.perf_counter_ns() - span._t0) / 1e6
+            count += 1
+            yield item
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()  # a consumer that stopped early closes the inner generator too
+        span.attributes["items"] = count
+        _end(span, error)
+
+
+def _size(result) -> dict:
+    if isinstance(result, (list, dict, set)) or type(result) is tuple:
+        return {"rows": len(result)}
+    return {}
+
+
+def traced(fn, name: str | None = None, attributes=None):
+    """
+    Wrap `fn` so each call inside a request is recorded as a span. Calls made
+    outside a request pass straight through. `attributes(args, kwargs, result)`
+    may add attributes once the call returns (the default records list sizes).
+    Calls that return a generator are timed until it is exhausted or closed.
+    """
+    name = name or f"{fn.__module__}.{fn.__qualname__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        parent = _current.get()
+        if parent is None:
+            return fn(*args, **kwargs)
+        span = _start(name, parent)
+        token = _current.set(span)
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            _current.reset(token)
+            _end(span, e)
+            raise
+        _current.reset(token)
+        if inspect.isgenerator(result):
+            return _traced_iter(span, result)
+        span.attributes.update(attributes(args, kwargs, result) if attributes else _size(result))
+        _end(span)
+        return result
+
+    wrapper.__wrapped_by_tracing__ = True
+    return wrapper
+
+
+# ── Model calls ───────────────────────────────────────────────────────────────
+
+def _text_size(text: str) -> dict:
+    return {"chars": len(text), "tokens": context_builder.estimate_tokens(text)}
+
+
+class TracedBackend:
+    """Wraps an ai_engine model backend and records each call as a span."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.name = inner.name
+        self.supports_context_cache = inner.supports_context_cache
+
+    def _call(self, name: str, attributes: dict, call, stream: bool):
+        parent = _current.get()
+        if parent is None:
+            return call()
+        span = _start(name, parent, attributes)
+        try:
+            response = call()
+        except BaseException as e:
+            _end(span, e)
+            raise
+        if stream:
+            return _traced_iter(span, iter(response))
+        try:
+            span.attributes["response_chars"] = len(response.text)
+        except (AttributeError, ValueError):
+            pass
+        _end(span)
+        return response
+
+    def chat(self, mode, api_key, history, text, stream=False, cached_content=None):
+        if _current.get() is None:
+            return self.inner.chat(mode, api_key, history, text, stream, cached_content)
+        history_text = "\n".join(m["parts"][0]["text"] for m in history if m.get("parts"))
+        prompt, past = _text_size(text), _text_size(history_text)
+        attributes = {
+            "backend": self.name,
+            "mode": mode,
+            "stream": stream,
+            "context_cache": bool(cached_content),
+            "prompt_chars": prompt["chars"],
+            "prompt_tokens": prompt["tokens"],
+            "history_messages": len(history),
+            "history_chars": past["chars"],
+            "history_tokens": past["tokens"],
+        }
+        return self._call(
+            "model.chat", attributes,
+            lambda: self.inner.chat(mode, api_key, history, text, stream, cached_content), stream,
+        )
+
+    def generate(self, mode, api_key, prompt, generation_config=None):
+        if _current.get() is None:
+            return self.inner.generate(mode, api_key, prompt, generation_config)
+        size = _text_size(prompt if isinstance(prompt, str) else str(prompt))
+        attributes = {"backend": self.name, "mode": mode, "prompt_chars": size["chars"], "prompt_tokens": size["tokens"]}
+        return self._call(
+            "model.generate", attributes,
+            lambda: self.inner.generate(mode, api_key, prompt, generation_config), False,
+        )
+
+
+# ── Enabling ──────────────────────────────────────────────────────────────────
+
+_MISSING = object()
+_patches: list[tuple[object, str, object]] = []
+
+# Called on every read or so often they'd only add noise.
+_SKIP = {
+    "memories_db": {"get_connection", "close_connections", "data_version"},
+    "retrieval": {"hashed_vector", "cosine"},
+    "ai_engine": {
+        "set_backend", "submit", "prompt_fingerprint", "clip_text", "recent_history",
+        "retry_delay", "prompt_budget", "split_into_batches",
+    },
+}
+# Private ai_engine steps worth seeing in a breakdown.
+_AI_PRIVATE = ("_send", "_chat", "_chat_stream", "_journaling_prompt", "_past_self_prompt", "_request_batch")
+
+
+def _patch(owner, attr: str, value):
+    _patches.append((owner, attr, vars(owner).get(attr, _MISSING)))
+    setattr(owner, attr, value)
+
+
+def _is_context_manager(fn) -> bool:
+    # @contextmanager factories only build the manager; a span would time nothing.
+    return inspect.isgeneratorfunction(getattr(fn, "__wrapped__", None))
+
+
+def _public_functions(module) -> list[str]:
+    skip = _SKIP.get(module.__name__, set())
+    return [
+        name for name, fn in vars(module).items()
+        if inspect.isfunction(fn)
+        and fn.__module__ == module.__name__
+        and not name.startswith(("_", "astream_"))
+        and name not in skip
+        and not _is_context_manager(fn)
+    ]
+
+
+def _cache_lookup(args, kwargs, result) -> dict:
+    return {"mode": args[1], "hit": result is not None}
+
+
+def _context_cache(args, kwargs, result) -> dict:
+    return {"mode": args[2], "cached": result is not None}
+
+
+def _traced_submit(submit):
+    @functools.wraps(submit)
+    def wrapper(fn, /, *args, **kwargs):
+        # Pool threads don't inherit context variables; carry the current span over.
+        return submit(copy_context().run, fn, *args, **kwargs)
+    return wrapper
+
+
+def _traced_set_backend(set_backend):
+    @functools.wraps(set_backend)
+    def wrapper(new_backend):
+        # A backend swapped in while tracing is on (e.g. by benchmarks/load.py) is traced too.
+        if not isinstance(new_backend, TracedBackend):
+            new_backend = TracedBackend(new_backend)
+        return set_backend(new_backend)
+    return wrapper
+
+
+def enable():
+    """Instrument the app's modules (idempotent)."""
+    global enabled
+    import ai_engine
+    import memories_db
+    import retrieval
+
+    with _lock:
+        if enabled:
+            return
+        for module in (memories_db, retrieval, ai_engine):
+            for name in _public_functions(module):
+                _patch(module, name, traced(getattr(module, name)))
+        for name in _AI_PRIVATE:
+            _patch(ai_engine, name, traced(getattr(ai_engine, name)))
+        _patch(ai_engine.HistoryManager, "compact", traced(ai_engine.HistoryManager.compact))
+        _patch(ai_engine.Scheduler, "_acquire", traced(ai_engine.Scheduler._acquire, name="ai_engine.scheduler.wait"))
+        _patch(ai_engine.ResponseCache, "get", traced(ai_engine.ResponseCache.get, attributes=_cache_lookup))
+        _patch(ai_engine.ContextCache, "lookup", traced(ai_engine.ContextCache.lookup, attributes=_context_cache))
+        _patch(ai_engine.ContextCache, "handle", traced(ai_engine.ContextCache.handle, attributes=_context_cache))
+        _patch(ai_engine, "submit", _traced_submit(ai_engine.submit))
+        _patch(ai_engine, "set_backend", _traced_set_backend(ai_engine.set_backend))
+        ai_engine.set_backend(ai_engine.backend)
+        enabled = True
+
+
+def disable():
+    """Put the original functions back."""
+    global enabled
+    import ai_engine
+
+    with _lock:
+        while _patches:
+            owner, attr, original = _patches.pop()
+            if original is _MISSING:
+                delattr(owner, attr)
+            else:
+                setattr(owner, attr, original)
+        # Whichever backend is active now, not the one there was at enable().
+        if isinstance(ai_engine.backend, TracedBackend):
+            ai_engine.set_backend(ai_engine.backend.inner)
+        enabled = False
+
+
+# ── Export ────────────────────────────────────────────────────────────────────
+
+_export_lock = threading.Lock()
+_files: dict[str, object] = {}
+
+
+def _append(path: str, line: str):
+    with _export_lock:
+        handle = _files.get(path)
+        if handle is None:
+            handle = _files[path] = open(path, "a", encoding="utf-8", buffering=1)
+        handle.write(line + "\n")
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_span(span: Span) -> dict:
+    """A finished span in OTLP/JSON encoding."""
+    data = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.start_ns + (span.duration_ns or 0)),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        data["parentSpanId"] = span.parent_id
+    return data
+
+
+def otlp_request(spans: list[Span]) -> dict:
+    """An OTLP ExportTraceServiceRequest holding `spans`."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [otlp_span(s) for s in spans]}],
+        }]
+    }
+
+
+def _export(span: Span):
+    if TRACE_FILE:
+        _append(TRACE_FILE, json.dumps(span.to_dict(), ensure_ascii=False, default=str))
+    if TRACE_OTLP_FILE:
+        _append(TRACE_OTLP_FILE, json.dumps(otlp_request([span]), ensure_ascii=False, default=str))
+
+
+# ── Debug view ────────────────────────────────────────────────────────────────
+
+def recent_requests(n: int = TRACE_KEEP) -> list[Span]:
+    """The last `n` finished requests, newest first."""
+    with _lock:
+        return list(_recent)[::-1][:n]
+
+
+def _merged(children: list[Span]) -> list[tuple[str, list[Span]]]:
+    groups: dict[str, list[Span]] = {}
+    for child in children:
+        groups.setdefault(child.name, []).append(child)
+    return list(groups.items())
+
+
+def format_breakdown(root: Span, max_lines: int = 60) -> str:
+    """
+    A request's spans as an indented tree. Sibling calls with the same name
+    are merged into one line (count and total time); attributes are shown for
+    single calls.
+    """
+    lines = []
+
+    def walk(spans: list[Span], depth: int):
+        for name, group in _merged(spans):
+            if len(lines) >= max_lines:
+                return
+            total = sum(s.duration_ns or 0 for s in group) / 1e6
+            pending = any(s.duration_ns is None for s in group)
+            label = name if len(group) == 1 else f"{name} ×{len(group)}"
+            timing = f"{total:9.2f} ms" + ("+" if pending else "")
+            details = ""
+            if len(group) == 1 and (group[0].attributes or group[0].error):
+                attributes = dict(group[0].attributes)
+                if group[0].error:
+                    attributes["error"] = group[0].error
+                details = "  " + " ".join(
+                    f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}" for k, v in attributes.items()
+                )
+            lines.append(f"{timing}  {'  ' * depth}{label}{details}")
+            walk([c for s in group for c in s.children], depth + 1)
+
+    with _lock:
+        walk(root.children, 0)
+    return "\n".join(lines) or "(no instrumented calls)"
+
+
+if TRACE_ENABLED:
+    enable()